@@ -0,0 +1,257 @@
+"""Benchmark the conversion stages on a fixed corpus served by a local HTTP stand-in.
+
+Usage:
+    python benchmarks/bench.py                      # run and compare with baseline.json
+    python benchmarks/bench.py --update-baseline    # run and record a new baseline
+    python benchmarks/bench.py --record <URL> <name>  # add a real page to the corpus
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from statistics import median
+from time import perf_counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from fixtures import RECORDED_FOLDER, build_corpus, image_bytes  # noqa: E402
+from src.download_with_media import download_medium_article, fetch_static_html  # noqa: E402
+from src.html_to_md import convert_html_to_markdown  # noqa: E402
+from src.clean_md import process_markdown_files  # noqa: E402
+from src.url_to_local import url_to_local  # noqa: E402
+from src.media_fetcher import MediaFetcher, configure_shared_fetcher  # noqa: E402
+from src.page_cache import configure_page_cache  # noqa: E402
+from src.pipeline import run_pipeline  # noqa: E402
+
+BASELINE_FILE = os.path.join(HERE, "baseline.json")
+# A stage regresses when its median time grows by more than this fraction of the baseline
+DEFAULT_THRESHOLD = 0.25
+# Timings below this many seconds are too noisy to compare
+MIN_COMPARABLE_SECONDS = 0.005
+
+
+class StandInServer:
+    """Local HTTP server answering for Medium: article pages and their images.
+
+    Args:
+        corpus (function): Called with the image url prefix, returns page HTML by name.
+    """
+
+    def __init__(self, corpus):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/articles/"):
+                    page = server.pages.get(self.path[len("/articles/"):])
+                    body, content_type = (page.encode("utf-8"), "text/html; charset=utf-8") if page else (None, None)
+                else:
+                    body, content_type = image_bytes(self.path), "image/png"
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+        self.pages = corpus(self.base_url)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, name):
+        return f"{self.base_url}articles/{name}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def time_call(func, *args, **kwargs):
+    """Call a function and return how long it took, in seconds."""
+    start = perf_counter()
+    func(*args, **kwargs)
+    return perf_counter() - start
+
+
+def bench_folder_stages(server, name, work_root):
+    """Run the folder-based stages on one fixture and time each.
+
+    Returns:
+        dict: seconds by stage name.
+    """
+    folder = os.path.join(work_root, name)
+    with MediaFetcher() as fetcher:
+        timings = {"download_medium_article": time_call(download_medium_article, server.url(name), folder,
+                                                         fetch_mode="static", fetcher=fetcher)}
+    timings["convert_html_to_markdown"] = time_call(convert_html_to_markdown, folder)
+    timings["process_markdown_files"] = time_call(process_markdown_files, folder)
+    timings["url_to_local"] = time_call(url_to_local, folder)
+    return timings
+
+
+def bench_end_to_end(server, names, work_root):
+    """Convert every fixture with the in-memory pipeline.
+
+    Returns:
+        float: seconds for the whole corpus.
+    """
+    with MediaFetcher() as fetcher:
+        start = perf_counter()
+        for name in names:
+            run_pipeline(server.url(name), os.path.join(work_root, "pipeline", name), "static", fetcher=fetcher)
+        return perf_counter() - start
+
+
+def run_benchmarks(repeat=5):
+    """Time every stage on every fixture.
+
+    Args:
+        repeat (int, optional): Runs per measurement; the median is kept. Defaults to 5.
+
+    Returns:
+        dict: the results, in the format of the baseline file.
+    """
+    # Stages that use the shared fetcher must not read or fill the user's media and page caches
+    configure_shared_fetcher(use_cache=False)
+    configure_page_cache("off")
+    samples = {}
+    with StandInServer(build_corpus) as server:
+        names = sorted(server.pages)
+        for _ in range(repeat):
+            work_root = tempfile.mkdtemp(prefix="medium2md-bench-")
+            try:
+                for name in names:
+                    for stage, seconds in bench_folder_stages(server, name, work_root).items():
+                        samples.setdefault(f"{name}/{stage}", []).append(seconds)
+                samples.setdefault("end_to_end/corpus", []).append(bench_end_to_end(server, names, work_root))
+            finally:
+                shutil.rmtree(work_root)
+
+        # Memory is measured on a separate run: tracing slows everything down
+        work_root = tempfile.mkdtemp(prefix="medium2md-bench-")
+        try:
+            tracemalloc.start()
+            bench_end_to_end(server, names, work_root)
+            peak_heap = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        finally:
+            shutil.rmtree(work_root)
+
+    timings = {key: median(values) for key, values in sorted(samples.items())}
+    return {
+        "timings": timings,
+        "articles_per_second": len(names) / timings["end_to_end/corpus"],
+        "peak_python_heap_mb": peak_heap / 2 ** 20,
+        "max_rss_mb": max_rss_mb(),
+    }
+
+
+def max_rss_mb():
+    """Return the peak resident set size of this process in MiB, or None where it is not available."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 1024
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """List the timings that got slower than the baseline allows.
+
+    Args:
+        results (dict): The current results.
+        baseline (dict): The recorded results.
+        threshold (float, optional): Allowed slowdown, as a fraction of the baseline.
+
+    Returns:
+        list: (timing name, baseline seconds, current seconds) for every regression.
+    """
+    regressions = []
+    for key, seconds in results["timings"].items():
+        before = baseline["timings"].get(key)
+        if before is None or max(before, seconds) < MIN_COMPARABLE_SECONDS:
+            continue
+        if seconds > before * (1 + threshold):
+            regressions.append((key, before, seconds))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"{'timing':<45}{'seconds':>10}{'baseline':>10}{'change':>9}")
+    for key, seconds in results["timings"].items():
+        before = (baseline or {}).get("timings", {}).get(key)
+        recorded = f"{before:.4f}" if before is not None else ""
+        change = f"{(seconds / before - 1) * 100:+.0f}%" if before else ""
+        print(f"{key:<45}{seconds:>10.4f}{recorded:>10}{change:>9}")
+    print(f"\nThroughput: {results['articles_per_second']:.1f} articles/s")
+    print(f"Peak Python heap: {results['peak_python_heap_mb']:.1f} MB", end="")
+    print(f", max RSS: {results['max_rss_mb']:.1f} MB" if results["max_rss_mb"] is not None else "")
+
+
+def record(url, name):
+    """Save the served HTML of a real article to the corpus."""
+    os.makedirs(RECORDED_FOLDER, exist_ok=True)
+    path = os.path.join(RECORDED_FOLDER, f"{name}.html")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(fetch_static_html(url))
+    print(f"Recorded {url} as {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark medium2md on a fixed corpus.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (the median is kept)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown against the baseline, as a fraction (default 0.25)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file to compare with")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--record", nargs=2, metavar=("URL", "NAME"), help="Add a real page to the corpus")
+    args = parser.parse_args()
+
+    if args.record:
+        record(*args.record)
+        return 0
+
+    results = run_benchmarks(args.repeat)
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print("\nNo baseline to compare with; run with --update-baseline to record one.")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for key, before, seconds in regressions:
+        print(f"REGRESSION {key}: {before:.4f}s -> {seconds:.4f}s (more than {args.threshold:.0%} slower)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
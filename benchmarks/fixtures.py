@@ -0,0 +1,132 @@
+import os
+import glob
+import random
+import hashlib
+
+
+# Recorded pages (see `bench.py --record`) live here, one HTML file per page
+RECORDED_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Medium image hosts in recorded pages are redirected to the local stand-in
+MEDIUM_IMAGE_PREFIXES = ("https://miro.medium.com/", "https://cdn-images-1.medium.com/")
+
+WORDS = ("data model pipeline article medium markdown image python latency throughput cache browser "
+         "render network parser token stream memory worker thread process batch output result").split()
+
+
+def _sentence(rng, words=14):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _paragraph(rng, sentences=5):
+    return "<p>" + " ".join(_sentence(rng) for _ in range(sentences)) + "</p>"
+
+
+def _figure(rng, image_base, index):
+    image_id = f"1*{hashlib.sha1(str(index).encode()).hexdigest()[:16]}.png"
+    size = rng.choice((700, 1000, 1400))
+    return (f'<figure><picture><source srcset="{image_base}v2/resize:fit:{size}/format:webp/{image_id}">'
+            f'<img src="{image_base}max/{size}/{image_id}" alt="" width="{size}"></picture>'
+            f"<figcaption>{_sentence(rng, 6)}</figcaption></figure>")
+
+
+def _code_block(rng, lines=18):
+    body = "\n".join(f"    {rng.choice(WORDS)}_{i} = {rng.choice(WORDS)}({rng.randint(0, 99)})" for i in range(lines))
+    return f"<pre><span>def {rng.choice(WORDS)}():\n{body}\n    return None</span></pre>"
+
+
+def medium_page(title, blocks):
+    """Wrap article blocks in the markup Medium puts around a post.
+
+    Args:
+        title (str): Title of the post.
+        blocks (list): HTML of the article body, block by block.
+
+    Returns:
+        str: The page HTML.
+    """
+    chrome = "".join(f'<div class="nav">{word}</div>' for word in WORDS)
+    scripts = "".join(f'<script>window.__state{i} = {{"k": "{"x" * 200}"}};</script>' for i in range(20))
+    return (f"<!DOCTYPE html><html><head><title>{title} | by Author | Medium</title>"
+            f'<meta name="description" content="{title}">{scripts}</head><body>'
+            f"<header>{chrome}</header>"
+            f"<article><div><section><h1>{title}</h1><h2>A subtitle for {title.lower()}</h2>"
+            f"<div>Author · 8 min read · Jan 1, 2024</div><div>Share</div>"
+            + "".join(blocks) +
+            "</section></div></article>"
+            f"<div><h2>Written by Author</h2>{_paragraph(random.Random(0), 2)}</div>"
+            f"<div><h2>More from Author</h2>{chrome}</div>"
+            "</body></html>")
+
+
+def build_corpus(image_base):
+    """Build the synthetic benchmark corpus, identical on every run.
+
+    Args:
+        image_base (str): url prefix images are served from, ending in '/'.
+
+    Returns:
+        dict: page HTML by fixture name.
+    """
+    corpus = {}
+
+    rng = random.Random(1)
+    corpus["small"] = medium_page("A Small Post", [_paragraph(rng) for _ in range(6)] + [_figure(rng, image_base, 0)])
+
+    rng = random.Random(2)
+    blocks = []
+    for i in range(120):
+        blocks.append(f"<h3>Section {i}</h3>" if i % 10 == 0 else _paragraph(rng, 8))
+        if i % 30 == 15:
+            blocks.append(_figure(rng, image_base, 100 + i))
+    corpus["long-form"] = medium_page("A Long-Form Essay", blocks)
+
+    rng = random.Random(3)
+    blocks = []
+    for i in range(60):
+        blocks.append(_figure(rng, image_base, 200 + i))
+        blocks.append(_paragraph(rng, 2))
+    corpus["image-heavy"] = medium_page("A Photo Essay", blocks)
+
+    rng = random.Random(4)
+    blocks = []
+    for i in range(40):
+        blocks.append(_paragraph(rng, 3))
+        blocks.append(_code_block(rng))
+    corpus["code-heavy"] = medium_page("A Coding Tutorial", blocks)
+
+    corpus.update(load_recorded(image_base))
+    return corpus
+
+
+def load_recorded(image_base):
+    """Load the recorded pages, pointing their Medium images at the local stand-in.
+
+    Args:
+        image_base (str): url prefix images are served from, ending in '/'.
+
+    Returns:
+        dict: page HTML by fixture name (the file name without extension).
+    """
+    recorded = {}
+    for path in sorted(glob.glob(os.path.join(RECORDED_FOLDER, "*.html"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            page = f.read()
+        for prefix in MEDIUM_IMAGE_PREFIXES:
+            page = page.replace(prefix, image_base)
+        recorded[os.path.splitext(os.path.basename(path))[0]] = page
+    return recorded
+
+
+def image_bytes(path, size=48 * 1024):
+    """Return the (deterministic) body served for an image path.
+
+    Args:
+        path (str): Path of the image request.
+        size (int, optional): Body size in bytes. Defaults to 48 KiB.
+
+    Returns:
+        bytes: A PNG signature followed by filler derived from the path.
+    """
+    seed = hashlib.sha256(path.rsplit("/", 1)[-1].encode()).digest()
+    return b"\x89PNG\r\n\x1a\n" + (seed * (size // len(seed) + 1))[:size - 8]
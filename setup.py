@@ -26,6 +26,7 @@ setuptools.setup(
     ],
     python_requires=">=3.8",
     install_requires=[
+        "anyio==3.7.1",
         "beautifulsoup4==4.12.2",
         "certifi==2023.7.22",
         "chardet==5.1.0",
@@ -33,7 +34,10 @@ setuptools.setup(
         "colorama==0.4.6",
         "cssselect==1.2.0",
         "greenlet==2.0.2",
+        "h11==0.14.0",
         "html2text==2020.1.16",
+        "httpcore==0.17.3",
+        "httpx==0.24.1",
         "idna==3.4",
         "lxml==4.9.3",
         "playwright==1.36.0",
@@ -43,6 +47,7 @@ setuptools.setup(
         "readability-lxml==0.8.1",
         "requests==2.31.0",
         "setuptools==67.8.0",
+        "sniffio==1.3.0",
         "soupsieve==2.4.1",
         "termcolor==2.3.0",
         "tqdm==4.65.0",
@@ -0,0 +1,271 @@
+import asyncio
+from collections import namedtuple
+from typing import List, Optional
+
+import httpx
+
+# Custom modules
+from .download_with_media import (FETCH_MODES, DEFAULT_RENDER_OPTIONS, STATIC_PAGE_ERRORS, ArticleDocument, is_blocked,
+                                  compose_article_html)
+from .html_to_md import CONVERTER_ENGINES, convert_html
+from .clean_md import clean_markdown
+from .url_to_local import find_image_urls
+from .media_index import MediaIndex, local_media_path, rewrite_links
+from .media_fetcher import DEFAULT_TIMEOUT, DEFAULT_MAX_BYTES, CHUNK_SIZE, MediaTooLarge
+from .instrumentation import timed
+
+
+# A downloaded image: `path` is where the markdown expects it, relative to the markdown file.
+MediaFile = namedtuple("MediaFile", ["url", "path", "content"])
+
+# A converted article, entirely in memory.
+ConvertedArticle = namedtuple("ConvertedArticle", ["url", "title", "markdown", "media"])
+
+# Seconds one conversion may take, from fetching the page to the last image
+DEFAULT_ARTICLE_TIMEOUT = 120
+
+
+def create_client(max_connections: int = 16, timeout=DEFAULT_TIMEOUT) -> httpx.AsyncClient:
+    """
+    Create an async HTTP client that keeps connections alive between conversions.
+
+    :param max_connections: Number of connections kept open
+    :param timeout: (connect, read) timeouts in seconds
+    :return: The client
+    """
+    connect, read = timeout
+    return httpx.AsyncClient(timeout=httpx.Timeout(read, connect=connect), follow_redirects=True,
+                             limits=httpx.Limits(max_connections=max_connections,
+                                                 max_keepalive_connections=max_connections))
+
+
+class AsyncConverter:
+    """
+    Convert articles on an event loop, many at a time.
+
+    One HTTP client, and in render mode one Chromium, are shared by every
+    conversion; each rendered article gets its own browser context, rendered
+    with the same `RenderOptions` as the sync renderer. Parsing and
+    HTML to markdown conversion run in the default executor (or the conversion
+    process pool, see `configure_conversion_pool`), so the loop is never blocked.
+    With the "lxml" engine only the article element is converted, see `medium_markdown`.
+
+    Use it as an async context manager, or call `close()` when done.
+    """
+
+    def __init__(self, fetch_mode: str = "render", timeout: float = DEFAULT_ARTICLE_TIMEOUT,
+                 max_media: int = 8, client: Optional[httpx.AsyncClient] = None,
+                 render_options=DEFAULT_RENDER_OPTIONS, max_media_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+                 engine: str = "html2text"):
+        if fetch_mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode: {fetch_mode!r} (expected one of {', '.join(FETCH_MODES)})")
+        if engine not in CONVERTER_ENGINES:
+            raise ValueError(f"Unknown converter engine: {engine!r} (expected one of {', '.join(CONVERTER_ENGINES)})")
+        self.fetch_mode = fetch_mode
+        self.engine = engine
+        self.timeout = timeout
+        self.render_options = render_options
+        self.client = client or create_client(max_connections=max(16, max_media))
+        self._owns_client = client is None
+        self.max_media = max_media
+        self.max_media_bytes = max_media_bytes
+        # Created on first use, so they bind to the loop the converter runs on
+        self._media_slots = None
+        self._browser_lock = None
+        self._playwright = None
+        self._browser = None
+
+    async def _get_browser(self):
+        if self._browser_lock is None:
+            self._browser_lock = asyncio.Lock()
+        async with self._browser_lock:
+            if self._browser is None:
+                from playwright.async_api import async_playwright
+
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch()
+            return self._browser
+
+    async def fetch_document(self, url: str) -> ArticleDocument:
+        """
+        Fetch an article, rendered or as served, and parse it once (in the executor).
+
+        In auto mode the served page is used when it holds the article, and the
+        page is rendered otherwise, as `fetch_article_document` does.
+
+        :param url: URL of the Medium article
+        :return: The parsed page
+        """
+        loop = asyncio.get_running_loop()
+        if self.fetch_mode != "render":
+            try:
+                with timed("page_fetch", url=url, mode="static") as event:
+                    response = await self.client.get(url)
+                    response.raise_for_status()
+                    event["bytes"] = len(response.content)
+                document = await loop.run_in_executor(None, ArticleDocument, response.text, url)
+            except (httpx.HTTPError,) + STATIC_PAGE_ERRORS:
+                if self.fetch_mode == "static":
+                    raise
+            else:
+                if self.fetch_mode == "static" or document.has_article_content():
+                    return document
+
+        with timed("page_fetch", url=url, mode="render") as event:
+            html = await self.fetch_rendered_html(url)
+            event["bytes"] = len(html.encode("utf-8"))
+        return await loop.run_in_executor(None, ArticleDocument, html, url)
+
+    async def fetch_rendered_html(self, url: str) -> str:
+        """
+        Render an article in the shared Chromium, with the converter's `RenderOptions`.
+
+        :param url: URL of the Medium article
+        :return: The rendered page content
+        """
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+        options = self.render_options
+
+        async def handle_route(route, request):
+            if is_blocked(request.url, request.resource_type, options):
+                await route.abort()
+            else:
+                await route.continue_()
+
+        context = await (await self._get_browser()).new_context()
+        try:
+            if options.blocked_resource_types or options.blocked_hosts:
+                await context.route("**/*", handle_route)
+            page = await context.new_page()
+            deadline = asyncio.get_running_loop().time() + options.budget
+            await page.goto(url, wait_until="domcontentloaded", timeout=options.budget * 1000)
+            if options.wait_selector:
+                try:
+                    remaining = max(deadline - asyncio.get_running_loop().time(), 0.001)
+                    await page.wait_for_selector(options.wait_selector, state="attached", timeout=remaining * 1000)
+                except PlaywrightTimeoutError:
+                    pass
+            return await page.content()
+        finally:
+            await context.close()
+
+    async def fetch_media(self, url: str) -> Optional[bytes]:
+        """
+        Download one image, or return None if it cannot be downloaded or is bigger than `max_media_bytes`.
+
+        :param url: URL of the image
+        :return: The image bytes
+        """
+        if self._media_slots is None:
+            self._media_slots = asyncio.Semaphore(self.max_media)
+        async with self._media_slots:
+            try:
+                with timed("media_fetch", url=url, cache="miss") as event:
+                    body = await self._read_limited(url)
+                    event["bytes"] = len(body)
+                return body
+            except (httpx.HTTPError, MediaTooLarge):
+                return None
+
+    async def _read_limited(self, url: str) -> bytes:
+        limit = self.max_media_bytes
+        async with self.client.stream("GET", url) as response:
+            response.raise_for_status()
+            declared = response.headers.get("Content-Length")
+            if limit is not None and declared is not None and declared.isdigit() and int(declared) > limit:
+                raise MediaTooLarge(f"{url} is {declared} bytes, more than {limit}")
+            body = bytearray()
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                body += chunk
+                if limit is not None and len(body) > limit:
+                    raise MediaTooLarge(f"{url} is more than {limit} bytes")
+            return bytes(body)
+
+    async def convert_article(self, url: str, timeout: Optional[float] = None) -> ConvertedArticle:
+        """
+        Convert one article to markdown with its images, without touching the disk.
+
+        Cancelling the calling task, or exceeding the timeout, stops the conversion
+        and releases its page and connections.
+
+        :param url: URL of the Medium article
+        :param timeout: Seconds the conversion may take, defaults to the converter's timeout
+        :return: The converted article
+        :raises asyncio.TimeoutError: If the conversion took too long
+        """
+        return await asyncio.wait_for(self._convert_article(url), timeout or self.timeout)
+
+    async def _convert_article(self, url: str) -> ConvertedArticle:
+        with timed("article", url=url, mode=self.fetch_mode) as event:
+            article = await self._convert(url)
+            event["images"] = len(article.media)
+        return article
+
+    async def _convert(self, url: str) -> ConvertedArticle:
+        loop = asyncio.get_running_loop()
+        document = await self.fetch_document(url)
+        embedded = await loop.run_in_executor(None, document.embedded_markdown)
+        if embedded is not None:
+            title, markdown = embedded
+            del document
+        elif self.engine == "lxml":
+            title, markdown = await loop.run_in_executor(None, _emit_markdown, document)
+            del document
+        else:
+            title, content = await loop.run_in_executor(None, document.extract)
+            html = compose_article_html(document.page_content, title, content)
+            del document, content
+            markdown = await loop.run_in_executor(None, convert_html, html)
+            markdown = await loop.run_in_executor(None, clean_markdown, markdown)
+
+        image_urls = find_image_urls(markdown)
+        contents = await asyncio.gather(*(self.fetch_media(image_url) for image_url in image_urls))
+        index = MediaIndex()
+        media: List[MediaFile] = []
+        for image_url, image in zip(image_urls, contents):
+            if image is not None:
+                path = local_media_path(image_url)
+                media.append(MediaFile(image_url, path, image))
+                index.add(image_url, path)
+        return ConvertedArticle(url, title, rewrite_links(markdown, index), media)
+
+    async def close(self):
+        """
+        Close the browser and, if the converter created it, the HTTP client.
+        """
+        if self._browser is not None:
+            await self._browser.close()
+            await self._playwright.stop()
+            self._browser = self._playwright = None
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def _emit_markdown(document: ArticleDocument):
+    title, content = document.extract_article_node() or document.extract()
+    return title, document.article_markdown(title, content)
+
+
+async def convert_article(url: str, fetch_mode: str = "render", timeout: float = DEFAULT_ARTICLE_TIMEOUT,
+                          **options) -> ConvertedArticle:
+    """
+    Convert one article with a converter of its own.
+
+    A service converting many articles should keep one `AsyncConverter` open instead,
+    so the browser and connections are shared.
+
+    :param url: URL of the Medium article
+    :param fetch_mode: "render", "static" or "auto"
+    :param timeout: Seconds the conversion may take
+    :param options: Keyword arguments for `AsyncConverter`
+    :return: The converted article
+    """
+    async with AsyncConverter(fetch_mode, timeout, **options) as converter:
+        return await converter.convert_article(url)
@@ -0,0 +1,213 @@
+import os
+import queue
+import threading
+from collections import namedtuple
+
+# Custom modules
+from .pipeline import run_pipeline, article_folder_name
+
+
+BatchResult = namedtuple("BatchResult", ["url", "success", "output_folder", "error", "skipped"], defaults=(False,))
+
+
+def read_urls(stream):
+    """
+    Read article URLs from a text stream, one URL per line.
+
+    Blank lines and lines starting with '#' are skipped.
+
+    Args:
+        stream (io.TextIOBase): The stream to read from (a file or sys.stdin).
+
+    Yields:
+        str: Each URL found in the stream.
+    """
+    for line in stream:
+        url = line.strip()
+        if url and not url.startswith('#'):
+            yield url
+
+
+def convert_article(url, output_folder, browser_context=None, fetch_mode="render", manifest=None,
+                    engine="html2text"):
+    """
+    Run every stage of the conversion for a single article, in memory.
+
+    Args:
+        url (str): URL of the Medium article.
+        output_folder (str): The folder the article is written to.
+        browser_context (BrowserContext, optional): Playwright context to render the page in.
+        fetch_mode (str, optional): "render", "static" or "auto". Defaults to "render".
+        manifest (Manifest, optional): Manifest of previous runs, enables skipping unchanged articles.
+        engine (str, optional): "html2text" or "lxml", how the article is converted to markdown.
+            Defaults to "html2text".
+
+    Returns:
+        Article: The saved (or skipped) article.
+    """
+    return run_pipeline(url, output_folder, fetch_mode, browser_context, manifest=manifest, engine=engine)
+
+
+def _process_jobs(jobs, output_root, browser_context, options, report, startup_error=None):
+    """
+    Convert articles from the job queue until the stop sentinel is received.
+
+    Args:
+        jobs (queue.Queue): Queue of (index, url) tuples, terminated by None.
+        output_root (str): The folder holding one sub-folder per article.
+        browser_context (BrowserContext): Playwright context owned by this worker, or None.
+        options (dict): Keyword arguments for `convert_article`.
+        report (function): Called with (index, BatchResult) for every article.
+        startup_error (Exception, optional): If set, the worker has no browser and
+            fails every article it receives with this error.
+    """
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        index, url = job
+        output_folder = os.path.join(output_root, article_folder_name(url))
+        if startup_error is not None:
+            report(index, BatchResult(url, False, output_folder, str(startup_error)))
+            continue
+        try:
+            article = convert_article(url, output_folder, browser_context, **options)
+            report(index, BatchResult(url, True, output_folder, None, getattr(article, "skipped", False)))
+        except Exception as e:
+            report(index, BatchResult(url, False, output_folder, str(e)))
+
+
+class LazyBrowserContext:
+    """
+    Browser context that only launches Chromium when the first page is opened.
+
+    Used in auto mode, where most articles never need a browser. Like every
+    Playwright sync object it must be used from the thread that created it.
+    """
+
+    def __init__(self):
+        self._playwright = None
+        self._browser = None
+        self._context = None
+
+    def new_page(self):
+        if self._context is None:
+            from playwright.sync_api import sync_playwright
+
+            self._playwright = sync_playwright().start()
+            try:
+                self._browser = self._playwright.chromium.launch()
+                self._context = self._browser.new_context()
+            except BaseException:
+                # Stop the instance, so the next article starts afresh instead of beside it
+                if self._browser is not None:
+                    self._browser.close()
+                self._playwright.stop()
+                self._playwright = self._browser = None
+                raise
+        return self._context.new_page()
+
+    def close(self):
+        if self._browser is not None:
+            self._browser.close()
+            self._playwright.stop()
+            self._playwright = self._browser = self._context = None
+
+
+def _worker(jobs, output_root, options, report):
+    """
+    Own one long-lived browser and context and feed queued articles through it.
+
+    Playwright's sync API is bound to the thread that started it, so every worker
+    starts its own instance and keeps it for the whole batch. In static mode no
+    browser is started at all, and in auto mode only once an article needs one.
+    """
+    if options["fetch_mode"] == "static":
+        _process_jobs(jobs, output_root, None, options, report)
+        return
+
+    if options["fetch_mode"] == "auto":
+        context = LazyBrowserContext()
+        try:
+            _process_jobs(jobs, output_root, context, options, report)
+        finally:
+            context.close()
+        return
+
+    from playwright.sync_api import sync_playwright
+
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch()
+            try:
+                context = browser.new_context()
+                _process_jobs(jobs, output_root, context, options, report)
+            finally:
+                browser.close()
+    except Exception as e:
+        # Keep draining the queue so the batch cannot hang on a dead worker.
+        _process_jobs(jobs, output_root, None, options, report, startup_error=e)
+
+
+def run_batch(urls, output_root, workers=4, on_result=None, fetch_mode="render", manifest=None, job_queue=None,
+              engine="html2text"):
+    """
+    Convert many Medium articles using a pool of long-lived browser contexts.
+
+    Each article is written to its own sub-folder of `output_root`, so articles
+    never overwrite each other.
+
+    Args:
+        urls (iter): The article URLs to convert. Consumed lazily.
+        output_root (str): The folder holding one sub-folder per article.
+        workers (int, optional): Number of browser contexts to keep open. Defaults to 4.
+        on_result (function, optional): Called with each BatchResult as soon as it is known.
+        fetch_mode (str, optional): "render", "static" or "auto". Defaults to "render".
+        manifest (Manifest, optional): Manifest of previous runs. Unchanged articles are
+            skipped, and the manifest is saved when the batch ends.
+        job_queue (JobQueue, optional): Durable queue the URLs are added to. Workers take
+            their articles from it, failed articles are retried after a backoff, and URLs
+            converted by an earlier (possibly interrupted) run are not converted again.
+        engine (str, optional): "html2text" or "lxml", how articles are converted to markdown.
+            Defaults to "html2text".
+
+    Returns:
+        list: The BatchResult of every URL, in input order. With a job queue, the final
+        result of every article converted or given up in this run, in the order they were taken.
+    """
+    workers = max(1, workers)
+    options = {"fetch_mode": fetch_mode, "manifest": manifest, "engine": engine}
+    jobs = queue.Queue(maxsize=workers * 2)
+    results = {}
+    lock = threading.Lock()
+
+    if job_queue is not None:
+        urls = job_queue.claim_all(urls)
+
+    def report(index, result):
+        if job_queue is not None:
+            if result.success:
+                job_queue.complete(result.url, result.output_folder)
+            elif job_queue.fail(result.url, result.error):
+                # Queued again after a backoff; only the final attempt is reported
+                return
+        with lock:
+            results[index] = result
+            if on_result is not None:
+                on_result(result)
+
+    threads = [threading.Thread(target=_worker, args=(jobs, output_root, options, report), daemon=True)
+               for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    for index, url in enumerate(urls):
+        jobs.put((index, url))
+    for _ in threads:
+        jobs.put(None)
+    for thread in threads:
+        thread.join()
+
+    if manifest is not None:
+        manifest.save()
+    return [results[index] for index in sorted(results)]
@@ -1,6 +1,28 @@
+import io
 import re
 import os
-from typing import List
+import tempfile
+from functools import lru_cache
+from collections import namedtuple
+from typing import Callable, List, Optional, Sequence
+
+# A cleaning step: `action` names what to do (see clean_markdown), `marker` is the literal text it looks for.
+CleaningRule = namedtuple("CleaningRule", ["action", "marker"])
+
+# The boilerplate Medium adds around an article, removed in this order. Adjacent
+# "cut_after" rules are merged into a single scan, so new trailing sections can
+# be added without another pass over the document.
+CLEANING_RULES = (
+    CleaningRule("capture_heading", None),
+    CleaningRule("cut_after", "## More from"),
+    CleaningRule("cut_through_last", "Share"),
+    CleaningRule("prepend_heading", None),
+    CleaningRule("cut_after", "## Written by"),
+    CleaningRule("drop_from_last_line", "\\--"),
+    CleaningRule("cut_after", "## Support independent authors and access the best of Medium."),
+)
+
+HEADING_PATTERN = re.compile(r"^(#{1,6}) (.*$)\n(.*$)", re.MULTILINE)
 
 def list_markdown_files(folder_path: str) -> List[str]:
     """
@@ -11,60 +33,228 @@ def list_markdown_files(folder_path: str) -> List[str]:
     """
     return [file for file in os.listdir(folder_path) if file.endswith('.md')]
 
-def process_markdown_files(folder_path: str):
+def process_markdown_files(folder_path: str, on_progress: Optional[Callable[[int, int], None]] = None):
     """
     Process all markdown files in a directory.
 
     :param folder_path: Path to the directory
+    :param on_progress: Called with (files processed, total files)
     """
     # Get all markdown files in the directory
     markdown_files = list_markdown_files(folder_path)
 
     # Process each markdown file
-    for md_file in markdown_files:
+    for done, md_file in enumerate(markdown_files, 1):
         file_path = os.path.join(folder_path, md_file)
         process_single_file(file_path)
+        if on_progress is not None:
+            on_progress(done, len(markdown_files))
 
 def process_single_file(file_path: str):
     """
     Apply transformations to a single markdown file.
 
+    The file is read once, cleaned in memory and written back atomically.
+
     :param file_path: Path to the markdown file
     """
-    # Extract the first heading and the line that follows
-    heading = extract_first_heading_and_next_line(file_path)
+    write_text_atomic(file_path, clean_markdown(read_text(file_path)))
+
+def clean_markdown(text: str, rules: Sequence[CleaningRule] = CLEANING_RULES) -> str:
+    """
+    Apply all transformations to markdown text.
+
+    Every rule is a plain string search (or a precompiled, escaped pattern), so
+    cleaning is linear in the size of the document.
+
+    :param text: Markdown text
+    :param rules: Cleaning rules to apply, in order
+    :return: Cleaned markdown text
+    """
+    heading = None
+    index = 0
+    while index < len(rules):
+        rule = rules[index]
+        if rule.action == "capture_heading":
+            # Extract the first heading and the line that follows
+            heading = first_heading_and_next_line(text)
+        elif rule.action == "prepend_heading":
+            # Add the extracted heading at the beginning of the text
+            text = prepend_heading(text, heading)
+        elif rule.action == "cut_after":
+            # Merge adjacent section cuts into one scan for the earliest marker
+            markers = [rule.marker]
+            while index + 1 < len(rules) and rules[index + 1].action == "cut_after":
+                index += 1
+                markers.append(rules[index].marker)
+            match = _markers_pattern(tuple(markers)).search(text)
+            if match:
+                text = text[:match.start()]
+        elif rule.action in RULE_ACTIONS:
+            text = RULE_ACTIONS[rule.action](text, rule.marker)
+        else:
+            raise ValueError(f"Unknown cleaning action: {rule.action!r}")
+        index += 1
+    return text
+
+@lru_cache(maxsize=None)
+def _markers_pattern(markers: Sequence[str]):
+    """
+    Compile a pattern matching any of the given literal markers.
+
+    :param markers: Literal strings to look for
+    :return: Compiled pattern
+    """
+    return re.compile("|".join(re.escape(marker) for marker in markers))
+
+def read_text(file_path: str) -> str:
+    """
+    Read a whole text file.
+
+    :param file_path: Path to the file
+    :return: Content of the file
+    """
+    with open(file_path, 'r') as file:
+        return file.read()
+
+def write_text_atomic(file_path: str, text: str):
+    """
+    Write a text file so readers see either the old or the new content, never a partial file.
+
+    :param file_path: Path to the file
+    :param text: New content of the file
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def split_lines(text: str) -> List[str]:
+    """
+    Split text into lines the way `readlines` does, keeping the line endings.
+
+    :param text: Text to split
+    :return: List of lines
+    """
+    return io.StringIO(text).readlines()
+
+def first_heading_and_next_line(text: str) -> Optional[str]:
+    """
+    Extract the first heading and the line that follows from markdown text.
+
+    :param text: Markdown text
+    :return: Extracted heading and the line that follows it
+    """
+    match = HEADING_PATTERN.search(text)
+    return ' '.join([match.group(2).strip(), match.group(3).strip()]) if match else None
+
+def cut_section_after(text: str, heading: str) -> str:
+    """
+    Remove all content after a certain heading in text.
+
+    :param text: Text to cut
+    :param heading: Heading after which content should be removed
+    :return: Remaining text
+    """
+    position = text.find(heading)
+    return text if position == -1 else text[:position]
+
+def cut_until(text: str, keyword: str) -> str:
+    """
+    Remove all content until a certain keyword in text.
+
+    Everything up to and including the line holding the last occurrence of the
+    keyword is removed (an occurrence on an unterminated last line is ignored).
+
+    :param text: Text to cut
+    :param keyword: Keyword until which content should be removed
+    :return: Remaining text
+    """
+    last_newline = text.rfind("\n")
+    position = text.rfind(keyword, 0, last_newline)
+    if last_newline == -1 or position == -1:
+        return text
+    return text[text.find("\n", position + len(keyword)) + 1:]
 
-    # Remove sections from the markdown
-    remove_section_after(file_path, "## More from")
-    remove_until(file_path, "Share")
+def prepend_heading(text: str, heading: str) -> str:
+    """
+    Add a heading at the beginning of text.
+
+    :param text: Text to prepend to
+    :param heading: Heading to be added
+    :return: Text starting with the heading
+    """
+    return "# " + heading + "\n" + text
+
+def last_line_containing(lines: List[str], pattern: str) -> Optional[int]:
+    """
+    Find the last line that contains a certain pattern.
+
+    :param lines: Lines to search
+    :param pattern: Pattern to look for
+    :return: Line number (1-based) of the last occurrence of the pattern
+    """
+    for num, line in enumerate(reversed(lines), 1):
+        if pattern in line:
+            return len(lines) - num + 1
 
-    # Add the extracted heading at the beginning of the file
-    add_heading(file_path, heading)
+    return None
 
-    # Remove another section
-    remove_section_after(file_path, "## Written by")
+def drop_lines_from(lines: List[str], start_line: int) -> List[str]:
+    """
+    Delete all lines starting from a certain line number.
 
-    # Delete lines after a certain pattern
-    last_pattern_line_number = find_last_line_containing(file_path, "\\--")
-    if last_pattern_line_number is not None:
-        delete_lines_from(file_path, last_pattern_line_number)
+    :param lines: Lines to cut
+    :param start_line: Line number from which to start deleting
+    :return: Remaining lines
+    """
+    lines = list(lines)
+    del lines[start_line - 3:]
+    return lines
 
-    # Remove final section
-    remove_section_after(file_path, "## Support independent authors and access the best of Medium.")
+def drop_from_last_line(text: str, pattern: str) -> str:
+    """
+    Delete the last line containing a pattern, the two lines before it and everything after.
 
-def extract_first_heading_and_next_line(file_path: str) -> str:
+    :param text: Text to cut
+    :param pattern: Pattern to look for
+    :return: Remaining text
+    """
+    position = text.rfind(pattern)
+    if position == -1:
+        return text
+
+    # Walk back over the matching line and the two lines before it
+    cut = position
+    for _ in range(3):
+        cut = text.rfind("\n", 0, cut)
+        if cut == -1:
+            break
+    else:
+        return text[:cut + 1]
+
+    # The match is within the first three lines: keep the exact line arithmetic
+    lines = split_lines(text)
+    return ''.join(drop_lines_from(lines, last_line_containing(lines, pattern)))
+
+RULE_ACTIONS = {
+    "cut_after": cut_section_after,
+    "cut_through_last": cut_until,
+    "drop_from_last_line": drop_from_last_line,
+}
+
+def extract_first_heading_and_next_line(file_path: str) -> Optional[str]:
     """
     Extract the first heading and the line that follows from a markdown file.
 
     :param file_path: Path to the markdown file
     :return: Extracted heading and the line that follows it
     """
-    with open(file_path, 'r') as file:
-        file_text = file.read()
-
-    pattern = r"^(#{1,6}) (.*$)\n(.*$)"
-    match = re.search(pattern, file_text, re.MULTILINE)
-    return ' '.join([match.group(2).strip(), match.group(3).strip()]) if match else None
+    return first_heading_and_next_line(read_text(file_path))
 
 def remove_section_after(file_path: str, heading: str):
     """
@@ -73,14 +263,7 @@ def remove_section_after(file_path: str, heading: str):
     :param file_path: Path to the file
     :param heading: Heading after which content should be removed
     """
-    with open(file_path, 'r') as file:
-        file_text = file.read()
-
-    pattern = f"{heading}.*"
-    modified_text = re.sub(pattern, "", file_text, flags=re.DOTALL)
-
-    with open(file_path, 'w') as file:
-        file.write(modified_text)
+    write_text_atomic(file_path, cut_section_after(read_text(file_path), heading))
 
 def remove_until(file_path: str, keyword: str):
     """
@@ -89,14 +272,7 @@ def remove_until(file_path: str, keyword: str):
     :param file_path: Path to the file
     :param keyword: Keyword until which content should be removed
     """
-    with open(file_path, 'r') as file:
-        file_text = file.read()
-
-    pattern = f".*{keyword}.*?\n"
-    modified_text = re.sub(pattern, "", file_text, flags=re.DOTALL)
-
-    with open(file_path, 'w') as file:
-        file.write(modified_text)
+    write_text_atomic(file_path, cut_until(read_text(file_path), keyword))
 
 def add_heading(file_path: str, heading: str):
     """
@@ -105,12 +281,9 @@ def add_heading(file_path: str, heading: str):
     :param file_path: Path to the file
     :param heading: Heading to be added
     """
-    with open(file_path, 'r+') as file:
-        file_text = file.read()
-        file.seek(0)
-        file.write("# " + heading + "\n" + file_text)
+    write_text_atomic(file_path, prepend_heading(read_text(file_path), heading))
 
-def find_last_line_containing(file_path: str, pattern: str) -> int:
+def find_last_line_containing(file_path: str, pattern: str) -> Optional[int]:
     """
     Find the last line in a file that contains a certain pattern.
 
@@ -118,14 +291,7 @@ def find_last_line_containing(file_path: str, pattern: str) -> int:
     :param pattern: Pattern to look for
     :return: Line number of the last occurrence of the pattern
     """
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-
-    for num, line in enumerate(reversed(lines), 1):
-        if pattern in line:
-            return len(lines) - num + 1
-
-    return None
+    return last_line_containing(split_lines(read_text(file_path)), pattern)
 
 def delete_lines_from(file_path: str, start_line: int):
     """
@@ -134,13 +300,8 @@ def delete_lines_from(file_path: str, start_line: int):
     :param file_path: Path to the file
     :param start_line: Line number from which to start deleting
     """
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-
-    del lines[start_line - 3:]
-
-    with open(file_path, 'w') as file:
-        file.writelines(lines)
+    lines = split_lines(read_text(file_path))
+    write_text_atomic(file_path, ''.join(drop_lines_from(lines, start_line)))
 
 # if __name__ == "__main__":
 #     output_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "output")
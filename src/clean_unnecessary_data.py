@@ -1,7 +1,24 @@
-import os, shutil
+import os, glob
+
+# Media is downloaded once, straight into `local/` where the markdown links to it, so
+# the only files left to clean are partial downloads of interrupted runs
+# (see `media_fetcher.stream_to_file`).
+TEMPORARY_PATTERNS = ("*.part", os.path.join("local", "*.part"))
+
 
 def delete_unnecessary_data(output_folder):
-    # remove the media folder inside the output folder
-    media_folder = os.path.join(output_folder, "media")
-    if os.path.exists(media_folder):
-        shutil.rmtree(media_folder)
\ No newline at end of file
+    """
+    Remove the temporary files an interrupted run left in an output folder.
+
+    Args:
+        output_folder (str): The folder holding the markdown files.
+
+    Returns:
+        list: The paths removed.
+    """
+    removed = []
+    for pattern in TEMPORARY_PATTERNS:
+        for path in glob.glob(os.path.join(glob.escape(output_folder), pattern)):
+            os.remove(path)
+            removed.append(path)
+    return removed
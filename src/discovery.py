@@ -0,0 +1,290 @@
+import re
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit, urlunsplit, urljoin
+
+import lxml.html
+import requests
+from lxml import etree
+
+# Custom modules
+from .page_cache import http_get
+from .instrumentation import timed
+
+
+# Where article URLs are discovered: a Medium author, publication or tag, a site of its
+# own (a publication or author on a subdomain or a custom domain), or a feed or sitemap
+# given directly. `url` is the address the listings of the source are derived from.
+Source = namedtuple("Source", ["kind", "name", "url"])
+
+# A page listing articles: an RSS/Atom "feed", a "sitemap" (or sitemap index) or an
+# HTML "archive" page
+Listing = namedtuple("Listing", ["kind", "url"])
+
+MEDIUM_HOSTS = ("medium.com", "www.medium.com")
+
+# Medium post URLs end in the hex id of the post, after the slug or on their own (/p/<id>)
+POST_ID = re.compile(r"(?:^|-)([0-9a-f]{8,16})$")
+
+
+def parse_source(spec):
+    """
+    Work out what a discovery source names.
+
+    Accepted forms: "@author", "tag:name", and URLs of an author, publication or tag
+    page on medium.com, of a site on a subdomain or custom domain, of a feed, or of a
+    sitemap (ending in .xml). The scheme may be left out.
+
+    Args:
+        spec (str): The source as given on the command line.
+
+    Returns:
+        Source: The source.
+
+    Raises:
+        ValueError: If the source names nothing articles can be discovered from.
+    """
+    spec = spec.strip()
+    if spec.startswith("@") and len(spec) > 1:
+        return Source("author", spec, f"https://medium.com/{spec}")
+    if spec.startswith("tag:") and len(spec) > len("tag:"):
+        tag = spec[len("tag:"):]
+        return Source("tag", tag, f"https://medium.com/tag/{tag}")
+
+    parts = urlsplit(spec if "://" in spec else "https://" + spec)
+    host = parts.netloc.lower()
+    segments = [segment for segment in parts.path.split("/") if segment]
+    if not host or "." not in host:
+        raise ValueError(f"Not a Medium author, publication, tag, feed or sitemap: {spec!r}")
+    url = urlunsplit(("https", host, "/".join([""] + segments), "", ""))
+    if segments and segments[-1].endswith(".xml"):
+        return Source("sitemap", url, url)
+    if "feed" in segments:
+        return Source("feed", url, url)
+    if host not in MEDIUM_HOSTS:
+        return Source("site", host, f"https://{host}")
+    if not segments:
+        raise ValueError(f"Name an author, publication or tag on medium.com: {spec!r}")
+    if segments[0].startswith("@"):
+        return Source("author", segments[0], f"https://medium.com/{segments[0]}")
+    if segments[0] == "tag" and len(segments) > 1:
+        return Source("tag", segments[1], f"https://medium.com/tag/{segments[1]}")
+    return Source("publication", segments[0], f"https://medium.com/{segments[0]}")
+
+
+def canonical_article_url(url):
+    """
+    Canonicalize the URL of a Medium post, so the variants of one post compare equal.
+
+    The scheme becomes https, the host is lowercased, and the query (Medium's
+    `source=` tracking), fragment and trailing slash are dropped.
+
+    Args:
+        url (str): The URL, absolute.
+
+    Returns:
+        str: The canonical URL, or None if the URL does not point at a post.
+    """
+    parts = urlsplit(url.strip())
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    path = parts.path.rstrip("/")
+    if POST_ID.search(path.rsplit("/", 1)[-1]) is None:
+        return None
+    return urlunsplit(("https", parts.netloc.lower(), path, "", ""))
+
+
+def post_key(url):
+    """
+    Identify the post a canonical URL points at: by its id, as a post has many URLs
+    (with and without its slug, on medium.com and on its publication's domain).
+
+    Args:
+        url (str): Canonical URL of the post.
+
+    Returns:
+        str: The post id.
+    """
+    return POST_ID.search(url.rsplit("/", 1)[-1]).group(1)
+
+
+def listings(source, since=None, until=None):
+    """
+    List the pages to read the articles of a source from, newest first.
+
+    Every source with a feed starts with it: it is a single small request and holds
+    the most recent posts, so conversion can start right away. Sites also have a
+    sitemap. Archive pages, one per year, are only read back to `since`.
+
+    Args:
+        source (Source): The source.
+        since (int, optional): Oldest year to read archive pages for. No archive pages without it.
+        until (int, optional): Newest year to read archive pages for. Defaults to the current year.
+
+    Returns:
+        list: The Listing pages.
+    """
+    if source.kind in ("feed", "sitemap"):
+        return [Listing(source.kind, source.url)]
+
+    if source.kind == "site":
+        pages = [Listing("feed", f"{source.url}/feed"), Listing("sitemap", f"{source.url}/sitemap/sitemap.xml")]
+    else:
+        # medium.com serves the feed of /@author, /publication and /tag/name under /feed/
+        pages = [Listing("feed", source.url.replace("https://medium.com/", "https://medium.com/feed/", 1))]
+    if since is not None and source.kind != "author":
+        until = until or time.localtime().tm_year
+        pages.extend(Listing("archive", f"{source.url}/archive/{year}") for year in range(until, since - 1, -1))
+    return pages
+
+
+def feed_links(content):
+    """
+    Read the item links of an RSS or Atom feed.
+
+    Args:
+        content (bytes): The feed.
+
+    Returns:
+        list: The links, in feed order.
+    """
+    root = etree.fromstring(content, _xml_parser())
+    if root is None:
+        return []
+    return ([link.strip() for link in root.xpath("//*[local-name()='item']/*[local-name()='link']/text()")] +
+            root.xpath("//*[local-name()='entry']/*[local-name()='link']/@href"))
+
+
+def sitemap_links(content):
+    """
+    Read a sitemap, or a sitemap index.
+
+    Args:
+        content (bytes): The sitemap.
+
+    Returns:
+        tuple: The URLs of the child sitemaps, and the page URLs listed.
+    """
+    root = etree.fromstring(content, _xml_parser())
+    if root is None:
+        return [], []
+    locations = "//*[local-name()='{}']/*[local-name()='loc']/text()"
+    children = [loc.strip() for loc in root.xpath(locations.format("sitemap"))]
+    # Medium's sitemap index also lists sitemaps of tags and authors; only the posts matter
+    if any("post" in child for child in children):
+        children = [child for child in children if "post" in child]
+    return children, [loc.strip() for loc in root.xpath(locations.format("url"))]
+
+
+def archive_links(content, page_url):
+    """
+    Read the links of an archive page.
+
+    Args:
+        content (bytes): The page.
+        page_url (str): URL of the page, to resolve relative links.
+
+    Returns:
+        list: The absolute URLs linked, in page order.
+    """
+    tree = lxml.html.fromstring(content)
+    return [urljoin(page_url, href) for href in tree.xpath("//a/@href")]
+
+
+def _xml_parser():
+    # Feeds and sitemaps are parsed without fetching DTDs or expanding entities
+    return etree.XMLParser(resolve_entities=False, no_network=True, recover=True)
+
+
+def _in_scope(source, url):
+    # Archive pages also link to recommended posts of other publications
+    parts = urlsplit(url)
+    if source.kind == "publication":
+        return parts.netloc in MEDIUM_HOSTS and parts.path.startswith(f"/{source.name}/")
+    if source.kind == "site":
+        return parts.netloc == source.name
+    return True
+
+
+def _read_listing(listing, fetch, on_error):
+    try:
+        with timed("page_fetch", url=listing.url, mode="discovery", listing=listing.kind) as event:
+            response = fetch(listing.url)
+            response.raise_for_status()
+            event["bytes"] = len(response.content)
+        return response.content
+    except requests.RequestException as e:
+        if on_error is not None:
+            on_error(listing.url, e)
+        return None
+
+
+def _parse_listing(listing, content, on_error):
+    try:
+        if listing.kind == "feed":
+            return [], feed_links(content)
+        if listing.kind == "sitemap":
+            return sitemap_links(content)
+        links = archive_links(content, listing.url)
+        # Archive pages of a year link to the pages of its months (and days)
+        prefix = urlsplit(listing.url).path + "/"
+        return [link for link in links if urlsplit(link).path.startswith(prefix)], links
+    except (etree.LxmlError, ValueError) as e:
+        if on_error is not None:
+            on_error(listing.url, e)
+        return [], []
+
+
+def _discover_source(source, since, fetch, on_error):
+    pending = listings(source, since)
+    visited = set()
+    while pending:
+        listing = pending.pop(0)
+        if listing.url in visited:
+            continue
+        visited.add(listing.url)
+        content = _read_listing(listing, fetch, on_error)
+        if content is None:
+            continue
+        children, links = _parse_listing(listing, content, on_error)
+        # Child listings are read right after their parent, so the order stays newest first
+        pending[:0] = [Listing(listing.kind, child) for child in children]
+        for link in links:
+            url = canonical_article_url(link)
+            if url is not None and (listing.kind != "archive" or _in_scope(source, url)):
+                yield url
+
+
+def discover(sources, since=None, fetch=None, on_error=None):
+    """
+    Enumerate the article URLs of Medium authors, publications and tags.
+
+    URLs are yielded as soon as the page listing them is read, before the next page
+    is fetched, so a batch fed from this generator starts converting while discovery
+    is still paging. Every post is yielded once, under its canonical URL.
+
+    Sources are parsed before anything is fetched. After that, a listing page that
+    cannot be fetched or parsed is reported to `on_error` and skipped: discovery never
+    raises while paging, so it cannot break a running batch.
+
+    Args:
+        sources (iter): Sources, as Source tuples or in any form `parse_source` accepts.
+        since (int, optional): Oldest year to read archive pages for. No archive pages without it.
+        fetch (function, optional): Called with a URL to GET it. Defaults to `page_cache.http_get`.
+        on_error (function, optional): Called with (listing URL, exception) for every skipped page.
+
+    Yields:
+        str: Each canonical article URL, once.
+
+    Raises:
+        ValueError: If a source names nothing articles can be discovered from.
+    """
+    sources = [source if isinstance(source, Source) else parse_source(source) for source in sources]
+    fetch = fetch or http_get
+    seen = set()
+    for source in sources:
+        for url in _discover_source(source, since, fetch, on_error):
+            key = post_key(url)
+            if key not in seen:
+                seen.add(key)
+                yield url
@@ -1,101 +1,482 @@
 import os
 import shutil
 import requests
-from bs4 import BeautifulSoup
+import time
+import lxml.html
 from readability import Document
-from urllib.parse import urljoin
-from playwright.sync_api import sync_playwright
+from readability.cleaners import html_cleaner
+from readability.htmls import build_doc
+from urllib.parse import urlparse
+from collections import namedtuple
 
+# Custom modules
+from .media_fetcher import shared_fetcher
+from .page_cache import http_get, shared_page_cache
+from .media_index import MediaIndex, LOCAL_MEDIA_FOLDER, local_media_path, unique_image_urls
+from .instrumentation import timed
+from .embedded_state import find_state, find_post, post_markdown
+from .medium_markdown import find_article_node, heading_title, article_markdown
 
-def download_medium_article(article_url, output_folder):
-    """Download a Medium article and its associated media files.
+
+FETCH_MODES = ("render", "static", "auto")
+
+# Characters of text an <article> must hold for the static HTML to count as the full article
+MIN_ARTICLE_TEXT = 500
+
+# Errors that make the static HTML of a page unusable: it could not be fetched (a 403
+# to clients without a browser, for instance) or parsed
+STATIC_PAGE_ERRORS = (requests.RequestException, lxml.etree.ParserError, ValueError)
+
+# How pages are rendered: requests of `blocked_resource_types`, or to hosts ending in one
+# of `blocked_hosts`, are aborted; rendering is done once `wait_selector` is in the DOM;
+# `budget` is the time in seconds a page may take to render.
+RenderOptions = namedtuple("RenderOptions", ["blocked_resource_types", "blocked_hosts", "wait_selector", "budget"])
+
+DEFAULT_RENDER_OPTIONS = RenderOptions(
+    # Images are downloaded separately from their src attributes, so the browser never needs them.
+    blocked_resource_types=frozenset(["image", "media", "font", "stylesheet"]),
+    blocked_hosts=("google-analytics.com", "googletagmanager.com", "doubleclick.net", "facebook.net",
+                   "facebook.com", "branch.io", "optimizely.com", "sentry.io", "youtube.com", "ytimg.com",
+                   "twitter.com", "gstatic.com"),
+    wait_selector="article",
+    budget=30,
+)
+
+
+def is_blocked(request_url, resource_type, options=DEFAULT_RENDER_OPTIONS):
+    """Tell whether the renderer should abort a request.
 
     Args:
-        article_url (str): URL of the Medium article.
+        request_url (str): url of the request.
+        resource_type (str): Playwright resource type ("document", "script", "image", ...).
+        options (RenderOptions, optional): Renderer configuration.
 
     Returns:
-        bool: True if the article and media files were downloaded successfully, False otherwise.
+        bool: True if the request is not needed to render the article.
+    """
+    if resource_type in options.blocked_resource_types:
+        return True
+    host = urlparse(request_url).hostname or ""
+    return any(host == blocked or host.endswith("." + blocked) for blocked in options.blocked_hosts)
+
+
+def render_page(page, url, options=DEFAULT_RENDER_OPTIONS):
+    """Load a url in a Playwright page and return the rendered HTML.
+
+    Unneeded requests are aborted at the route layer, and the page is read as soon
+    as the article selector is attached rather than after the full load event.
+
+    Args:
+        page (Page): Playwright page to render in.
+        url (str): url of the webpage.
+        options (RenderOptions, optional): Renderer configuration.
+
+    Returns:
+        str: rendered page content.
+
+    Raises:
+        playwright.sync_api.TimeoutError: If the page did not load within the time budget.
+    """
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    def handle_route(route, request):
+        if is_blocked(request.url, request.resource_type, options):
+            route.abort()
+        else:
+            route.continue_()
+
+    if options.blocked_resource_types or options.blocked_hosts:
+        page.route("**/*", handle_route)
+
+    deadline = time.monotonic() + options.budget
+    page.goto(url, wait_until="domcontentloaded", timeout=options.budget * 1000)
+    if options.wait_selector:
+        try:
+            remaining = max(deadline - time.monotonic(), 0.001)
+            page.wait_for_selector(options.wait_selector, state="attached", timeout=remaining * 1000)
+        except PlaywrightTimeoutError:
+            # Not an article page (or a very slow one): readability gets whatever has rendered
+            pass
+    return page.content()
+
+
+def fetch_rendered_html(url, browser_context=None, options=DEFAULT_RENDER_OPTIONS):
+    """Render a url in Chromium and return the resulting HTML.
+
+    Args:
+        url (str): url of the webpage.
+        browser_context (BrowserContext, optional): Long-lived Playwright context to
+            render the page in. When omitted a browser is launched for this page only.
+        options (RenderOptions, optional): Renderer configuration.
+
+    Returns:
+        str: rendered page content.
+    """
+    page_cache = shared_page_cache()
+    replayed = page_cache.rendered(url) if page_cache is not None else None
+    if replayed is not None:
+        return replayed
+
+    with timed("page_fetch", url=url, mode="render") as event:
+        if browser_context is not None:
+            page = browser_context.new_page()
+            try:
+                page_content = render_page(page, url, options)
+            finally:
+                page.close()
+        else:
+            # Imported here so the static backend never pays for loading Playwright
+            from playwright.sync_api import sync_playwright
+
+            with sync_playwright() as p:
+                browser = p.chromium.launch()
+                try:
+                    page_content = render_page(browser.new_page(), url, options)
+                finally:
+                    browser.close()
+        event["bytes"] = len(page_content.encode("utf-8"))
+    if page_cache is not None:
+        page_cache.record_rendered(url, page_content)
+    return page_content
+
+
+def fetch_static_html(url):
+    """Fetch the server-side HTML of a url without running any scripts.
+
+    Args:
+        url (str): url of the webpage.
+
+    Returns:
+        str: page content as served.
+    """
+    with timed("page_fetch", url=url, mode="static") as event:
+        response = http_get(url)
+        response.raise_for_status()
+        event["bytes"] = len(response.content)
+    return response.text
+
+
+def fetch_static_if_changed(url, etag=None, last_modified=None):
+    """Fetch the server-side HTML of a url unless it is unchanged since the given validators.
+
+    Args:
+        url (str): url of the webpage.
+        etag (str, optional): ETag of the copy we have.
+        last_modified (str, optional): Last-Modified date of the copy we have.
+
+    Returns:
+        tuple: page content (None if the server answered 304 Not Modified), ETag and Last-Modified.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    with timed("page_fetch", url=url, mode="conditional") as event:
+        response = http_get(url, headers=headers)
+        event["status"] = response.status_code
+        if headers and response.status_code == 304:
+            return None, etag, last_modified
+        response.raise_for_status()
+        event["bytes"] = len(response.content)
+    return response.text, response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+
+def fetch_article_document(url, fetch_mode="render", browser_context=None, on_progress=None):
+    """Fetch an article exactly once and parse it.
+
+    In auto mode the static page is used when it holds the article, and returned as
+    parsed for the content check, so it is not parsed a second time. The page is
+    rendered when it does not, or when it fails with one of `STATIC_PAGE_ERRORS`.
+    `AsyncConverter.fetch_document` follows the same rule.
+
+    Args:
+        url (str): url of the article.
+        fetch_mode (str, optional): "render", "static" or "auto", see `fetch_article_html`.
+        browser_context (BrowserContext, optional): Playwright context used in render mode.
+        on_progress (function, optional): Called with (bytes received, total bytes) once fetched.
+
+    Returns:
+        ArticleDocument: the parsed page.
+    """
+    if fetch_mode not in FETCH_MODES:
+        raise ValueError(f"Unknown fetch mode: {fetch_mode!r} (expected one of {', '.join(FETCH_MODES)})")
+
+    document = None
+    if fetch_mode != "render":
+        try:
+            document = ArticleDocument(fetch_static_html(url), url)
+        except STATIC_PAGE_ERRORS:
+            if fetch_mode == "static":
+                raise
+        if fetch_mode == "auto" and document is not None and not document.has_article_content():
+            document = None
+    if document is None:
+        document = ArticleDocument(fetch_rendered_html(url, browser_context), url)
+
+    if on_progress is not None:
+        size = len(document.page_content.encode('utf-8'))
+        on_progress(size, size)
+    return document
+
+
+def fetch_article_html(url, fetch_mode="render", browser_context=None, on_progress=None):
+    """Fetch the HTML of an article exactly once.
+
+    Args:
+        url (str): url of the article.
+        fetch_mode (str, optional): "render" to load the page in Chromium, "static" to use
+            the HTML served by the server and skip the browser, or "auto" to use the static
+            HTML when it holds the article and render the page otherwise. Defaults to "render".
+        browser_context (BrowserContext, optional): Playwright context used in render mode.
+        on_progress (function, optional): Called with (bytes received, total bytes) once fetched.
+
+    Returns:
+        str: page content.
     """
-    def get_page_content_and_media_urls(url):
-        """Fetches the page content and media urls from a given url.
+    return fetch_article_document(url, fetch_mode, browser_context, on_progress).page_content
+
+
+class ArticleDocument:
+    """The parsed HTML of an article, shared by every step that needs the DOM.
+
+    The page is parsed once with lxml. Media discovery, the static-content check,
+    src rewriting and readability extraction all work on this one tree (readability
+    on a cleaned copy of it), so rewritten image sources reach the extracted content.
+
+    Args:
+        page_content (str): HTML of the page.
+        base_url (str, optional): url the page was fetched from; relative links are made absolute.
+
+    Raises:
+        lxml.etree.ParserError: If the page holds no HTML at all.
+    """
+
+    def __init__(self, page_content, base_url=None):
+        self.page_content = page_content
+        self.tree, _ = build_doc(page_content)
+        if base_url:
+            self.tree.make_links_absolute(base_url, resolve_base_href=True, handle_failures="discard")
+        self._embedded = False
+
+    def media_urls(self):
+        """List the urls of all images, in document order.
+
+        Returns:
+            list: media urls.
+        """
+        return [img.get('src') for img in self.tree.iter('img') if img.get('src')]
+
+    def has_article_content(self, min_length=MIN_ARTICLE_TEXT):
+        """Tell whether the page holds the text of its article, as markup or as embedded JSON.
+
+        Args:
+            min_length (int, optional): Characters of text the <article> elements must hold together.
+
+        Returns:
+            bool: True if the page does not need to be rendered.
+        """
+        if self.embedded_markdown() is not None:
+            return True
+        return sum(len(article.text_content().strip()) for article in self.tree.iter('article')) >= min_length
+
+    def embedded_markdown(self):
+        """Render the article from the post Medium embeds in the page as JSON (its Apollo state).
+
+        This needs neither a browser nor readability's heuristics. The result is
+        computed once.
+
+        Returns:
+            tuple: article title and article markdown, or None if the page embeds no post body.
+        """
+        if self._embedded is False:
+            self._embedded = None
+            state = find_state(script.text for script in self.tree.iter('script'))
+            post = find_post(state) if state is not None else None
+            if post is not None:
+                self._embedded = (post.title, post_markdown(state, post))
+        return self._embedded
+
+    def article_node(self):
+        """Find the <article> element holding the post.
+
+        Returns:
+            lxml.html.HtmlElement: The element, or None if the page has no <article> with text.
+        """
+        return find_article_node(self.tree)
+
+    def extract_article_node(self):
+        """Take the title and content of the article straight from its <article> element.
+
+        This is what the Medium-aware emitter converts, so readability is not needed.
+
+        Returns:
+            tuple: article title and article content (HTML), or None if the page has no <article> with text.
+        """
+        node = self.article_node()
+        if node is None:
+            return None
+        title = heading_title(node) or (self.tree.findtext('.//title') or '').strip() or '[no-title]'
+        return title, lxml.html.tostring(node, encoding='unicode')
+
+    def article_markdown(self, title, content=None):
+        """Convert the article with the Medium-aware emitter (see `medium_markdown`).
+
+        Only the <article> element is walked. Pages without one fall back to the
+        readability content.
 
         Args:
-            url (str): url of the webpage.
+            title (str): Title of the article.
+            content (str, optional): Main content of the article (HTML), used without an <article>.
 
         Returns:
-            tuple: page content and list of media urls.
+            str: The markdown of the article.
         """
-        with sync_playwright() as p:
-            browser = p.chromium.launch()
-            page = browser.new_page()
-            page.route("**", lambda route, request: route.continue_())
-            page.goto(url)
-            page.wait_for_load_state()
-            page_content = page.content()
-            browser.close()
+        node = self.article_node()
+        if node is None:
+            node = lxml.html.fragment_fromstring(content or '', create_parent='div')
+        return article_markdown(node, title)
+
+    def rewrite_media(self, local_paths):
+        """Point images at their local copies.
 
-        soup = BeautifulSoup(page_content, 'html.parser')
-        media_urls = [urljoin(url, img['src']) for img in soup.find_all('img')]
+        Args:
+            local_paths (MediaIndex): Local path by media url (a dict works too, matching urls exactly).
+
+        Returns:
+            int: Number of rewritten images.
+        """
+        rewritten = 0
+        for img in self.tree.iter('img'):
+            src = img.get('src')
+            local_path = local_paths.get(src) if src else None
+            if local_path is not None:
+                img.set('src', local_path)
+                rewritten += 1
+        return rewritten
+
+    def extract(self):
+        """Extract the title and main content of the article with readability.
+
+        Returns:
+            tuple: article title and article content (HTML).
+        """
+        doc = _TreeDocument(self.tree)
+        return doc.title(), doc.summary()
+
+    def html(self):
+        """Serialize the (possibly rewritten) page.
+
+        Returns:
+            str: page content.
+        """
+        return lxml.html.tostring(self.tree, encoding='unicode')
 
-        return page_content, media_urls
 
+class _TreeDocument(Document):
+    """readability Document that starts from an already parsed tree instead of a string.
+
+    readability mutates the tree it works on; `clean_html` hands it a copy, so the
+    article's tree stays intact.
+    """
+
+    def _parse(self, input):
+        self.encoding = 'utf-8'
+        return html_cleaner.clean_html(input)
+
+
+def has_article_content(page_content, min_length=MIN_ARTICLE_TEXT):
+    """Tell whether a page already holds the text of its article, without running scripts.
+
+    Args:
+        page_content (str): HTML of the page.
+        min_length (int, optional): Characters of text the <article> elements must hold together.
+
+    Returns:
+        bool: True if the page does not need to be rendered.
+    """
+    if not page_content or not page_content.strip():
+        return False
     try:
-        output_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "output")
-        if os.path.exists(output_folder):
-            shutil.rmtree(output_folder)
+        return ArticleDocument(page_content).has_article_content(min_length)
+    except (lxml.etree.ParserError, ValueError):
+        return False
 
-        page_content, media_urls = get_page_content_and_media_urls(article_url)
 
-        response = requests.get(article_url)
-        response.raise_for_status()
+def compose_article_html(page_content, article_title, article_content):
+    """Build the HTML document that is converted to markdown.
 
-        doc = Document(response.text)
-        article_title = doc.title()
-        article_content = doc.summary()
+    Args:
+        page_content (str): HTML of the page.
+        article_title (str): Title of the article.
+        article_content (str): Main content of the article (HTML).
+
+    Returns:
+        str: page content followed by the titled article content.
+    """
+    return page_content + "\n\n" + "# " + article_title + "\n\n" + article_content
+
+
+def download_medium_article(article_url, output_folder, browser_context=None, fetch_mode="render", fetcher=None):
+    """Download a Medium article and its associated media files.
+
+    The page is fetched and parsed once; the same tree feeds media discovery, src
+    rewriting and readability.
+
+    Args:
+        article_url (str): URL of the Medium article.
+        output_folder (str): Folder the article and its media are written to.
+        browser_context (BrowserContext, optional): Long-lived Playwright context to
+            render the page in. When omitted a browser is launched for this article only.
+        fetch_mode (str, optional): "render", "static" or "auto", see `fetch_article_html`.
+        fetcher (MediaFetcher, optional): Fetcher used for the images. Defaults to the shared one.
+
+    Returns:
+        bool: True if the article and media files were downloaded successfully, False otherwise.
+    """
+    try:
+        if os.path.exists(output_folder):
+            shutil.rmtree(output_folder)
+
+        document = fetch_article_document(article_url, fetch_mode, browser_context)
+        media_urls = unique_image_urls(document.media_urls())
 
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
 
-        media_folder = os.path.join(output_folder, "media")
-        if not os.path.exists(media_folder):
-            os.makedirs(media_folder)
+        # Images go straight to where the final markdown links to, so later stages
+        # (`url_to_local`) find them local and download nothing again
+        os.makedirs(os.path.join(output_folder, LOCAL_MEDIA_FOLDER), exist_ok=True)
 
         valid_image_extensions = ['.jpg', '.jpeg', '.png', '.gif']
 
-        media_files = {}
-        for idx, media_url in enumerate(media_urls):
-            media_extension = os.path.splitext(media_url.split("/")[-1])[1]
-            media_filename = f"media_{idx+1}{media_extension}"
-            media_file = os.path.join(media_folder, media_filename)
-            if media_extension.lower() in valid_image_extensions:
-                try:
-                    response = requests.get(media_url, stream=True)
-                    response.raise_for_status()
-                    with open(media_file, 'wb') as out_file:
-                        shutil.copyfileobj(response.raw, out_file)
-                    del response
-                    media_files[media_filename] = media_url
-                except Exception as e:
-                    print(f"Could not download: {media_url}")
-                    print(f"Error: {e}")
-
-        for img in BeautifulSoup(article_content, 'html.parser').find_all('img'):
-            img_src = img['src']
-            for media_filename, media_url in media_files.items():
-                if media_url == urljoin(article_url, img_src):
-                    img['src'] = f"./media/{media_filename}"
-                    break
+        jobs = []
+        for media_url in media_urls:
+            media_path = local_media_path(media_url)
+            if os.path.splitext(media_path)[1].lower() in valid_image_extensions:
+                jobs.append((media_url, os.path.join(output_folder, media_path)))
+
+        local_paths = MediaIndex()
+        for result in (fetcher or shared_fetcher()).fetch_all(jobs):
+            if result.error is None:
+                local_paths.add(result.url, os.path.relpath(result.path, output_folder))
+            else:
+                print(f"Could not download: {result.url}")
+                print(f"Error: {result.error}")
+
+        # Rewrite the sources in the parsed page before extraction, so both the page
+        # and the extracted article point at the local copies
+        document.rewrite_media(local_paths)
+        article_title, article_content = document.extract()
 
         markdown_file = os.path.join(output_folder, f"{article_title}.md")
         with open(markdown_file, 'w', encoding='utf-8') as f:
-            f.write(page_content)
-            f.write("\n\n")
-            f.write("# " + article_title + "\n\n")
-            f.write(article_content)
+            f.write(compose_article_html(document.html(), article_title, article_content))
 
         # print("Medium article downloaded successfully!")
         # print(f"Article saved as: {markdown_file}")
-        # print(f"Media files saved in: {media_folder}")
+        # print(f"Media files saved in: {os.path.join(output_folder, LOCAL_MEDIA_FOLDER)}")
 
         return True
 
@@ -0,0 +1,186 @@
+import json
+import re
+from collections import namedtuple
+
+
+# Medium's server HTML preloads the Apollo GraphQL cache with the whole post
+STATE_ASSIGNMENT = re.compile(r"window\.__APOLLO_STATE__\s*=\s*")
+
+# Width images are linked at, as Medium serves them in the article
+IMAGE_URL = "https://miro.medium.com/v2/resize:fit:1400/{}"
+
+# A post read from the embedded state: its title and its body paragraphs, resolved
+EmbeddedPost = namedtuple("EmbeddedPost", ["id", "title", "paragraphs"])
+
+# Markdown around the text of each inline markup type
+INLINE_MARKUPS = {"STRONG": ("**", "**"), "EM": ("*", "*"), "CODE": ("`", "`")}
+
+HEADINGS = {"H1": "#", "H2": "##", "H3": "##", "H4": "###"}
+
+
+def find_state(scripts):
+    """
+    Find the Apollo state among the scripts of a page and decode it.
+
+    Args:
+        scripts (iter): The text of each <script> element.
+
+    Returns:
+        dict: The state, by cache key ("Post:<id>", "Paragraph:<id>", ...), or None.
+    """
+    decoder = json.JSONDecoder()
+    for script in scripts:
+        match = STATE_ASSIGNMENT.search(script or "")
+        if match is None:
+            continue
+        try:
+            state, _ = decoder.raw_decode(script, match.end())
+        except ValueError:
+            return None
+        return state if isinstance(state, dict) else None
+    return None
+
+
+def _resolve(state, value):
+    if isinstance(value, dict) and "__ref" in value:
+        return state.get(value["__ref"]) or {}
+    return value or {}
+
+
+def find_post(state):
+    """
+    Read the post out of an Apollo state.
+
+    Args:
+        state (dict): The decoded state.
+
+    Returns:
+        EmbeddedPost: The post, or None if the state holds no post body (a paywalled
+            or unusual page), in which case the page has to be rendered.
+    """
+    for key, post in state.items():
+        if not key.startswith("Post:") or not isinstance(post, dict):
+            continue
+        for field, content in post.items():
+            if not field.startswith("content"):
+                continue
+            body = _resolve(state, _resolve(state, content).get("bodyModel"))
+            paragraphs = [_resolve(state, paragraph) for paragraph in body.get("paragraphs") or []]
+            if paragraphs:
+                return EmbeddedPost(post.get("id") or key[len("Post:"):], post.get("title") or "", paragraphs)
+    return None
+
+
+def apply_markups(text, markups):
+    """
+    Turn the inline markups of a paragraph (bold, italics, code, links) into Markdown.
+
+    Args:
+        text (str): The paragraph text.
+        markups (list): Markups with a type, start and end offset (in UTF-16 code units), and
+            an href for links.
+
+    Returns:
+        str: The Markdown text.
+    """
+    insertions = []
+    for markup in markups or []:
+        start, end = markup.get("start", 0), markup.get("end", 0)
+        if markup.get("type") == "A":
+            opening, closing = "[", f"]({markup.get('href') or ''})"
+        elif markup.get("type") in INLINE_MARKUPS:
+            opening, closing = INLINE_MARKUPS[markup["type"]]
+        else:
+            continue
+        if start >= end:
+            continue
+        # At one offset, markups that end are closed before others are opened
+        insertions.append((start, 1, -end, opening))
+        insertions.append((end, 0, -start, closing))
+    # The offsets count UTF-16 code units, as JavaScript strings do, so characters
+    # outside the Basic Multilingual Plane (most emoji) count twice
+    units = text.encode("utf-16-le")
+    pieces, position = [], 0
+    for offset, _, _, token in sorted(insertions):
+        pieces.append(units[2 * position:2 * offset])
+        pieces.append(token.encode("utf-16-le"))
+        position = offset
+    pieces.append(units[2 * position:])
+    return b"".join(pieces).decode("utf-16-le", errors="replace")
+
+
+def paragraph_markdown(state, paragraph, list_number=1):
+    """
+    Render one paragraph of a post as Markdown.
+
+    Args:
+        state (dict): The decoded state, to resolve image and embed references.
+        paragraph (dict): The paragraph.
+        list_number (int, optional): Number of the item in an ordered list.
+
+    Returns:
+        str: The Markdown block, or None for paragraphs without a Markdown form.
+    """
+    kind = paragraph.get("type")
+    text = paragraph.get("text") or ""
+    if kind == "PRE":
+        language = _resolve(state, paragraph.get("codeBlockMetadata")).get("lang") or ""
+        return f"```{language}\n{text}\n```"
+    if kind == "IMG":
+        image_id = _resolve(state, paragraph.get("metadata")).get("id")
+        if not image_id:
+            return None
+        caption = apply_markups(text, paragraph.get("markups"))
+        return f"![]({IMAGE_URL.format(image_id)})" + (f"\n\n*{caption}*" if caption else "")
+
+    text = apply_markups(text, paragraph.get("markups"))
+    if kind in HEADINGS:
+        return f"{HEADINGS[kind]} {text}"
+    if kind in ("BQ", "PQ"):
+        return "\n".join(f"> {line}" for line in text.split("\n"))
+    if kind == "ULI":
+        return f"- {text}"
+    if kind == "OLI":
+        return f"{list_number}. {text}"
+    if kind == "MIXTAPE_EMBED":
+        href = _resolve(state, paragraph.get("mixtapeMetadata")).get("href")
+        return f"[{paragraph.get('text') or href}]({href})" if href else text
+    if kind == "IFRAME":
+        resource = _resolve(state, _resolve(state, paragraph.get("iframe")).get("mediaResource"))
+        href = resource.get("href") or resource.get("iframeSrc")
+        return f"[{resource.get('title') or text or href}]({href})" if href else None
+    return text
+
+
+def post_markdown(state, post):
+    """
+    Render a post as Markdown: its title, then every paragraph in order.
+
+    The first paragraph repeats the title on Medium, and is skipped.
+
+    Args:
+        state (dict): The decoded state.
+        post (EmbeddedPost): The post.
+
+    Returns:
+        str: The Markdown of the article.
+    """
+    paragraphs = list(post.paragraphs)
+    if paragraphs and paragraphs[0].get("type") in HEADINGS and paragraphs[0].get("text") == post.title:
+        paragraphs.pop(0)
+
+    blocks = [f"# {post.title}"]
+    list_number, previous = 0, None
+    for paragraph in paragraphs:
+        kind = paragraph.get("type")
+        list_number = list_number + 1 if kind == "OLI" and previous == "OLI" else 1
+        block = paragraph_markdown(state, paragraph, list_number)
+        if block is None:
+            continue
+        # Items of one list are not separated by blank lines
+        if kind in ("ULI", "OLI") and previous == kind:
+            blocks[-1] += "\n" + block
+        else:
+            blocks.append(block)
+        previous = kind
+    return "\n\n".join(blocks) + "\n"
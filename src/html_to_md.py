@@ -1,13 +1,96 @@
 import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import html2text
 
+# How articles are converted to markdown: html2text over the composed page (cleaned up
+# afterwards by `clean_md`), or the Medium-aware emitter walking only the article
+# element (see `medium_markdown`)
+CONVERTER_ENGINES = ("html2text", "lxml")
 
-def convert_html_to_markdown(output_folder):
+
+def create_converter():
+    """
+    Create an html2text converter configured the way medium2md uses it.
+
+    Returns:
+        html2text.HTML2Text: The converter.
+    """
+    h = html2text.HTML2Text()
+    # Configure html2text to ignore converting links from HTML.
+    h.ignore_links = True
+    return h
+
+
+def html_to_markdown(html_content, converter=None):
+    """
+    Convert an HTML string to markdown.
+
+    Args:
+        html_content (str): The HTML to convert.
+        converter (html2text.HTML2Text, optional): Converter to use. A new one is created if omitted.
+            html2text keeps parser state (open lists, quotes, pre blocks) between documents,
+            so a converter should not be reused when the output has to be reproducible.
+
+    Returns:
+        str: The markdown content.
+    """
+    return (converter or create_converter()).handle(html_content)
+
+
+def convert_file(md_file_path):
+    """
+    Convert one file holding HTML to markdown in place.
+
+    Args:
+        md_file_path (str): The path of the file.
+
+    Returns:
+        str: The path of the file.
+    """
+    # Open the markdown file in read mode and read its HTML content.
+    with open(md_file_path, 'r') as f:
+        html_content = f.read()
+
+    # Convert the HTML content to markdown.
+    markdown_content = html_to_markdown(html_content)
+
+    # Open the markdown file in write mode and overwrite it with the markdown content.
+    with open(md_file_path, 'w') as f:
+        f.write(markdown_content)
+
+    return md_file_path
+
+
+def create_process_pool(jobs):
+    """
+    Create a pool of worker processes for HTML to markdown conversion.
+
+    Workers are spawned rather than forked so the pool is safe to start from a
+    process that already runs threads (batch workers, media downloads).
+
+    Args:
+        jobs (int): Number of worker processes.
+
+    Returns:
+        ProcessPoolExecutor: The pool.
+    """
+    return ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"))
+
+
+def convert_html_to_markdown(output_folder, on_progress=None, jobs=1):
     """
     Convert HTML files in the output folder to markdown format.
 
+    With more than one job the files are sharded across worker processes in
+    chunks; the output is identical to the serial path because every file is
+    converted with fresh converter state.
+
     Args:
         output_folder (str): The path to the output folder containing the HTML files.
+        on_progress (function, optional): Called with (files converted, total files).
+        jobs (int, optional): Number of processes to convert with. Defaults to 1 (no pool).
 
     Returns:
         None
@@ -15,31 +98,62 @@ def convert_html_to_markdown(output_folder):
     # Get a list of all files in the output directory.
     all_files = os.listdir(output_folder)
 
-    # Filter out the list to only have .md files.
-    markdown_files = [file for file in all_files if file.endswith('.md')]
+    # Filter out the list to only have .md files, and construct their full paths.
+    md_file_paths = [os.path.join(output_folder, file) for file in sorted(all_files) if file.endswith('.md')]
 
-    # Initialize html2text converter.
-    h = html2text.HTML2Text()
-    # Configure html2text to ignore converting links from HTML.
-    h.ignore_links = True
+    if jobs > 1 and len(md_file_paths) > 1:
+        # Hand each worker a few chunks, so slow files do not leave the others idle.
+        chunksize = max(1, len(md_file_paths) // (jobs * 4))
+        with create_process_pool(jobs) as executor:
+            converted = executor.map(convert_file, md_file_paths, chunksize=chunksize)
+            for done, _ in enumerate(converted, 1):
+                if on_progress is not None:
+                    on_progress(done, len(md_file_paths))
+    else:
+        # Loop over each .md file and convert its contents from HTML to markdown.
+        for done, md_file_path in enumerate(md_file_paths, 1):
+            convert_file(md_file_path)
+            if on_progress is not None:
+                on_progress(done, len(md_file_paths))
+
+    # print("Conversion to Markdown is complete.")
 
-    # Loop over each .md file and convert its contents from HTML to markdown.
-    for md_file in markdown_files:
-        # Construct the full file path by joining the file name with the output directory path.
-        md_file_path = os.path.join(output_folder, md_file)
 
-        # Open the markdown file in read mode and read its HTML content.
-        with open(md_file_path, 'r') as f:
-            html_content = f.read()
+_conversion_pool = None
+_conversion_lock = threading.Lock()
 
-        # Convert the HTML content to markdown.
-        markdown_content = h.handle(html_content)
 
-        # Open the markdown file in write mode and overwrite it with the markdown content.
-        with open(md_file_path, 'w') as f:
-            f.write(markdown_content)
+def configure_conversion_pool(jobs):
+    """
+    Set how many processes `convert_html` uses. One job converts in the calling thread.
 
-    # print("Conversion to Markdown is complete.")
+    Args:
+        jobs (int): Number of worker processes.
+    """
+    global _conversion_pool
+    with _conversion_lock:
+        if _conversion_pool is not None:
+            _conversion_pool.shutdown(wait=True)
+        _conversion_pool = create_process_pool(jobs) if jobs > 1 else None
+
+
+def convert_html(html_content):
+    """
+    Convert an HTML string to markdown, in the conversion pool if one is configured.
+
+    Batch workers are threads, so this keeps the CPU-bound conversion of many
+    articles from being serialised by the GIL.
+
+    Args:
+        html_content (str): The HTML to convert.
+
+    Returns:
+        str: The markdown content.
+    """
+    pool = _conversion_pool
+    if pool is None:
+        return html_to_markdown(html_content)
+    return pool.submit(html_to_markdown, html_content).result()
 
 
 # if __name__ == "__main__":
@@ -0,0 +1,348 @@
+import json
+import time
+import socket
+import functools
+import threading
+from contextlib import contextmanager
+
+# Custom modules
+from .clean_md import write_text_atomic
+
+
+# Every emitted event goes to each of these; with none registered, emitting costs one check.
+_sinks = []
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink):
+    """
+    Start sending events to a sink.
+
+    Args:
+        sink (function): Called with every event (a dict with at least "event" and "ts").
+
+    Returns:
+        function: The sink, so it can be removed later.
+    """
+    with _sinks_lock:
+        _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    """
+    Stop sending events to a sink, and close it if it can be closed.
+
+    Args:
+        sink (function): A sink added with `add_sink`.
+    """
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+    if hasattr(sink, "close"):
+        sink.close()
+
+
+def emit(event, **fields):
+    """
+    Send a structured event to every sink.
+
+    Args:
+        event (str): Name of the event ("stage", "page_fetch", "media_fetch", ...).
+        **fields: Event data: durations in seconds, sizes in bytes, counts, labels.
+    """
+    if not _sinks:
+        return
+    record = {"event": event, "ts": time.time()}
+    record.update(fields)
+    for sink in list(_sinks):
+        sink(record)
+
+
+@contextmanager
+def timed(event, **fields):
+    """
+    Time a block and emit an event with its duration when it ends.
+
+    The yielded dict can be filled with more fields (bytes, images, ...) while the
+    block runs. A failing block is reported with its error and re-raised.
+
+    Args:
+        event (str): Name of the event.
+        **fields: Fields of the event known up front (url, mode, ...).
+    """
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    extra = {}
+    try:
+        yield extra
+    except BaseException as e:
+        extra["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        fields.update(extra)
+        emit(event, duration=time.perf_counter() - wall_start, cpu=time.process_time() - cpu_start,
+             ok="error" not in extra, **fields)
+
+
+def stage(name, **fields):
+    """
+    Time a conversion stage, see `timed`.
+
+    Args:
+        name (str): Name of the stage.
+        **fields: Fields of the event known up front.
+    """
+    return timed("stage", stage=name, **fields)
+
+
+def instrumented(name, measure=None):
+    """
+    Decorate a pipeline stage so every call emits a "stage" event.
+
+    Args:
+        name (str): Name of the stage.
+        measure (function, optional): Called with the stage's result, returns extra
+            event fields (bytes, images, ...).
+
+    Returns:
+        function: The decorator.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(article, *args, **kwargs):
+            with stage(name, url=article.url) as extra:
+                result = func(article, *args, **kwargs)
+                if measure is not None and _sinks:
+                    extra.update(measure(result))
+                return result
+        return wrapper
+    return decorator
+
+
+def _article_result(record):
+    if not record.get("ok", True):
+        return "failed"
+    return "skipped" if record.get("skipped") else "converted"
+
+
+class JsonLinesSink:
+    """
+    Write every event as one JSON object per line.
+
+    Args:
+        path (str): The log file, appended to.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class MetricsRegistry:
+    """
+    Aggregate events into counters and summaries, and render them for Prometheus.
+
+    Stage events become `medium2md_stage_seconds` summaries (and an errors
+    counter) labelled by stage; article events an `articles_total` counter
+    labelled by result; fetch events become request, byte, cache and retry
+    counters labelled by kind.
+    """
+
+    def __init__(self, namespace="medium2md"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.summaries = {}
+
+    def _count(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        count, total = self.summaries.get(key, (0, 0.0))
+        self.summaries[key] = (count + 1, total + value)
+
+    def __call__(self, record):
+        with self._lock:
+            if record["event"] == "stage":
+                labels = {"stage": record["stage"]}
+                self._observe("stage_seconds", labels, record["duration"])
+                if not record.get("ok", True):
+                    self._count("stage_errors_total", labels)
+                if "images" in record:
+                    self._count("images_total", {}, record["images"])
+            elif record["event"] == "article":
+                self._count("articles_total", {"result": _article_result(record)})
+                self._observe("article_seconds", {}, record["duration"])
+            elif record["event"] in ("page_fetch", "media_fetch"):
+                labels = {"kind": record["event"][:-len("_fetch")]}
+                self._count("fetches_total", labels)
+                self._observe("fetch_seconds", labels, record.get("duration", 0.0))
+                self._count("fetched_bytes_total", labels, record.get("bytes", 0))
+                self._count("fetch_retries_total", labels, record.get("retries", 0))
+                if record.get("error"):
+                    self._count("fetch_errors_total", labels)
+                if "cache" in record:
+                    self._count("media_cache_total", {"result": record["cache"]})
+
+    def prometheus_text(self):
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        def series(name, labels):
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            return f"{self.namespace}_{name}" + (f"{{{label_text}}}" if label_text else "")
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {self.namespace}_{name} counter")
+                for (key_name, labels), value in sorted(self.counters.items()):
+                    if key_name == name:
+                        lines.append(f"{series(name, labels)} {value}")
+            for name in sorted({name for name, _ in self.summaries}):
+                lines.append(f"# TYPE {self.namespace}_{name} summary")
+                for (key_name, labels), (count, total) in sorted(self.summaries.items()):
+                    if key_name == name:
+                        lines.append(f"{series(name + '_count', labels)} {count}")
+                        lines.append(f"{series(name + '_sum', labels)} {total:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusFileSink(MetricsRegistry):
+    """
+    Keep metrics and write them to a text file, for node_exporter's textfile collector.
+
+    The file is rewritten atomically at most every `interval` seconds and on close.
+
+    Args:
+        path (str): The .prom file.
+        interval (float, optional): Seconds between rewrites. Defaults to 10.
+    """
+
+    def __init__(self, path, interval=10.0, namespace="medium2md"):
+        super().__init__(namespace)
+        self.path = path
+        self.interval = interval
+        self._written_at = 0.0
+
+    def __call__(self, record):
+        super().__call__(record)
+        if time.monotonic() - self._written_at >= self.interval:
+            self.write()
+
+    def write(self):
+        self._written_at = time.monotonic()
+        write_text_atomic(self.path, self.prometheus_text())
+
+    def close(self):
+        self.write()
+
+
+class StatsdSink:
+    """
+    Send events as StatsD metrics over UDP: stage, article and fetch timings as
+    timers; bytes, retries, errors, article results and cache results as counters.
+
+    Args:
+        host (str, optional): StatsD host. Defaults to "127.0.0.1".
+        port (int, optional): StatsD port. Defaults to 8125.
+        prefix (str, optional): Metric name prefix. Defaults to "medium2md".
+    """
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="medium2md"):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _metrics(self, record):
+        if record["event"] == "stage":
+            name = f"{self.prefix}.stage.{record['stage']}"
+            yield f"{name}.duration:{record['duration'] * 1000:.3f}|ms"
+            if not record.get("ok", True):
+                yield f"{name}.errors:1|c"
+            if record.get("images"):
+                yield f"{self.prefix}.images:{record['images']}|c"
+        elif record["event"] == "article":
+            yield f"{self.prefix}.article.duration:{record['duration'] * 1000:.3f}|ms"
+            yield f"{self.prefix}.articles.{_article_result(record)}:1|c"
+        elif record["event"] in ("page_fetch", "media_fetch"):
+            name = f"{self.prefix}.{record['event']}"
+            yield f"{name}.duration:{record.get('duration', 0.0) * 1000:.3f}|ms"
+            yield f"{name}.bytes:{record.get('bytes', 0)}|c"
+            if record.get("retries"):
+                yield f"{name}.retries:{record['retries']}|c"
+            if record.get("error"):
+                yield f"{name}.errors:1|c"
+            if "cache" in record:
+                yield f"{name}.cache.{record['cache']}:1|c"
+
+    def __call__(self, record):
+        payload = "\n".join(self._metrics(record))
+        if payload:
+            try:
+                self._socket.sendto(payload.encode('utf-8'), self.address)
+            except OSError:
+                # Metrics must never break a conversion
+                pass
+
+    def close(self):
+        self._socket.close()
+
+
+def parse_statsd_address(address):
+    """
+    Read the address of a StatsD server.
+
+    Args:
+        address (str): "host:port", or ":port" and "port" for this machine.
+
+    Returns:
+        tuple: The host and the port.
+
+    Raises:
+        ValueError: If the port is not a number between 1 and 65535.
+    """
+    host, _, port = address.strip().rpartition(":")
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"Not a StatsD address (HOST:PORT): {address!r}")
+    return host or "127.0.0.1", int(port)
+
+
+def configure_instrumentation(jsonl_path=None, prometheus_path=None, statsd_address=None):
+    """
+    Set up the sinks the CLI offers.
+
+    Args:
+        jsonl_path (str, optional): Append events to this JSON-lines file.
+        prometheus_path (str, optional): Write Prometheus metrics to this file.
+        statsd_address (str, optional): "host:port" of a StatsD server, or the (host, port)
+            tuple `parse_statsd_address` returns.
+
+    Returns:
+        list: The sinks added, to pass to `remove_sink` when done.
+    """
+    sinks = []
+    if jsonl_path:
+        sinks.append(add_sink(JsonLinesSink(jsonl_path)))
+    if prometheus_path:
+        sinks.append(add_sink(PrometheusFileSink(prometheus_path)))
+    if statsd_address:
+        if isinstance(statsd_address, str):
+            statsd_address = parse_statsd_address(statsd_address)
+        sinks.append(add_sink(StatsdSink(*statsd_address)))
+    return sinks
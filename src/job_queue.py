@@ -0,0 +1,231 @@
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from itertools import islice
+
+
+JOB_QUEUE_FILENAME = "jobs.sqlite3"
+
+# States of a job
+PENDING = "pending"
+FETCHING = "fetching"
+CONVERTED = "converted"
+FAILED = "failed"
+
+# URLs inserted per transaction while a URL stream is added
+ADD_CHUNK_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    url TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    output_folder TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, next_attempt_at, position);
+"""
+
+
+class JobQueue:
+    """
+    Durable queue of the URLs of a batch, kept in a SQLite database.
+
+    Every URL moves from `pending` to `fetching` when a worker takes it, then to
+    `converted`, or back to `pending` with an exponential backoff after a failure,
+    until `max_attempts` failures mark it `failed`. Each transition is committed
+    before the batch goes on, so a run that is killed resumes where it stopped:
+    jobs left `fetching` by a dead run are pending again when the queue is opened.
+    """
+
+    def __init__(self, path, max_attempts=3, backoff=30.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        with self._transaction():
+            self._db.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE state = ?",
+                             (PENDING, time.time(), FETCHING))
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so a claim cannot race another connection
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def add(self, urls):
+        """
+        Queue URLs that are not in the queue yet; known URLs keep their state.
+
+        URLs are consumed lazily and committed in chunks.
+
+        Args:
+            urls (iter): The article URLs.
+
+        Returns:
+            int: The number of URLs added.
+        """
+        added = 0
+        urls = iter(urls)
+        while True:
+            chunk = list(islice(urls, ADD_CHUNK_SIZE))
+            if not chunk:
+                return added
+            with self._lock, self._transaction():
+                position = self._db.execute("SELECT COALESCE(MAX(position), -1) FROM jobs").fetchone()[0]
+                now = time.time()
+                for url in chunk:
+                    position += 1
+                    cursor = self._db.execute(
+                        "INSERT OR IGNORE INTO jobs (url, position, state, updated_at) VALUES (?, ?, ?, ?)",
+                        (url, position, PENDING, now))
+                    added += cursor.rowcount
+
+    def claim(self):
+        """
+        Take the next job that is ready to run and mark it `fetching`.
+
+        Returns:
+            str: The URL of the job, or None if no job is ready.
+        """
+        with self._lock, self._transaction():
+            row = self._db.execute(
+                "SELECT url FROM jobs WHERE state = ? AND next_attempt_at <= ? ORDER BY position LIMIT 1",
+                (PENDING, time.time())).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE url = ?",
+                             (FETCHING, time.time(), row[0]))
+            return row[0]
+
+    def claim_all(self, urls=(), poll_interval=0.5):
+        """
+        Add URLs to the queue as they come, and claim jobs one by one until it is drained.
+
+        URLs are added one at a time, and the next one is only read once every ready
+        job has been claimed, so conversion starts with the first URL of a slow stream
+        (discovery, or stdin) instead of waiting for more to arrive.
+        Jobs in backoff, and jobs still running (their failure may queue them again),
+        are waited for before stopping.
+
+        Args:
+            urls (iter, optional): URLs to add to the queue first.
+            poll_interval (float, optional): Longest wait between checks, in seconds. Defaults to 0.5.
+
+        Yields:
+            str: The URL of each claimed job.
+        """
+        for url in urls:
+            self.add([url])
+            url = self.claim()
+            while url is not None:
+                yield url
+                url = self.claim()
+
+        while True:
+            url = self.claim()
+            if url is not None:
+                yield url
+                continue
+            with self._lock:
+                waiting, next_attempt_at = self._db.execute(
+                    "SELECT COUNT(*), MIN(CASE WHEN state = ? THEN next_attempt_at END) FROM jobs "
+                    "WHERE state IN (?, ?)", (PENDING, PENDING, FETCHING)).fetchone()
+            if not waiting:
+                return
+            delay = poll_interval if next_attempt_at is None else next_attempt_at - time.time()
+            time.sleep(min(max(delay, 0.01), poll_interval))
+
+    def complete(self, url, output_folder=None):
+        """
+        Mark a job `converted`.
+
+        Args:
+            url (str): The URL of the job.
+            output_folder (str, optional): Where the article was written.
+        """
+        with self._lock, self._transaction():
+            self._db.execute("UPDATE jobs SET state = ?, error = NULL, output_folder = ?, updated_at = ? "
+                             "WHERE url = ?", (CONVERTED, output_folder, time.time(), url))
+
+    def fail(self, url, error):
+        """
+        Record a failed attempt: the job is retried after a backoff, or marked `failed`
+        once it has used all its attempts.
+
+        Args:
+            url (str): The URL of the job.
+            error (str): Why the attempt failed.
+
+        Returns:
+            bool: True if the job will be retried.
+        """
+        with self._lock, self._transaction():
+            attempts = self._db.execute("SELECT attempts FROM jobs WHERE url = ?", (url,)).fetchone()[0]
+            retry = attempts < self.max_attempts
+            now = time.time()
+            self._db.execute("UPDATE jobs SET state = ?, error = ?, next_attempt_at = ?, updated_at = ? "
+                             "WHERE url = ?",
+                             (PENDING if retry else FAILED, str(error),
+                              now + self.backoff * 2 ** (attempts - 1) if retry else 0, now, url))
+            return retry
+
+    def retry_failed(self):
+        """
+        Queue the `failed` jobs again, with all their attempts.
+
+        Returns:
+            int: The number of jobs queued again.
+        """
+        with self._lock, self._transaction():
+            return self._db.execute("UPDATE jobs SET state = ?, attempts = 0, next_attempt_at = 0, updated_at = ? "
+                                    "WHERE state = ?", (PENDING, time.time(), FAILED)).rowcount
+
+    def jobs(self, state=None):
+        """
+        List the jobs, in the order they were added.
+
+        Args:
+            state (str, optional): Only list the jobs in this state.
+
+        Returns:
+            list: (url, state, attempts, error) of every job.
+        """
+        query = "SELECT url, state, attempts, error FROM jobs"
+        params = ()
+        if state is not None:
+            query, params = query + " WHERE state = ?", (state,)
+        with self._lock:
+            return self._db.execute(query + " ORDER BY position", params).fetchall()
+
+    def counts(self):
+        """
+        Count the jobs in every state.
+
+        Returns:
+            dict: The number of jobs by state.
+        """
+        with self._lock:
+            return dict(self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
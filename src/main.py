@@ -1,21 +1,67 @@
 import argparse
+import atexit
+import itertools
 import os
+import sys
 import subprocess
 import shutil
-from termcolor import colored
-from tqdm import tqdm
-from PyInquirer import prompt as inquirer_prompt
-from time import sleep
-from pyfiglet import Figlet
-from colorama import init
+from time import perf_counter, process_time
 import requests
 
+if not __package__:
+    # Run as `python3 src/main.py`: load this folder as the `src` package, so the
+    # relative imports below resolve
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "src"
+
 # Custom modules
-from download_with_media import download_medium_article
-from html_to_md import convert_html_to_markdown
-from clean_md import process_markdown_files
-from url_to_local import url_to_local
-from clean_unnecessary_data import delete_unnecessary_data
+from .download_with_media import FETCH_MODES
+from .pipeline import (Article, article_folder_name, fetch, extract, convert, clean, prepare_output_folder,
+                       localize_images, save, publish, discard_work_folder)
+from .batch import read_urls, run_batch
+from .media_fetcher import configure_shared_fetcher
+from .page_cache import PAGE_CACHE_MODES, configure_page_cache, shared_page_cache, http_get
+from .html_to_md import CONVERTER_ENGINES, configure_conversion_pool
+from .manifest import Manifest, MANIFEST_FILENAME
+from .job_queue import JobQueue, JOB_QUEUE_FILENAME
+from .instrumentation import configure_instrumentation, parse_statsd_address, remove_sink
+from .discovery import discover, parse_source
+
+DEFAULT_OUTPUT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "output")
+
+
+# The terminal UI libraries (PyInquirer, pyfiglet, colorama, tqdm, termcolor) are imported
+# where they are used, so `--help` and batch workers do not pay for loading them.
+
+
+def colored(text, color=None, attrs=None):
+    """
+    Color text for the terminal.
+
+    Args:
+    text (str): The text to color.
+    color (str, optional): The color of the text. Defaults to None.
+    attrs (list, optional): Text attributes such as 'bold'. Defaults to None.
+
+    Returns:
+    str: The colored text.
+    """
+    from termcolor import colored as termcolor_colored
+    return termcolor_colored(text, color, attrs=attrs)
+
+
+def inquirer_prompt(questions):
+    """
+    Ask the given PyInquirer questions.
+
+    Args:
+    questions (list): The PyInquirer questions.
+
+    Returns:
+    dict: The answers, by question name.
+    """
+    from PyInquirer import prompt
+    return prompt(questions)
 
 
 def validate_url(url):
@@ -32,7 +78,8 @@ def validate_url(url):
         return False
 
     try:
-        response = requests.get(url)
+        # Through the page cache, so the conversion that follows reuses this response
+        response = http_get(url)
         return response.status_code == 200
     except requests.ConnectionError:
         return False
@@ -77,36 +124,67 @@ def print_message(message, color="white"):
     print(colored("\n" + message, color))
 
 
-def show_progress(iterable, desc=None):
+def show_progress(desc=None, unit='it'):
     """
-    Display a progress bar for the given iterable.
+    Display a progress bar that is advanced by the work it describes.
 
     Args:
-    iterable (iter): The iterable to display the progress for.
     desc (str, optional): The description of the progress. Defaults to None.
+    unit (str, optional): The unit of the progress. Defaults to 'it'.
 
     Returns:
-    iter: The tqdm iterator.
+    tqdm: The progress bar.
     """
-    return tqdm(iterable, desc=desc, dynamic_ncols=True, bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}')
+    from tqdm import tqdm
+    return tqdm(desc=desc, unit=unit, unit_scale=(unit == 'B'), dynamic_ncols=True,
+                bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}')
 
 
-def execute_with_progress(func, params, expected_time, description):
+def execute_stage(func, params, description, timings, unit=None):
     """
-    Execute a function with a progress bar.
+    Execute a stage, let it drive its own progress bar and record how long it took.
 
     Args:
-    func (function): The function to execute.
-    params (list): The parameters for the function.
-    expected_time (int): The expected time of the function execution.
+    func (function): The stage to execute.
+    params (list): The parameters for the stage.
     description (str): The description of the progress.
+    timings (list): (description, wall seconds, CPU seconds) is appended to it.
+    unit (str, optional): Unit of the progress reported by the stage through its
+        `on_progress` callback ('B', 'image', 'file'). If None the stage reports
+        nothing and the bar completes when it returns.
 
     Returns:
-    any: The result of the function execution.
+    any: The result of the stage.
+    """
+    with show_progress(description, unit or 'step') as bar:
+        def on_progress(done, total):
+            bar.total = total
+            bar.update(done - bar.n)
+
+        kwargs = {'on_progress': on_progress} if unit else {}
+        wall_start, cpu_start = perf_counter(), process_time()
+        try:
+            return func(*params, **kwargs)
+        finally:
+            timings.append((description, perf_counter() - wall_start, process_time() - cpu_start))
+            if unit is None:
+                bar.total = 1
+                bar.update(1)
+
+
+def print_timings(timings):
     """
-    for _ in show_progress(range(expected_time), description):
-        sleep(1)  # sleeping for 1 second
-    return func(*params)
+    Print the wall-clock and CPU time of every stage.
+
+    Args:
+    timings (list): (description, wall seconds, CPU seconds) tuples.
+    """
+    width = max([len(description) for description, _, _ in timings] + [len("Total")])
+    lines = [f"{'Stage':<{width}}  {'Wall (s)':>9}  {'CPU (s)':>9}"]
+    for description, wall, cpu in timings:
+        lines.append(f"{description:<{width}}  {wall:>9.2f}  {cpu:>9.2f}")
+    lines.append(f"{'Total':<{width}}  {sum(t[1] for t in timings):>9.2f}  {sum(t[2] for t in timings):>9.2f}")
+    print_message("\n".join(lines), "cyan")
 
 
 def open_file(file_path):
@@ -132,16 +210,142 @@ def open_file(file_path):
         raise EnvironmentError('Could not find a suitable application to open the file')
 
 
+def run_batch_mode(url_file, output_folder, workers, fetch_mode, incremental=False, resume=False,
+                   retry_failed=False, max_attempts=3, engine="html2text", sources=(), since=None):
+    """
+    Convert every URL listed in a file (or stdin), or discovered from authors, publications
+    and tags, and report the outcome per URL.
+
+    Args:
+    url_file (str): Path of the file with one URL per line, '-' for stdin, or None to
+        only run the discovered URLs and what is left in the job queue.
+    output_folder (str): The folder holding one sub-folder per article.
+    workers (int): Number of browser contexts to keep open.
+    fetch_mode (str): "render", "static" or "auto".
+    incremental (bool, optional): Skip articles unchanged since the last run, as recorded
+        in the manifest of the output folder. Defaults to False.
+    resume (bool, optional): Track the batch in the job queue of the output folder, so an
+        interrupted run continues where it stopped. Defaults to False.
+    retry_failed (bool, optional): Queue the URLs that failed in earlier runs again
+        (implies `resume`). Defaults to False.
+    max_attempts (int, optional): Attempts per URL before it is marked failed, with a queue.
+        Defaults to 3.
+    engine (str, optional): "html2text" or "lxml", how articles are converted to markdown.
+        Defaults to "html2text".
+    sources (list, optional): Authors, publications and tags to discover articles from
+        (see `discovery.discover`). Conversion starts while discovery is still paging.
+    since (int, optional): Oldest year to read archive pages for while discovering.
+
+    Returns:
+    int: The process exit code, 0 if every article was converted.
+    """
+    manifest = Manifest(os.path.join(output_folder, MANIFEST_FILENAME)) if incremental else None
+    job_queue = None
+    if resume or retry_failed:
+        os.makedirs(output_folder, exist_ok=True)
+        job_queue = JobQueue(os.path.join(output_folder, JOB_QUEUE_FILENAME), max_attempts=max_attempts)
+        if retry_failed:
+            print_message(f"Retrying {job_queue.retry_failed()} failed articles.", "cyan")
+
+    def report(result):
+        if result.skipped:
+            print(colored(f"[same]   {result.url}", "cyan"))
+        elif result.success:
+            print(colored(f"[ok]     {result.url} -> {result.output_folder}", "green"))
+        else:
+            print(colored(f"[failed] {result.url}: {result.error}", "red"))
+
+    def report_listing_error(url, error):
+        print(colored(f"[listing failed] {url}: {error}", "yellow"))
+
+    wall_start, cpu_start = perf_counter(), process_time()
+    try:
+        options = {"fetch_mode": fetch_mode, "manifest": manifest, "job_queue": job_queue, "engine": engine}
+        discovered = discover(sources, since, on_error=report_listing_error)
+        if url_file is None:
+            results = run_batch(discovered, output_folder, workers, report, **options)
+        elif url_file == '-':
+            results = run_batch(itertools.chain(read_urls(sys.stdin), discovered), output_folder, workers, report,
+                                **options)
+        else:
+            with open(url_file, 'r', encoding='utf-8') as f:
+                results = run_batch(itertools.chain(read_urls(f), discovered), output_folder, workers, report,
+                                    **options)
+    finally:
+        if job_queue is not None:
+            job_queue.close()
+
+    print_timings([("Batch conversion", perf_counter() - wall_start, process_time() - cpu_start)])
+
+    failed = [result for result in results if not result.success]
+    print_message(f"Converted {len(results) - len(failed)} of {len(results)} articles.",
+                  "red" if failed else "green")
+    return 1 if failed else 0
+
+
 def main():
     """
     The main function to execute the script.
     """
     # Parse arguments
-    parser = argparse.ArgumentParser(description='Download Medium articles with images and convert them into markdown files.')
+    parser = argparse.ArgumentParser(description='Download Medium articles with images and convert them into markdown files.', add_help=False)
     parser.add_argument('-u', '--url', type=str, help='URL of the Medium article')
+    parser.add_argument('-f', '--url-file', type=str, help='File with one Medium article URL per line ("-" reads stdin)')
+    parser.add_argument('-o', '--output', type=str, default=DEFAULT_OUTPUT_FOLDER,
+                        help='Folder holding one sub-folder per converted article')
+    parser.add_argument('-d', '--discover', action='append', type=parse_source, default=[], metavar='SOURCE',
+                        help='Convert the articles of an author (@name), publication (its URL) or tag (tag:name), '
+                             'read from its feed, sitemap and archive pages; may be repeated')
+    parser.add_argument('--since', type=int, metavar='YEAR',
+                        help='While discovering, also read the archive pages of every year back to this one')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='Number of browser contexts used in batch mode')
+    parser.add_argument('-m', '--fetch-mode', choices=FETCH_MODES, default='auto',
+                        help='Render the article in Chromium, use the static HTML and skip the browser, '
+                             'or use the static HTML unless it lacks the article (default)')
+    parser.add_argument('-e', '--engine', choices=CONVERTER_ENGINES, default='html2text',
+                        help='Convert the whole page with html2text and strip the boilerplate afterwards (default), '
+                             'or convert only the article element with the Medium-aware lxml emitter')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of processes converting HTML to Markdown in batch mode')
+    parser.add_argument('--incremental', action='store_true',
+                        help='In batch mode, skip articles that did not change since the last run')
+    parser.add_argument('--resume', action='store_true',
+                        help='In batch mode, keep a job queue in the output folder and continue an interrupted batch')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='Convert the URLs that failed in earlier --resume runs again (no --url-file needed)')
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help='With --resume, attempts per URL before it is marked failed')
+    parser.add_argument('--cache-dir', type=str, help='Directory of the media cache shared across runs')
+    parser.add_argument('--no-cache', action='store_true', help='Always download media instead of using the cache')
+    parser.add_argument('--page-cache', choices=PAGE_CACHE_MODES, default='cache',
+                        help='Cache fetched pages on disk (default), record every response, replay recorded '
+                             'responses without network access, or turn the page cache off')
+    parser.add_argument('--page-cache-dir', type=str, help='Directory of the page cache (or of the recording)')
+    parser.add_argument('--events', type=str, metavar='FILE',
+                        help='Append a JSON line per stage, page and media fetch to this file')
+    parser.add_argument('--metrics', type=str, metavar='FILE',
+                        help='Write Prometheus metrics to this file (for the node_exporter textfile collector)')
+    parser.add_argument('--statsd', type=parse_statsd_address, metavar='HOST:PORT',
+                        help='Send metrics to this StatsD server')
     parser.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS, help='Show this help message and exit')
     args = parser.parse_args()
 
+    configure_page_cache(args.page_cache, args.page_cache_dir)
+    configure_shared_fetcher(cache_dir=args.cache_dir, use_cache=not args.no_cache, recorder=shared_page_cache())
+    for sink in configure_instrumentation(args.events, args.metrics, args.statsd):
+        atexit.register(remove_sink, sink)
+
+    # Batch mode: convert every listed URL without interactive prompts
+    if args.url_file or args.retry_failed or args.discover:
+        configure_conversion_pool(args.jobs)
+        try:
+            exit_code = run_batch_mode(args.url_file, args.output, args.workers, args.fetch_mode,
+                                       args.incremental, args.resume, args.retry_failed, args.max_attempts,
+                                       args.engine, args.discover, args.since)
+        finally:
+            configure_conversion_pool(1)
+        sys.exit(exit_code)
+
     # If no URL is given, prompt the user to enter it
     if not args.url:
         args.url = prompt_input("Enter the URL of the Medium article:")
@@ -152,6 +356,8 @@ def main():
         args.url = prompt_input("Enter the URL of the Medium article:")
 
     # Display ASCII art and welcome message
+    from pyfiglet import Figlet
+    from colorama import init
     init()  # initialize colorama
     f = Figlet(font='slant')  # Choose a font
     print(colored("============================================================================", "green"))
@@ -159,23 +365,32 @@ def main():
     print(colored("============================================================================", "green"))
     print(colored("\nWelcome to the Medium Article Downloader!\n", "yellow", attrs=['bold', 'blink']))
 
-    # Define output folder
-    output_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "output")
+    # Define output folder: every article gets its own, so several runs can share one output root
+    output_folder = os.path.join(args.output, article_folder_name(args.url))
 
-    # Download, convert, and clean Medium article
-    execute_with_progress(download_medium_article, [args.url, output_folder], 5, "Downloading Medium article...")
-    execute_with_progress(convert_html_to_markdown, [output_folder], 2, "Converting HTML to Markdown...")
-    execute_with_progress(process_markdown_files, [output_folder], 3, "Processing Markdown files...")
-    execute_with_progress(url_to_local, [], 2, "Replacing URL with local paths...")
-    execute_with_progress(delete_unnecessary_data, [output_folder], 2, "Cleaning up unnecessary data...")
+    # Download, convert, and clean Medium article in memory, then write it once
+    article = Article(args.url, output_folder, engine=args.engine)
+    timings = []
+    try:
+        execute_stage(fetch, [article, args.fetch_mode, None], "Downloading Medium article", timings, unit='B')
+        execute_stage(extract, [article], "Extracting article content", timings)
+        execute_stage(convert, [article], "Converting HTML to Markdown", timings)
+        execute_stage(clean, [article], "Processing Markdown", timings)
+        execute_stage(prepare_output_folder, [article], "Preparing output folder", timings)
+        execute_stage(localize_images, [article, None], "Replacing URL with local paths", timings, unit='image')
+        execute_stage(save, [article], "Saving Markdown file", timings)
+        execute_stage(publish, [article], "Publishing output folder", timings)
+    except Exception as e:
+        print_message(f"An error occurred: {e}", "red")
+        sys.exit(1)
+    finally:
+        discard_work_folder(article)
+        print_timings(timings)
 
     print_message("Done! Check the output in your specified folder.", "green")
-    
+
     # Get the markdown file name
-    for file in os.listdir(output_folder):
-        if file.endswith('.md'):
-            md_file_path = os.path.join(output_folder, file)
-            break
+    md_file_path = article.markdown_path
 
     # Ask the user if they want to open the markdown file in the default editor
     if prompt_confirmation("Would you like to open the markdown file in your default editor?"):
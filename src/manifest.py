@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# Custom modules
+from .clean_md import write_text_atomic
+
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def content_hash(*parts):
+    """
+    Hash the given strings into one stable digest.
+
+    Args:
+        *parts (str): The strings to hash, in order.
+
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    sha = hashlib.sha256()
+    for part in parts:
+        sha.update((part or "").encode('utf-8'))
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+class Manifest:
+    """
+    Record of every converted article, kept next to the output between runs.
+
+    Maps each URL to when it was last fetched, the HTTP validators (ETag /
+    Last-Modified) and content hash of its source, and where its Markdown was
+    written. Writes are batched: the file is saved every `save_every` updates
+    and on `save()`.
+    """
+
+    def __init__(self, path, save_every=50):
+        self.path = path
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def get(self, url):
+        """
+        Return the recorded entry of a URL, or None.
+        """
+        with self._lock:
+            entry = self.entries.get(url)
+            return dict(entry) if entry is not None else None
+
+    def is_current(self, url, source_hash):
+        """
+        Tell whether a URL was converted from the same source and its output still exists.
+
+        Args:
+            url (str): The article URL.
+            source_hash (str): Hash of the source as fetched now.
+
+        Returns:
+            bool: True if the article does not need to be converted again.
+        """
+        entry = self.get(url)
+        return (entry is not None and entry.get("content_hash") == source_hash
+                and bool(entry.get("output_path")) and os.path.exists(entry["output_path"]))
+
+    def update(self, url, **fields):
+        """
+        Update the entry of a URL; `fetched_at` is set to now.
+
+        Args:
+            url (str): The article URL.
+            **fields: Entry fields (etag, last_modified, content_hash, output_path).
+        """
+        with self._lock:
+            entry = self.entries.setdefault(url, {})
+            entry.update(fields, fetched_at=time.time())
+            self._pending += 1
+            if self._pending >= self.save_every:
+                self._save_locked()
+
+    def save(self):
+        """
+        Write the manifest to disk (atomically).
+        """
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        write_text_atomic(self.path, json.dumps(self.entries, indent=1, sort_keys=True))
+        self._pending = 0
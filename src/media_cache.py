@@ -0,0 +1,225 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from collections import namedtuple
+
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+DEFAULT_MAX_AGE = 24 * 60 * 60  # serve without revalidating for a day
+
+CacheEntry = namedtuple("CacheEntry", ["url", "digest", "etag", "last_modified", "fetched_at"])
+
+
+def default_cache_dir():
+    """
+    Return the default location of the media cache.
+
+    Returns:
+        str: $XDG_CACHE_HOME/medium2md/media, or ~/.cache/medium2md/media.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "medium2md", "media")
+
+
+def file_digest(path):
+    """
+    Compute the SHA-256 of a file without loading it into memory at once.
+
+    Args:
+        path (str): The file to hash.
+
+    Returns:
+        str: The hex digest.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def link_or_copy(source, destination):
+    """
+    Hardlink `source` to `destination`, copying if the filesystem does not allow links.
+
+    Args:
+        source (str): The existing file.
+        destination (str): The path to create. Replaced if it already exists.
+    """
+    tmp_path = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+class MediaCache:
+    """
+    Persistent, content-addressed store of downloaded media shared across articles and runs.
+
+    Files are stored once per SHA-256 under `objects/`, and an SQLite index maps
+    each URL to its content and HTTP validators (ETag / Last-Modified). Files are
+    handed out as hardlinks, so identical images in many articles share one copy
+    on disk. When the store grows past `max_bytes` the least recently used
+    objects are evicted.
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.objects_folder = os.path.join(self.root, "objects")
+        os.makedirs(self.objects_folder, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.root, "index.sqlite"), timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL, "
+                             "etag TEXT, last_modified TEXT, fetched_at REAL NOT NULL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS objects (digest TEXT PRIMARY KEY, "
+                             "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+
+    def object_path(self, digest):
+        """
+        Return where the object with the given digest is stored.
+        """
+        return os.path.join(self.objects_folder, digest[:2], digest)
+
+    def lookup(self, url):
+        """
+        Find the cached copy of a URL.
+
+        Args:
+            url (str): The media URL.
+
+        Returns:
+            CacheEntry: The entry, or None if the URL is not cached (or its file was removed).
+        """
+        with self._lock:
+            row = self._db.execute("SELECT url, digest, etag, last_modified, fetched_at FROM urls WHERE url = ?",
+                                   (url,)).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(*row)
+        if not os.path.exists(self.object_path(entry.digest)):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        """
+        Tell whether an entry may be used without asking the server.
+        """
+        return time.time() - entry.fetched_at < self.max_age
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        Build the request headers that revalidate a cached entry.
+
+        Args:
+            entry (CacheEntry): The cached entry, or None.
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers, empty if there is nothing to revalidate.
+        """
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, url, path, etag=None, last_modified=None):
+        """
+        Add a freshly downloaded file to the cache.
+
+        If the same bytes are already cached, `path` is replaced by a hardlink to
+        the existing object so the content exists once on disk.
+
+        Args:
+            url (str): The URL the file was downloaded from.
+            path (str): The downloaded file.
+            etag (str, optional): The ETag sent by the server.
+            last_modified (str, optional): The Last-Modified date sent by the server.
+
+        Returns:
+            str: The content digest.
+        """
+        digest = file_digest(path)
+        object_path = self.object_path(digest)
+        now = time.time()
+        with self._lock:
+            if os.path.exists(object_path):
+                link_or_copy(object_path, path)
+            else:
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                link_or_copy(path, object_path)
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO objects (digest, size, last_used) VALUES (?, ?, ?)",
+                                 (digest, os.path.getsize(object_path), now))
+                self._db.execute("INSERT OR REPLACE INTO urls (url, digest, etag, last_modified, fetched_at) "
+                                 "VALUES (?, ?, ?, ?, ?)", (url, digest, etag, last_modified, now))
+        self.evict()
+        return digest
+
+    def revalidated(self, entry):
+        """
+        Record that the server confirmed an entry is still current (HTTP 304).
+        """
+        with self._lock, self._db:
+            self._db.execute("UPDATE urls SET fetched_at = ? WHERE url = ?", (time.time(), entry.url))
+
+    def materialize(self, entry, destination):
+        """
+        Place the cached content of an entry at `destination` (as a hardlink when possible).
+
+        Args:
+            entry (CacheEntry): The cached entry.
+            destination (str): The path to create.
+
+        Returns:
+            str: The destination path.
+        """
+        link_or_copy(self.object_path(entry.digest), destination)
+        with self._lock, self._db:
+            self._db.execute("UPDATE objects SET last_used = ? WHERE digest = ?", (time.time(), entry.digest))
+        return destination
+
+    def size(self):
+        """
+        Return the total size of the cached objects in bytes.
+        """
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    def evict(self):
+        """
+        Remove least recently used objects until the cache fits in `max_bytes`.
+        """
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self._db.execute("SELECT digest, size FROM objects ORDER BY last_used").fetchall()
+            with self._db:
+                for digest, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(self.object_path(digest))
+                    except FileNotFoundError:
+                        pass
+                    self._db.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+                    self._db.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+                    total -= size
+
+    def close(self):
+        """
+        Close the index database.
+        """
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,258 @@
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Custom modules
+from .media_cache import MediaCache
+from .instrumentation import timed
+
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+CHUNK_SIZE = 64 * 1024
+# Largest media file that is downloaded; bigger ones are skipped (their links stay remote)
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+FetchResult = namedtuple("FetchResult", ["url", "path", "error"])
+
+
+class MediaTooLarge(IOError):
+    """
+    Raised when a media file is bigger than the configured maximum size.
+    """
+
+
+def stream_to_file(response, destination, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Write a streamed response to a file chunk by chunk, then rename it into place.
+
+    At most one chunk of the body is held in memory. The file is written under a
+    temporary name in the destination folder, so `destination` never holds a
+    partial download.
+
+    Args:
+        response (requests.Response): A response opened with `stream=True`.
+        destination (str): The path the file is written to.
+        max_bytes (int, optional): Largest accepted body, None for no limit. Defaults to 50 MiB.
+
+    Returns:
+        str: The destination path.
+
+    Raises:
+        MediaTooLarge: If the body is (or announces to be) bigger than `max_bytes`.
+    """
+    declared = response.headers.get("Content-Length")
+    if max_bytes is not None and declared is not None and declared.isdigit() and int(declared) > max_bytes:
+        raise MediaTooLarge(f"{response.url} is {declared} bytes, more than {max_bytes}")
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(destination)), suffix='.part')
+    try:
+        written = 0
+        with os.fdopen(fd, 'wb') as out_file:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                written += len(chunk)
+                if max_bytes is not None and written > max_bytes:
+                    raise MediaTooLarge(f"{response.url} is more than {max_bytes} bytes")
+                out_file.write(chunk)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return destination
+
+
+def create_session(pool_size=16, retries=3, backoff_factor=0.5):
+    """
+    Create an HTTP session that keeps connections alive and retries transient failures.
+
+    Args:
+        pool_size (int, optional): Number of connections kept open per host. Defaults to 16.
+        retries (int, optional): Retries for connection errors and 429/5xx answers. Defaults to 3.
+        backoff_factor (float, optional): Exponential backoff between retries. Defaults to 0.5.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    retry = Retry(total=retries, backoff_factor=backoff_factor,
+                  status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset(["GET", "HEAD"]))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class MediaFetcher:
+    """
+    Download media files concurrently over one pooled HTTP session.
+
+    At most `max_workers` downloads run at once, and at most `per_host` of them
+    against the same host, so a post with dozens of images reuses a handful of
+    TLS connections to miro.medium.com instead of opening one per image.
+
+    With a `cache`, fresh cached files are used without touching the network and
+    stale ones are revalidated with a conditional request. With a `recorder` (a
+    PageCache), its record and replay modes also cover the media files.
+
+    Bodies are streamed to disk, so the memory a fetcher needs is about
+    `max_workers * CHUNK_SIZE` (512 KiB by default) whatever the size of the
+    media. Files bigger than `max_bytes` are not downloaded.
+    """
+
+    def __init__(self, max_workers=8, per_host=4, timeout=DEFAULT_TIMEOUT, retries=3, session=None, cache=None,
+                 max_bytes=DEFAULT_MAX_BYTES, recorder=None):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.per_host = per_host
+        self.cache = cache
+        self.recorder = recorder
+        self.session = session or create_session(pool_size=max(max_workers, per_host), retries=retries)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="media")
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def fetch(self, url, destination):
+        """
+        Download a single file.
+
+        Args:
+            url (str): The URL of the file.
+            destination (str): The path the file is written to.
+
+        Returns:
+            str: The destination path.
+
+        Raises:
+            requests.RequestException: If the download failed after all retries, or in replay
+                mode if the file was not recorded.
+            MediaTooLarge: If the file is bigger than `max_bytes`.
+        """
+        with timed("media_fetch", url=url, cache="miss", bytes=0, retries=0) as event:
+            replayed = self.recorder.media(url, destination) if self.recorder is not None else None
+            if replayed is not None:
+                event["cache"] = "hit"
+                return replayed
+            path = self._fetch(url, destination, event)
+            if self.recorder is not None:
+                self.recorder.record_media(url, path)
+            return path
+
+    def _fetch(self, url, destination, event):
+        entry = self.cache.lookup(url) if self.cache is not None else None
+        if entry is not None and self.cache.is_fresh(entry):
+            event["cache"] = "hit"
+            return self.cache.materialize(entry, destination)
+
+        with self._host_slot(url):
+            with self.session.get(url, stream=True, timeout=self.timeout,
+                                  headers=MediaCache.conditional_headers(entry)) as response:
+                retries = getattr(getattr(response, "raw", None), "retries", None)
+                event["retries"] = len(retries.history) if retries is not None else 0
+                if entry is not None and response.status_code == 304:
+                    event["cache"] = "revalidated"
+                    self.cache.revalidated(entry)
+                    return self.cache.materialize(entry, destination)
+                response.raise_for_status()
+                stream_to_file(response, destination, self.max_bytes)
+                event["bytes"] = os.path.getsize(destination)
+
+        if self.cache is not None:
+            self.cache.store(url, destination, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return destination
+
+    def _fetch_result(self, url, destination):
+        try:
+            return FetchResult(url, self.fetch(url, destination), None)
+        except Exception as e:
+            return FetchResult(url, None, e)
+
+    def fetch_all(self, jobs, on_progress=None):
+        """
+        Download many files concurrently.
+
+        Args:
+            jobs (iter): (url, destination) pairs.
+            on_progress (function, optional): Called with (files done, total files) as downloads finish.
+
+        Returns:
+            list: A FetchResult per job, in the order the jobs were given.
+        """
+        futures = [self._executor.submit(self._fetch_result, url, destination) for url, destination in jobs]
+        if on_progress is not None:
+            on_progress(0, len(futures))
+            for done, _ in enumerate(as_completed(futures), 1):
+                on_progress(done, len(futures))
+        return [future.result() for future in futures]
+
+    def close(self):
+        """
+        Stop the worker threads and close the pooled connections and the cache.
+        """
+        self._executor.shutdown(wait=True)
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_shared_fetcher = None
+_shared_options = {}
+_shared_lock = threading.Lock()
+
+
+def configure_shared_fetcher(cache_dir=None, use_cache=True, **options):
+    """
+    Set the options of the process-wide MediaFetcher before its first use.
+
+    Args:
+        cache_dir (str, optional): Location of the media cache. Defaults to the user cache directory.
+        use_cache (bool, optional): Whether to use the media cache at all. Defaults to True.
+        **options: Further MediaFetcher keyword arguments.
+    """
+    global _shared_fetcher
+    with _shared_lock:
+        if _shared_fetcher is not None:
+            _shared_fetcher.close()
+            _shared_fetcher = None
+        _shared_options.clear()
+        _shared_options.update(options, cache_dir=cache_dir, use_cache=use_cache)
+
+
+def shared_fetcher():
+    """
+    Return the process-wide MediaFetcher, creating it on first use.
+
+    Sharing one fetcher keeps the per-host limits global when several articles
+    are converted at the same time.
+
+    Returns:
+        MediaFetcher: The shared fetcher.
+    """
+    global _shared_fetcher
+    with _shared_lock:
+        if _shared_fetcher is None:
+            options = dict(_shared_options)
+            cache_dir = options.pop("cache_dir", None)
+            cache = MediaCache(cache_dir) if options.pop("use_cache", True) else None
+            _shared_fetcher = MediaFetcher(cache=cache, **options)
+        return _shared_fetcher
@@ -0,0 +1,124 @@
+import os
+import re
+from urllib.parse import urlsplit
+
+
+# Hosts serving Medium images. Their paths carry resize options before the image id:
+# /max/1400/<id>, /v2/resize:fit:720/format:webp/<id>, /fit/c/140/140/<id>, or just /<id>.
+MEDIUM_IMAGE_HOSTS = frozenset(["miro.medium.com", "cdn-images-1.medium.com", "cdn-images-2.medium.com"])
+
+# A URL inside markdown or HTML text: stops at whitespace, quotes, angle brackets and parentheses
+URL_PATTERN = re.compile(r"https?://[^\s()<>\"']+")
+
+# Folder next to the markdown file that holds the downloaded images
+LOCAL_MEDIA_FOLDER = "local"
+
+
+def canonical_image_url(url):
+    """
+    Normalize an image URL so every variant of the same image maps to one key.
+
+    Medium image URLs are reduced to their image id, whatever the host, size or
+    format options; other URLs only lose their fragment and the case of the host.
+
+    Args:
+        url (str): The image URL.
+
+    Returns:
+        str: The canonical key of the image.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host in MEDIUM_IMAGE_HOSTS:
+        return "medium:" + parts.path.rstrip("/").rsplit("/", 1)[-1]
+    query = "?" + parts.query if parts.query else ""
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path}{query}"
+
+
+def local_media_path(url):
+    """
+    Return where a downloaded image is saved, relative to the markdown file linking it.
+
+    Every stage that downloads images uses this path, so an image downloaded by one
+    stage is what the final markdown links to.
+
+    Args:
+        url (str): The image URL.
+
+    Returns:
+        str: The path of the image, inside `LOCAL_MEDIA_FOLDER`.
+    """
+    return os.path.join(LOCAL_MEDIA_FOLDER, os.path.basename(urlsplit(url).path))
+
+
+class MediaIndex:
+    """
+    Local path of each downloaded image, looked up by any variant of its URL.
+
+    Lookups are a single dict access on the canonical URL, so rewriting a
+    document is linear in its size, whatever the number of images.
+    """
+
+    def __init__(self):
+        self._paths = {}
+
+    def add(self, url, path):
+        """
+        Record the local copy of an image. The first path recorded for an image wins.
+
+        Args:
+            url (str): The image URL (any variant).
+            path (str): The local path links should point at.
+        """
+        self._paths.setdefault(canonical_image_url(url), path)
+
+    def get(self, url, default=None):
+        """
+        Return the local path of an image, or `default` if it has none.
+
+        Args:
+            url (str): The image URL (any variant).
+            default (str, optional): Returned for unknown images. Defaults to None.
+
+        Returns:
+            str: The local path.
+        """
+        return self._paths.get(canonical_image_url(url), default)
+
+    def __contains__(self, url):
+        return canonical_image_url(url) in self._paths
+
+    def __len__(self):
+        return len(self._paths)
+
+
+def unique_image_urls(urls):
+    """
+    Drop the URLs that are variants of an image seen before.
+
+    Args:
+        urls (iter): Image URLs.
+
+    Returns:
+        list: The first URL of every distinct image, in order.
+    """
+    seen = {}
+    for url in urls:
+        seen.setdefault(canonical_image_url(url), url)
+    return list(seen.values())
+
+
+def rewrite_links(text, index):
+    """
+    Replace every URL in a text that has a local copy, in a single pass.
+
+    Args:
+        text (str): Markdown or HTML text.
+        index (MediaIndex): Local paths of the downloaded images.
+
+    Returns:
+        str: The text with local links.
+    """
+    if not len(index):
+        return text
+    return URL_PATTERN.sub(lambda match: index.get(match.group(0), match.group(0)), text)
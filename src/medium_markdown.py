@@ -0,0 +1,278 @@
+import re
+
+
+# Markup around the text of inline elements
+INLINE_MARKUPS = {"strong": ("**", "**"), "b": ("**", "**"), "em": ("*", "*"), "i": ("*", "*"),
+                  "code": ("`", "`")}
+
+# The title is the only top-level heading. Medium renders section headings as <h1>
+# and subheadings as <h2> (its "H3" and "H4" paragraphs, see `embedded_state.HEADINGS`).
+HEADINGS = {"h1": "##", "h2": "###", "h3": "###", "h4": "####", "h5": "####", "h6": "####"}
+
+# Elements that are walked for the blocks they hold
+CONTAINERS = {"div", "section", "article", "main", "header", "picture", "table", "thead", "tbody", "tr"}
+
+# Elements that never hold article text
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "button", "nav", "footer", "aside", "form",
+                "input", "select", "textarea", "source"}
+
+# The byline, claps and share bar around the body. Medium marks them for its
+# text-to-speech to skip, and tags most of them with a test id.
+CHROME_CLASS = "speechify-ignore"
+CHROME_TEST_IDS = {"authorPhoto", "authorName", "publicationName", "storyReadTime", "storyPublishDate",
+                   "headerClapButton", "headerBookmarkButton", "headerSocialShareButton", "audioPlayButton",
+                   "footerClapButton", "footerBookmarkButton", "footerSocialShareButton"}
+
+WHITESPACE = re.compile(r"\s+")
+CODE_LANGUAGE_CLASS = re.compile(r"\blang(?:uage)?-([\w+#-]+)")
+
+
+def find_article_node(tree):
+    """
+    Find the element holding the article: the <article> with the most text.
+
+    Args:
+        tree (lxml.html.HtmlElement): The parsed page.
+
+    Returns:
+        lxml.html.HtmlElement: The article element, or None if the page has none with text.
+    """
+    best, best_length = None, 0
+    for article in tree.iter('article'):
+        length = len(article.text_content().strip())
+        if length > best_length:
+            best, best_length = article, length
+    return best
+
+
+def heading_title(node):
+    """
+    Read the title of an article from its first <h1>.
+
+    Args:
+        node (lxml.html.HtmlElement): The article element.
+
+    Returns:
+        str: The title, or None if the article has no <h1>.
+    """
+    heading = next(node.iter('h1'), None)
+    return _collapse(heading.text_content()).strip() if heading is not None else None
+
+
+def article_markdown(node, title):
+    """
+    Render an article element as Markdown: its title, then every block in order.
+
+    Only the article element is walked, so navigation, recommendations and scripts
+    around it are never converted. The <h1> repeating the title is skipped.
+
+    Args:
+        node (lxml.html.HtmlElement): The article element (or any element holding the body).
+        title (str): Title of the article.
+
+    Returns:
+        str: The Markdown of the article.
+    """
+    emitter = _Emitter(title)
+    blocks = [f"# {title}"] + [block for block in emitter.blocks(node) if block]
+    return "\n\n".join(blocks) + "\n"
+
+
+def _collapse(text):
+    return WHITESPACE.sub(" ", text) if text else ""
+
+
+def _wrap(text, opening, closing):
+    # Emphasis markers must touch the text they wrap, so surrounding spaces move outside
+    stripped = text.strip()
+    if not stripped:
+        return text
+    leading = text[:len(text) - len(text.lstrip())]
+    trailing = text[len(text.rstrip()):]
+    return leading + opening + stripped + closing + trailing
+
+
+def _tag(element):
+    return element.tag if isinstance(element.tag, str) else None
+
+
+def _is_chrome(element):
+    if _tag(element) in SKIPPED_TAGS:
+        return True
+    if element.get("aria-hidden") == "true" or element.get("hidden") is not None:
+        return True
+    return CHROME_CLASS in (element.get("class") or "").split() or element.get("data-testid") in CHROME_TEST_IDS
+
+
+def _is_separator(element):
+    return _tag(element) == "hr" or element.get("role") == "separator"
+
+
+def _is_mixtape(element):
+    # Links to other stories are anchors wrapping a whole card of headings and text
+    return _tag(element) == "a" and any(_tag(child) in ("div", "h2", "h3", "p") for child in element.iterdescendants())
+
+
+def _image_source(img):
+    if img.get("src"):
+        return img.get("src")
+    # Lazily loaded images only carry candidates (on the <img> or the <source>s of its
+    # <picture>), the widest last. The webp variants come first, but are saved under the
+    # name of the original image, so the original format is preferred.
+    parent = img.getparent()
+    sources = [img] + (list(parent.iter('source')) if parent is not None else [])
+    widest = []
+    for source in sources:
+        candidates = [candidate.split()[0] for candidate in (source.get("srcset") or "").split(",")
+                      if candidate.strip()]
+        if candidates:
+            widest.append(candidates[-1])
+            if source.get("type") != "image/webp" and "format:webp" not in candidates[-1]:
+                return candidates[-1]
+    return widest[0] if widest else None
+
+
+class _Emitter:
+    """Walks the element tree of an article and yields its Markdown blocks."""
+
+    def __init__(self, title):
+        self.title = title
+        self.title_skipped = False
+
+    def blocks(self, element):
+        run = [_collapse(element.text)]
+        for child in element:
+            tag = _tag(child)
+            if tag is None or _is_chrome(child):
+                pass
+            elif tag in CONTAINERS or tag in BLOCK_HANDLERS or _is_separator(child) or _is_mixtape(child):
+                yield self.paragraph_text("".join(run))
+                run = []
+                yield from self.block(child)
+            else:
+                run.append(self.inline(child))
+            run.append(_collapse(child.tail))
+        yield self.paragraph_text("".join(run))
+
+    def block(self, element):
+        tag = _tag(element)
+        if _is_separator(element):
+            yield "---"
+        elif _is_mixtape(element):
+            yield self.mixtape(element)
+        elif tag in BLOCK_HANDLERS:
+            yield BLOCK_HANDLERS[tag](self, element)
+        else:
+            yield from self.blocks(element)
+
+    def inline(self, element, skipped=()):
+        tag = _tag(element)
+        if tag is None or _is_chrome(element):
+            return ""
+        if tag == "br":
+            return "\n"
+        if tag == "img":
+            return self.image(element)
+        parts = [_collapse(element.text)]
+        for child in element:
+            if _tag(child) not in skipped:
+                parts.append(self.inline(child))
+            parts.append(_collapse(child.tail))
+        text = "".join(parts)
+        if tag in INLINE_MARKUPS:
+            return _wrap(text, *INLINE_MARKUPS[tag])
+        if tag == "a" and element.get("href") and text.strip():
+            return _wrap(text, "[", f"]({element.get('href')})")
+        return text
+
+    def paragraph_text(self, text):
+        return "\n".join(line.strip() for line in text.strip().split("\n"))
+
+    def paragraph(self, element):
+        return self.paragraph_text(self.inline(element))
+
+    def heading(self, element):
+        text = self.paragraph(element).replace("\n", " ")
+        if not self.title_skipped and _tag(element) == "h1" and text == self.title:
+            self.title_skipped = True
+            return None
+        return f"{HEADINGS[_tag(element)]} {text}" if text else None
+
+    def image(self, element):
+        source = _image_source(element)
+        return f"![{element.get('alt') or ''}]({source})" if source else ""
+
+    def figure(self, element):
+        blocks = []
+        for child in element.iter('img', 'iframe'):
+            blocks.append(self.image(child) if _tag(child) == "img" else self.iframe(child))
+        caption = next(element.iter('figcaption'), None)
+        if caption is not None:
+            text = self.paragraph(caption)
+            if text:
+                blocks.append(_wrap(text, "*", "*"))
+        return "\n\n".join(block for block in blocks if block)
+
+    def code(self, element):
+        language = ""
+        for child in element.iter():
+            language = child.get("data-code-block-lang") or ""
+            if not language:
+                match = CODE_LANGUAGE_CLASS.search(child.get("class") or "")
+                language = match.group(1) if match else ""
+            if language:
+                break
+        code = _code_text(element).strip("\n")
+        return f"```{language}\n{code}\n```"
+
+    def quote(self, element):
+        # Medium's pull quotes are blockquotes too, holding their text in <p>
+        text = "\n\n".join(block for block in self.blocks(element) if block)
+        return "\n".join(f"> {line}" if line else ">" for line in text.split("\n")) if text else None
+
+    def list(self, element, depth=0):
+        lines = []
+        start = element.get("start") or "1"
+        number = (int(start) if start.isdigit() else 1) if _tag(element) == "ol" else None
+        for item in element.iterchildren('li'):
+            marker = f"{number}." if number is not None else "-"
+            text = self.paragraph_text(self.inline(item, skipped=("ul", "ol"))).replace("\n", " ")
+            lines.append(" " * (3 * depth) + f"{marker} {text}")
+            # Nested lists are indented under their item
+            lines.extend(self.list(child, depth + 1) for child in item.iterchildren('ul', 'ol'))
+            if number is not None:
+                number += 1
+        return "\n".join(lines)
+
+    def mixtape(self, element):
+        heading = next((child for child in element.iter('h2', 'h3', 'strong') if child.text_content().strip()), None)
+        text = _collapse((heading if heading is not None else element).text_content()).strip()
+        return f"[{text or element.get('href')}]({element.get('href')})" if element.get("href") else text
+
+    def iframe(self, element):
+        source = element.get("src") or element.get("data-src")
+        return f"[{element.get('title') or source}]({source})" if source else None
+
+
+def _code_text(element):
+    parts = [element.text or ""]
+    for child in element:
+        if _tag(child) == "br":
+            parts.append("\n")
+        elif _tag(child) is not None:
+            parts.append(_code_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+BLOCK_HANDLERS = {
+    "p": _Emitter.paragraph,
+    "h1": _Emitter.heading, "h2": _Emitter.heading, "h3": _Emitter.heading,
+    "h4": _Emitter.heading, "h5": _Emitter.heading, "h6": _Emitter.heading,
+    "figure": _Emitter.figure,
+    "img": _Emitter.image,
+    "pre": _Emitter.code,
+    "blockquote": _Emitter.quote,
+    "ul": _Emitter.list, "ol": _Emitter.list,
+    "iframe": _Emitter.iframe,
+}
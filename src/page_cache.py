@@ -0,0 +1,450 @@
+import os
+import json
+import shutil
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Custom modules
+from .media_cache import default_cache_dir
+from .media_fetcher import DEFAULT_TIMEOUT
+
+
+# "cache" honors the cache headers; "record" always fetches and keeps every response;
+# "replay" never touches the network and only serves what was recorded.
+PAGE_CACHE_MODES = ("off", "cache", "record", "replay")
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MiB
+# Freshness of a response that does not say how long it may be cached
+DEFAULT_TTL = 60 * 60
+# A response fetched this recently is reused whatever its headers, so validating a URL
+# and converting it right after costs a single request
+REUSE_WINDOW = 60
+# Most bytes of recently fetched bodies kept in memory for that reuse; the oldest go first
+RECENT_MAX_BYTES = 16 * 1024 * 1024  # 16 MiB
+# Eviction trims the cache to this share of `max_bytes`, so it does not run on every save
+EVICT_TARGET = 0.9
+
+# Query parameters Medium adds to links that do not change the page
+TRACKING_PARAMETERS = frozenset(["source", "sk", "gi"])
+
+# Headers that describe the transfer rather than the page, not kept in the cache
+UNCACHED_HEADERS = frozenset(["connection", "keep-alive", "transfer-encoding", "content-encoding",
+                              "content-length", "set-cookie"])
+
+
+class ReplayMiss(requests.ConnectionError):
+    """
+    Raised in replay mode for a URL that was not recorded.
+    """
+
+
+def default_page_cache_dir():
+    """
+    Return the default location of the page cache, next to the media cache.
+
+    Returns:
+        str: $XDG_CACHE_HOME/medium2md/pages, or ~/.cache/medium2md/pages.
+    """
+    return os.path.join(os.path.dirname(default_cache_dir()), "pages")
+
+
+def normalize_url(url):
+    """
+    Normalize a page URL so the variants of one page share a cache entry.
+
+    The scheme and host are lowercased, the fragment, a trailing slash and Medium's
+    tracking parameters are dropped, and the remaining parameters are sorted.
+
+    Args:
+        url (str): The page URL.
+
+    Returns:
+        str: The normalized URL.
+    """
+    parts = urlsplit(url)
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key not in TRACKING_PARAMETERS and not key.startswith("utm_"))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/",
+                       urlencode(query), ""))
+
+
+def freshness_lifetime(headers, default_ttl=DEFAULT_TTL):
+    """
+    Read from the response headers how many seconds a response may be served from the cache.
+
+    Args:
+        headers (dict): The response headers.
+        default_ttl (float, optional): Lifetime when the headers do not give one.
+
+    Returns:
+        float: The lifetime in seconds (0 to always revalidate), or None if the
+            response must not be stored.
+    """
+    directives = {}
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name, "").isdigit():
+            return int(directives[name])
+    if headers.get("Expires"):
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+            date = parsedate_to_datetime(headers["Date"]).timestamp() if headers.get("Date") else time.time()
+            return max(expires - date, 0)
+        except (TypeError, ValueError):
+            return 0
+    return default_ttl
+
+
+def build_response(url, status_code, headers, content, from_cache=True):
+    """
+    Build a `requests.Response` from cached parts, so callers cannot tell it from a fetched one.
+    """
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = content
+    response.from_cache = from_cache
+    return response
+
+
+class PageCache:
+    """
+    On-disk cache of fetched pages, with a record/replay mode for offline runs.
+
+    Each response is kept as two files named after the hash of its normalized URL:
+    `<hash>.json` with the status, headers and freshness, and `<hash>.body`. In
+    "cache" mode responses are served while fresh (see `freshness_lifetime`), stale
+    ones are revalidated with a conditional request, and the least recently used
+    entries are evicted past `max_bytes`. "record" fetches everything and keeps
+    every response, and "replay" serves the recorded responses without any network
+    access, so a recorded folder can be checked in and used by CI.
+    """
+
+    def __init__(self, root=None, mode="cache", max_bytes=DEFAULT_MAX_BYTES, default_ttl=DEFAULT_TTL,
+                 reuse_window=REUSE_WINDOW, recent_max_bytes=RECENT_MAX_BYTES):
+        if mode not in PAGE_CACHE_MODES[1:]:
+            raise ValueError(f"Unknown page cache mode: {mode!r} (expected one of {', '.join(PAGE_CACHE_MODES[1:])})")
+        self.root = root or default_page_cache_dir()
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.reuse_window = reuse_window
+        self.recent_max_bytes = recent_max_bytes
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        # Responses fetched by this process, by key and oldest first: (monotonic time, meta, body)
+        self._recent = OrderedDict()
+        self._recent_bytes = 0
+        # Total size of the cached responses, counted once and then kept up to date by the writes
+        self._size = None
+
+    def _path(self, key, suffix):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + suffix)
+
+    def _load(self, key):
+        try:
+            with open(self._path(key, ".json"), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(self._path(key, ".body"), 'rb') as f:
+                body = f.read()
+        except (FileNotFoundError, ValueError):
+            return None, None
+        try:
+            # The modification time of the metadata tracks use, for eviction
+            os.utime(self._path(key, ".json"))
+        except OSError:
+            pass  # a read-only recording
+        return meta, body
+
+    def _save(self, key, meta, body):
+        with self._lock:
+            if key in self._recent:
+                self._recent_bytes -= len(self._recent.pop(key)[2])
+            self._recent[key] = (time.monotonic(), meta, body)
+            self._recent_bytes += len(body)
+            now = time.monotonic()
+            while self._recent:
+                oldest_time, _, oldest_body = next(iter(self._recent.values()))
+                if self._recent_bytes <= self.recent_max_bytes and now - oldest_time < self.reuse_window:
+                    break
+                self._recent.popitem(last=False)
+                self._recent_bytes -= len(oldest_body)
+        if meta.get("lifetime") is None and self.mode == "cache":
+            return
+        self._write(key, meta, body)
+        if self.mode == "cache":
+            self.evict()
+
+    def _write(self, key, meta, body):
+        os.makedirs(os.path.dirname(self._path(key, "")), exist_ok=True)
+        written = 0
+        for suffix, data in ((".body", body), (".json", json.dumps(meta).encode('utf-8'))):
+            path = self._path(key, suffix)
+            try:
+                written -= os.path.getsize(path)
+            except OSError:
+                pass
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            written += len(data)
+        with self._lock:
+            if self._size is not None:
+                self._size += written
+
+    def _fetch(self, url, headers, entry=None, **kwargs):
+        request_headers = dict(headers or {})
+        if entry is not None:
+            entry_headers = CaseInsensitiveDict(entry["headers"])
+            if entry_headers.get("ETag"):
+                request_headers["If-None-Match"] = entry_headers["ETag"]
+            if entry_headers.get("Last-Modified"):
+                request_headers["If-Modified-Since"] = entry_headers["Last-Modified"]
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        response = requests.get(url, headers=request_headers, **kwargs)
+        if entry is not None and response.status_code == 304:
+            return entry, None
+        kept_headers = {name: value for name, value in response.headers.items()
+                        if name.lower() not in UNCACHED_HEADERS}
+        meta = {"url": response.url, "status": response.status_code, "headers": kept_headers,
+                "fetched_at": time.time(), "lifetime": freshness_lifetime(response.headers, self.default_ttl)}
+        return meta, response
+
+    def get(self, url, headers=None, **kwargs):
+        """
+        GET a page through the cache.
+
+        Conditional headers of the caller (If-None-Match, If-Modified-Since) are
+        answered from the cache with a 304 when they match the cached response. Without
+        a cached response they are sent to the server, and its 304 is returned as is.
+
+        Args:
+            url (str): The page URL.
+            headers (dict, optional): Request headers.
+            **kwargs: Further `requests.get` keyword arguments, used when the page is fetched.
+                The timeout defaults to `DEFAULT_TIMEOUT`.
+
+        Returns:
+            requests.Response: The response, with `from_cache` set when it was not fetched.
+
+        Raises:
+            ReplayMiss: In replay mode, if the URL was not recorded.
+        """
+        key = normalize_url(url)
+        meta = body = None
+        with self._lock:
+            recent = self._recent.get(key)
+        if recent is not None and time.monotonic() - recent[0] >= self.reuse_window:
+            recent = None
+        if recent is not None:
+            _, meta, body = recent
+        elif self.mode != "record":
+            meta, body = self._load(key)
+            if self.mode == "replay" and meta is None:
+                raise ReplayMiss(f"{url} was not recorded in {self.root}")
+
+        fresh = meta is not None and (self.mode == "replay" or recent is not None
+                                      or time.time() - meta["fetched_at"] < (meta["lifetime"] or 0))
+        headers = CaseInsensitiveDict(headers or {})
+        fetched = False
+        if not fresh:
+            stale = meta
+            if stale is None and self.mode == "cache":
+                # Nothing to answer the caller's validators from: the server does, and its
+                # 304 is passed through
+                request_headers = headers
+            else:
+                # The caller's own validators are answered below, from the cached response
+                # (a recording keeps full bodies)
+                request_headers = {name: value for name, value in headers.items()
+                                   if name.lower() not in ("if-none-match", "if-modified-since")}
+            meta, response = self._fetch(url, request_headers, stale, **kwargs)
+            if response is None:
+                # Revalidated: the stored body is still current
+                meta = dict(stale, fetched_at=time.time())
+            elif response.status_code == 200 or self.mode == "record":
+                body, fetched = response.content, True
+            else:
+                response.from_cache = False
+                return response
+            self._save(key, meta, body)
+
+        if self._matches(headers, CaseInsensitiveDict(meta["headers"])):
+            return build_response(meta["url"], 304, meta["headers"], b"", not fetched)
+        return build_response(meta["url"], meta["status"], meta["headers"], body, not fetched)
+
+    @staticmethod
+    def _matches(request_headers, response_headers):
+        etag = request_headers.get("If-None-Match")
+        last_modified = request_headers.get("If-Modified-Since")
+        return bool((etag and etag == response_headers.get("ETag"))
+                    or (last_modified and last_modified == response_headers.get("Last-Modified")))
+
+    def rendered(self, url):
+        """
+        Return the recorded rendering of a page in replay mode, or None in the other modes.
+
+        Raises:
+            ReplayMiss: In replay mode, if the rendering was not recorded.
+        """
+        if self.mode != "replay":
+            return None
+        meta, body = self._load("render:" + normalize_url(url))
+        if meta is None:
+            raise ReplayMiss(f"The rendering of {url} was not recorded in {self.root}")
+        return body.decode('utf-8')
+
+    def record_rendered(self, url, page_content):
+        """
+        Keep the rendering of a page, in record mode.
+        """
+        if self.mode == "record":
+            meta = {"url": url, "status": 200, "headers": {}, "fetched_at": time.time(), "lifetime": None}
+            self._save("render:" + normalize_url(url), meta, page_content.encode('utf-8'))
+
+    def media(self, url, destination):
+        """
+        Copy the recorded media file at a URL to `destination` in replay mode, or return None in the other modes.
+
+        Returns:
+            str: The destination path.
+
+        Raises:
+            ReplayMiss: In replay mode, if the media file was not recorded.
+        """
+        if self.mode != "replay":
+            return None
+        body_path = self._path("media:" + normalize_url(url), ".body")
+        if not os.path.isfile(body_path):
+            raise ReplayMiss(f"{url} was not recorded in {self.root}")
+        shutil.copyfile(body_path, destination)
+        return destination
+
+    def record_media(self, url, path):
+        """
+        Keep the media file downloaded from a URL to `path`, in record mode.
+        """
+        if self.mode == "record":
+            with open(path, 'rb') as f:
+                body = f.read()
+            meta = {"url": url, "status": 200, "headers": {}, "fetched_at": time.time(), "lifetime": None}
+            self._write("media:" + normalize_url(url), meta, body)
+
+    def size(self):
+        """
+        Return the total size of the cached responses in bytes.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".json"):
+                    meta_path = os.path.join(folder, name)
+                    body_path = meta_path[:-len(".json")] + ".body"
+                    try:
+                        stat = os.stat(meta_path)
+                        yield meta_path, stat.st_size + os.path.getsize(body_path), stat.st_mtime
+                    except FileNotFoundError:
+                        continue
+
+    def evict(self):
+        """
+        Remove least recently used responses once the cache outgrows `max_bytes`.
+
+        The cache folder is only walked when the size counted by this process goes
+        past `max_bytes` (and once at first use). It is then trimmed to `EVICT_TARGET`
+        of `max_bytes`, so the next walk is many saves away.
+        """
+        with self._lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes if total <= self.max_bytes else self.max_bytes * EVICT_TARGET
+        for meta_path, size, _ in entries:
+            if total <= target:
+                break
+            for path in (meta_path, meta_path[:-len(".json")] + ".body"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+        with self._lock:
+            self._size = total
+
+
+_shared_cache = None
+_shared_options = {"mode": "off"}
+_shared_lock = threading.Lock()
+
+
+def configure_page_cache(mode="cache", cache_dir=None, **options):
+    """
+    Set how the page fetches of this process use the page cache.
+
+    Args:
+        mode (str, optional): "off", "cache", "record" or "replay". Defaults to "cache".
+        cache_dir (str, optional): Location of the cache (or recording). Defaults to the user cache directory.
+        **options: Further PageCache keyword arguments.
+    """
+    global _shared_cache
+    if mode not in PAGE_CACHE_MODES:
+        raise ValueError(f"Unknown page cache mode: {mode!r} (expected one of {', '.join(PAGE_CACHE_MODES)})")
+    with _shared_lock:
+        _shared_cache = None
+        _shared_options.clear()
+        _shared_options.update(options, mode=mode, root=cache_dir)
+
+
+def shared_page_cache():
+    """
+    Return the process-wide PageCache, creating it on first use.
+
+    Returns:
+        PageCache: The shared cache, or None when the page cache is off (the default
+            until `configure_page_cache` is called).
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None and _shared_options["mode"] != "off":
+            _shared_cache = PageCache(**_shared_options)
+        return _shared_cache
+
+
+def http_get(url, **kwargs):
+    """
+    GET a page, through the shared page cache when it is on.
+
+    Args:
+        url (str): The page URL.
+        **kwargs: `requests.get` keyword arguments. The timeout defaults to `DEFAULT_TIMEOUT`.
+
+    Returns:
+        requests.Response: The response.
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    cache = shared_page_cache()
+    if cache is None:
+        return requests.get(url, **kwargs)
+    return cache.get(url, **kwargs)
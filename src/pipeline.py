@@ -0,0 +1,354 @@
+import os
+import re
+import itertools
+import shutil
+import tempfile
+from urllib.parse import urlparse
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional
+
+# Custom modules
+from .download_with_media import (ArticleDocument, STATIC_PAGE_ERRORS, fetch_article_document, fetch_static_if_changed,
+                                  compose_article_html)
+from .html_to_md import CONVERTER_ENGINES, convert_html
+from .clean_md import clean_markdown, write_text_atomic
+from .url_to_local import update_image_links_in_markdown
+from .media_index import LOCAL_MEDIA_FOLDER
+from .manifest import content_hash
+from .instrumentation import instrumented, timed
+
+
+@dataclass
+class Article:
+    """
+    An article as it moves through the conversion stages.
+
+    Each stage fills in the fields it produces, so nothing is written to disk
+    until `save` runs. Files are written to a private `work_folder` next to the
+    output folder and only moved into place by `publish`, so concurrent runs
+    never see (or clobber) each other's half-written output.
+    """
+    url: str
+    output_folder: str
+    html: Optional[str] = None
+    document: Optional[ArticleDocument] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+    markdown: Optional[str] = None
+    images: List[str] = field(default_factory=list)
+    markdown_path: Optional[str] = None
+    work_folder: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    source_hash: Optional[str] = None
+    skipped: bool = False
+    embedded: bool = False
+    engine: str = "html2text"
+
+
+def article_folder_name(url: str) -> str:
+    """
+    Derive a filesystem-safe folder name for an article from its URL.
+
+    :param url: URL of the Medium article
+    :return: The folder name
+    """
+    parsed = urlparse(url)
+    slug = parsed.path.rstrip('/').split('/')[-1] or parsed.netloc
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", slug).strip('-') or "article"
+
+
+@instrumented("check_for_changes", lambda article: {"skipped": article.skipped})
+def check_for_changes(article: Article, manifest, fetch_mode: str = "render") -> Article:
+    """
+    Decide from the manifest whether an article has to be converted again.
+
+    A conditional GET of the server-side HTML is made with the recorded ETag /
+    Last-Modified. On 304, or when the extracted content hashes the same as last
+    time, the article is marked `skipped`. Medium embeds per-request tokens in its
+    pages, so the hash covers the readability extraction rather than the raw bytes.
+    In static mode (and in auto mode when the static page holds the article) the
+    fetched page is kept, so a changed article is not fetched twice. When the static
+    page cannot be fetched or parsed the article counts as changed, and is fetched
+    the way `fetch_mode` says.
+
+    :param article: The article to check
+    :param manifest: Manifest of the previous runs
+    :param fetch_mode: "render", "static" or "auto"
+    :return: The article, with `skipped` set if nothing changed
+    """
+    entry = manifest.get(article.url) or {}
+    output_exists = bool(entry.get("output_path")) and os.path.exists(entry["output_path"])
+
+    try:
+        html, article.etag, article.last_modified = fetch_static_if_changed(
+            article.url, entry.get("etag"), entry.get("last_modified"))
+        if html is None:
+            if output_exists:
+                manifest.update(article.url)
+                article.skipped = True
+                return article
+            html, article.etag, article.last_modified = fetch_static_if_changed(article.url)
+
+        candidate = Article(article.url, article.output_folder, html, ArticleDocument(html, article.url),
+                            engine=article.engine)
+        _extract_document(candidate)
+    except STATIC_PAGE_ERRORS:
+        article.etag = article.last_modified = None
+        return article
+
+    article.source_hash = content_hash(candidate.title, candidate.markdown if candidate.embedded else candidate.content)
+    if manifest.is_current(article.url, article.source_hash):
+        manifest.update(article.url, etag=article.etag, last_modified=article.last_modified)
+        article.skipped = True
+    elif fetch_mode == "static" or (fetch_mode == "auto" and candidate.document.has_article_content()):
+        article.html, article.document, article.title = html, candidate.document, candidate.title
+        article.content, article.markdown, article.embedded = candidate.content, candidate.markdown, candidate.embedded
+    return article
+
+
+@instrumented("fetch")
+def fetch(article: Article, fetch_mode: str = "render", browser_context=None, on_progress=None) -> Article:
+    """
+    Fetch and parse the page of an article (once).
+
+    :param article: The article to fetch
+    :param fetch_mode: "render", "static" or "auto"
+    :param browser_context: Playwright context used in render mode
+    :param on_progress: Called with (bytes received, total bytes)
+    :return: The article with `html` and `document` set
+    """
+    article.document = fetch_article_document(article.url, fetch_mode, browser_context, on_progress)
+    article.html = article.document.page_content
+    return article
+
+
+def _extract_document(article: Article) -> Article:
+    embedded = article.document.embedded_markdown()
+    if embedded is not None:
+        article.title, article.markdown = embedded
+        article.embedded = True
+        return article
+    node = article.document.extract_article_node() if article.engine == "lxml" else None
+    article.title, article.content = node if node is not None else article.document.extract()
+    return article
+
+
+@instrumented("extract", lambda article: {"embedded": article.embedded})
+def extract(article: Article) -> Article:
+    """
+    Extract the title and main content of a fetched article from its parsed page.
+
+    When the page embeds the post as JSON (Medium's Apollo state), the markdown is
+    rendered from it directly: `markdown` is set and `embedded` marked, and `convert`
+    and `clean` have nothing left to do. With the "lxml" engine the content is the
+    <article> element as it is, and readability only runs for pages without one.
+
+    :param article: The fetched article
+    :return: The article with `title` and `content` (or `markdown`) set
+    """
+    if article.document is None:
+        article.document = ArticleDocument(article.html, article.url)
+    return _extract_document(article)
+
+
+@instrumented("convert", lambda article: {"markdown_chars": len(article.markdown)})
+def convert(article: Article) -> Article:
+    """
+    Convert an extracted article to markdown.
+
+    The "html2text" engine converts the whole page followed by the extracted content,
+    in the conversion process pool when one is configured. The "lxml" engine walks
+    the article element of the parsed page only (see `medium_markdown`). The page
+    HTML, its parse tree and the extracted content are released once converted, so
+    from here on an article only holds its markdown. Embedded articles already have theirs.
+
+    :param article: The extracted article
+    :return: The article with `markdown` set
+    """
+    if article.embedded:
+        pass
+    elif article.engine == "lxml":
+        article.markdown = article.document.article_markdown(article.title, article.content)
+    else:
+        article.markdown = convert_html(compose_article_html(article.html, article.title, article.content))
+    article.html = article.document = article.content = None
+    return article
+
+
+@instrumented("clean")
+def clean(article: Article) -> Article:
+    """
+    Strip Medium boilerplate from the markdown of an article. Only html2text output
+    has any: embedded articles and the "lxml" engine never convert the page around
+    the article.
+
+    :param article: The converted article
+    :return: The article with cleaned `markdown`
+    """
+    if not article.embedded and article.engine == "html2text":
+        article.markdown = clean_markdown(article.markdown)
+    return article
+
+
+@instrumented("localize_images", lambda article: {"images": len(article.images)})
+def localize_images(article: Article, fetcher=None, on_progress=None) -> Article:
+    """
+    Download the images linked in the markdown and point the links at the local copies.
+
+    :param article: The cleaned article
+    :param fetcher: MediaFetcher used for the images, defaults to the shared one
+    :param on_progress: Called with (images fetched, total images)
+    :return: The article with local image links and `images` set
+    """
+    folder = article.work_folder or article.output_folder
+    os.makedirs(os.path.join(folder, LOCAL_MEDIA_FOLDER), exist_ok=True)
+    article.markdown, article.images = update_image_links_in_markdown(article.markdown, folder,
+                                                                      fetcher, on_progress)
+    return article
+
+
+@instrumented("save", lambda article: {"bytes": os.path.getsize(article.markdown_path)})
+def save(article: Article) -> Article:
+    """
+    Write the markdown of an article to its working folder (or output folder).
+
+    :param article: The finished article
+    :return: The article with `markdown_path` set
+    """
+    folder = article.work_folder or article.output_folder
+    os.makedirs(folder, exist_ok=True)
+    article.markdown_path = os.path.join(folder, f"{article.title}.md")
+    write_text_atomic(article.markdown_path, article.markdown)
+    return article
+
+
+def prepare_output_folder(article: Article) -> Article:
+    """
+    Create the private working folder the files of an article are written to.
+
+    The folder is a hidden sibling of the output folder, so `publish` can move it
+    into place with a rename.
+
+    :param article: The article
+    :return: The article with `work_folder` set
+    """
+    parent, name = os.path.split(os.path.abspath(article.output_folder))
+    os.makedirs(parent, exist_ok=True)
+    article.work_folder = tempfile.mkdtemp(prefix=f".{name}-", suffix=".partial", dir=parent)
+    return article
+
+
+@instrumented("publish")
+def publish(article: Article) -> Article:
+    """
+    Replace the output folder of an article with its working folder.
+
+    The previous output stays complete until the new one is renamed into place.
+
+    :param article: The saved article
+    :return: The article with `markdown_path` pointing into the output folder
+    """
+    if article.work_folder is None:
+        return article
+    parent, name = os.path.split(os.path.abspath(article.output_folder))
+    stale = tempfile.mkdtemp(prefix=f".{name}-", suffix=".old", dir=parent)
+    try:
+        # Another run may publish the same article in between, so retry until the rename wins
+        for attempt in itertools.count():
+            if os.path.exists(article.output_folder):
+                os.replace(article.output_folder, os.path.join(stale, str(attempt)))
+            try:
+                os.replace(article.work_folder, article.output_folder)
+                break
+            except OSError:
+                if not os.path.exists(article.output_folder):
+                    raise
+    finally:
+        shutil.rmtree(stale, ignore_errors=True)
+
+    if article.markdown_path is not None:
+        article.markdown_path = os.path.join(article.output_folder, os.path.basename(article.markdown_path))
+    article.images = [os.path.join(article.output_folder, os.path.relpath(path, article.work_folder))
+                      for path in article.images]
+    article.work_folder = None
+    return article
+
+
+def discard_work_folder(article: Article) -> Article:
+    """
+    Remove the working folder of an article that failed, leaving its output folder untouched.
+
+    :param article: The article
+    :return: The article
+    """
+    if article.work_folder is not None:
+        shutil.rmtree(article.work_folder, ignore_errors=True)
+        article.work_folder = None
+    return article
+
+
+def run_pipeline(url: str, output_folder: str, fetch_mode: str = "render",
+                 browser_context=None, fetcher=None, manifest=None, engine: str = "html2text") -> Article:
+    """
+    Convert one article in memory: read it from the network once and write it to disk once.
+
+    Every stage emits a "stage" event, and the whole conversion an "article" event
+    (see the `instrumentation` module).
+
+    All files are written to a private working folder that replaces the output folder
+    only once the article is complete, so a failure at any stage leaves the previous
+    output in place and concurrent runs do not clobber each other.
+
+    :param url: URL of the Medium article
+    :param output_folder: Folder the markdown and its images are written to
+    :param fetch_mode: "render", "static" or "auto"
+    :param browser_context: Playwright context used in render mode
+    :param fetcher: MediaFetcher used for the images, defaults to the shared one
+    :param manifest: Manifest of previous runs; when given, unchanged articles are skipped
+        and the manifest is updated after saving
+    :param engine: "html2text" or "lxml", see `convert`
+    :return: The saved (or skipped) article
+    """
+    if engine not in CONVERTER_ENGINES:
+        raise ValueError(f"Unknown converter engine: {engine!r} (expected one of {', '.join(CONVERTER_ENGINES)})")
+    article = Article(url, output_folder, engine=engine)
+    with timed("article", url=url, mode=fetch_mode, engine=engine) as event:
+        if manifest is not None and check_for_changes(article, manifest, fetch_mode).skipped:
+            event["skipped"] = True
+            return article
+
+        if article.html is None:
+            fetch(article, fetch_mode, browser_context)
+        if article.content is None and not article.embedded:
+            extract(article)
+        convert(article)
+        clean(article)
+        prepare_output_folder(article)
+        try:
+            localize_images(article, fetcher)
+            save(article)
+            publish(article)
+        finally:
+            discard_work_folder(article)
+        event["images"] = len(article.images)
+
+    if manifest is not None:
+        manifest.update(url, etag=article.etag, last_modified=article.last_modified,
+                        content_hash=article.source_hash, output_path=article.markdown_path)
+    return article
+
+
+def run_pipelines(urls: Iterable[str], output_root: str, **options) -> Iterator[Article]:
+    """
+    Convert many articles one after the other, yielding each as soon as it is saved.
+
+    URLs are consumed lazily and every article gets its own sub-folder of `output_root`.
+
+    :param urls: URLs of the Medium articles
+    :param output_root: Folder holding one sub-folder per article
+    :param options: Keyword arguments passed to `run_pipeline`
+    :return: Iterator over the saved articles
+    """
+    for url in urls:
+        yield run_pipeline(url, os.path.join(output_root, article_folder_name(url)), **options)
@@ -4,6 +4,15 @@ import requests
 import glob
 import shutil
 
+# Custom modules
+from .media_fetcher import shared_fetcher, stream_to_file, MediaTooLarge, DEFAULT_TIMEOUT
+from .clean_md import write_text_atomic
+from .media_index import MediaIndex, LOCAL_MEDIA_FOLDER, local_media_path, unique_image_urls, rewrite_links
+
+
+# Markdown image links to remote images
+IMAGE_LINK_PATTERN = re.compile(r"!\[[^\]]*\]\((https?://.+?\.(?:jpg|jpeg|png|gif))\)")
+
 
 def download_image(url, output_folder):
     """
@@ -16,90 +25,104 @@ def download_image(url, output_folder):
     Returns:
         str: The local path to the image if the download was successful, otherwise None.
     """
-    # Send a GET request to the URL
-    response = requests.get(url)
-
-    # If the request was successful, save the image
-    if response.status_code == 200:
-        image_name = os.path.basename(url)
-        image_path = os.path.join(output_folder, "local", image_name)
-        with open(image_path, 'wb') as f:
-            f.write(response.content)
-        return image_path
+    # Send a GET request to the URL, streaming the body instead of buffering it
+    response = requests.get(url, stream=True, timeout=DEFAULT_TIMEOUT)
+    try:
+        # If the request was successful, save the image chunk by chunk
+        if response.status_code == 200:
+            image_path = os.path.join(output_folder, local_media_path(url))
+            try:
+                return stream_to_file(response, image_path)
+            except MediaTooLarge:
+                return None
+    finally:
+        response.close()
 
     return None
 
 
-def update_image_links_in_markdown(markdown_content, output_folder):
+def find_image_urls(markdown_content):
+    """
+    Find the remote images linked in markdown content.
+
+    Args:
+        markdown_content (str): The markdown content to search.
+
+    Returns:
+        list: The distinct image URLs, in order of first appearance. Resized variants
+            of the same Medium image count once.
+    """
+    return unique_image_urls(IMAGE_LINK_PATTERN.findall(markdown_content))
+
+
+def update_image_links_in_markdown(markdown_content, output_folder, fetcher=None, on_progress=None):
     """
     Update the image links in the markdown content to point to their local versions.
 
+    The images are downloaded concurrently over a pooled connection, each one once
+    even when the markdown links several sizes of it. The links are then rewritten
+    in a single pass over the markdown.
+
     Args:
         markdown_content (str): The markdown content to be updated.
         output_folder (str): The directory where the images are saved.
+        fetcher (MediaFetcher, optional): Fetcher used for the images. Defaults to the shared one.
+        on_progress (function, optional): Called with (images fetched, total images).
 
     Returns:
         str: The updated markdown content.
         list: A list of the local paths to the images.
     """
-    # Regex pattern to find all image links in the markdown content
-    pattern = r"!\[\]\((https?://.+?\.(?:jpg|jpeg|png|gif))\)"
-
-    # Find all image URLs in the markdown content
-    image_urls = re.findall(pattern, markdown_content)
-
-    # For each image URL, download the image and update the link
+    # Download every distinct image once, then update the links
+    jobs = [(url, os.path.join(output_folder, local_media_path(url))) for url in find_image_urls(markdown_content)]
+    index = MediaIndex()
     local_image_paths = []
-    for url in image_urls:
-        local_image_path = download_image(url, output_folder)
-        if local_image_path:
-            local_image_paths.append(local_image_path)
-            markdown_content = markdown_content.replace(url, os.path.relpath(local_image_path, output_folder))
+    for result in (fetcher or shared_fetcher()).fetch_all(jobs, on_progress):
+        if result.error is None:
+            local_image_paths.append(result.path)
+            index.add(result.url, os.path.relpath(result.path, output_folder))
+    markdown_content = rewrite_links(markdown_content, index)
 
     return markdown_content, local_image_paths
 
 
-def url_to_local():
+def url_to_local(output_folder, on_progress=None):
     """
-    Download all images linked in a markdown file and replace the links with local paths.
+    Download all images linked in the markdown files of a folder and replace the links with local paths.
 
-    Returns:
-        None
-    """
-    # Define the output directory
-    output_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "output")
+    Every markdown file in the folder is updated; the images of all of them are
+    saved to the folder's `local` directory.
 
-    # Create the output directory if it doesn't exist
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    Args:
+        output_folder (str): The directory holding the markdown files.
+        on_progress (function, optional): Called with (images fetched, total images) for each file.
 
+    Returns:
+        list: The paths of the updated markdown files.
+    """
     # Get a list of all markdown files in the output directory
-    input_files = glob.glob(os.path.join(output_folder, "*.md"))
+    input_files = sorted(glob.glob(os.path.join(output_folder, "*.md")))
 
-    # If there are no markdown files or more than one, print an error message
+    # If there are no markdown files, print an error message
     if not input_files:
         print("No markdown files found in the output folder.")
-    elif len(input_files) > 1:
-        print("More than one markdown file found in the output folder. Please ensure there's only one.")
-    else:
-        input_file_path = input_files[0]
+        return []
 
-        # Create a directory for the local images
-        local_folder = os.path.join(output_folder, "local")
-        if not os.path.exists(local_folder):
-            os.makedirs(local_folder)
+    # Create a directory for the local images
+    os.makedirs(os.path.join(output_folder, LOCAL_MEDIA_FOLDER), exist_ok=True)
 
+    for input_file_path in input_files:
         # Open the markdown file, download all images and update the links
         with open(input_file_path, 'r') as f:
             markdown_content = f.read()
 
-        updated_content, local_image_paths = update_image_links_in_markdown(markdown_content, output_folder)
+        updated_content, local_image_paths = update_image_links_in_markdown(markdown_content, output_folder,
+                                                                            on_progress=on_progress)
 
         # Save the updated markdown content
-        with open(input_file_path, 'w') as f:
-            f.write(updated_content)
+        write_text_atomic(input_file_path, updated_content)
 
-        # print("Images downloaded and markdown file updated successfully.")
+    return input_files
 
 
 # if __name__ == "__main__":
@@ -0,0 +1,57 @@
+import time
+import threading
+from unittest.mock import MagicMock
+
+import requests
+
+from src.media_fetcher import FetchResult
+
+
+def fake_fetcher():
+    """MediaFetcher stand-in that writes every image as the bytes b"image"."""
+    fetcher = MagicMock()
+
+    def fetch_all(jobs, on_progress=None):
+        results = []
+        for url, path in jobs:
+            with open(path, 'wb') as f:
+                f.write(b"image")
+            results.append(FetchResult(url, path, None))
+        return results
+
+    fetcher.fetch_all.side_effect = fetch_all
+    return fetcher
+
+
+class FakeSession:
+    """
+    Session stand-in answering every url with its own name, or 404 for `fail_urls`.
+
+    It records how many requests per host run at once, in `peak`.
+    """
+
+    def __init__(self, fail_urls=()):
+        self.fail_urls = set(fail_urls)
+        self.active = {}
+        self.peak = {}
+        self.lock = threading.Lock()
+
+    def get(self, url, stream=False, timeout=None, headers=None):
+        host = url.split("/")[2]
+        with self.lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        time.sleep(0.01)
+        with self.lock:
+            self.active[host] -= 1
+
+        response = MagicMock()
+        response.__enter__.return_value = response
+        response.raw.retries.history = ()
+        if url in self.fail_urls:
+            response.raise_for_status.side_effect = requests.HTTPError("404 Client Error")
+        response.iter_content.return_value = [url.encode()]
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,95 @@
+import os
+import asyncio
+import unittest
+from unittest.mock import patch, AsyncMock
+
+import httpx
+
+from src.async_pipeline import AsyncConverter, ConvertedArticle, MediaFile
+
+PAGE = """<html><head><title>A Test Article</title></head><body>
+<article>
+<h1>A Test Article</h1>
+<p>Subtitle of the article</p>
+<p>Share</p>
+<p>The first paragraph of the article is long enough for readability to keep it around.</p>
+<img src="https://miro.medium.com/1*abc.png">
+<img src="https://miro.medium.com/missing.png">
+<p>The second paragraph of the article is also long enough for readability to keep it.</p>
+</article>
+</body></html>"""
+
+
+def handler(request):
+    if request.url.path == "/missing.png":
+        return httpx.Response(404)
+    if request.url.host == "miro.medium.com":
+        return httpx.Response(200, content=b"image")
+    return httpx.Response(200, text=PAGE)
+
+
+class TestAsyncConverter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_convert_article_in_memory(self):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        async with AsyncConverter("static", client=client) as converter:
+            article = await converter.convert_article("https://medium.com/a-test-article")
+        await client.aclose()
+
+        self.assertIsInstance(article, ConvertedArticle)
+        self.assertEqual(article.title, "A Test Article")
+        local_path = os.path.join("local", "1*abc.png")
+        self.assertEqual(article.media, [MediaFile("https://miro.medium.com/1*abc.png", local_path, b"image")])
+        self.assertIn(f"]({local_path})", article.markdown)
+        self.assertIn("https://miro.medium.com/missing.png", article.markdown)
+        self.assertIn("The first paragraph of the article", article.markdown)
+
+    async def test_concurrent_conversions_share_the_converter(self):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        async with AsyncConverter("static", client=client) as converter:
+            articles = await asyncio.gather(*(converter.convert_article(f"https://medium.com/article-{i}")
+                                              for i in range(5)))
+        await client.aclose()
+
+        self.assertEqual([article.url for article in articles],
+                         [f"https://medium.com/article-{i}" for i in range(5)])
+        self.assertEqual(len({article.markdown for article in articles}), 1)
+
+    @patch.object(AsyncConverter, "fetch_rendered_html", new_callable=AsyncMock, return_value=PAGE)
+    async def test_auto_mode_renders_unusable_static_pages(self, mock_rendered):
+        # A 403, and a page that does not parse: the same rule as the sync pipeline
+        for response in (httpx.Response(403), httpx.Response(200, text="")):
+            client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request, response=response: response))
+            async with AsyncConverter("auto", client=client) as converter:
+                document = await converter.fetch_document("https://medium.com/a-test-article")
+            await client.aclose()
+
+            self.assertEqual(document.page_content, PAGE)
+        self.assertEqual(mock_rendered.await_count, 2)
+
+    async def test_timeout_cancels_the_conversion(self):
+        cancelled = asyncio.Event()
+
+        async def slow_handler(request):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return httpx.Response(200, text=PAGE)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(slow_handler))
+        async with AsyncConverter("static", client=client) as converter:
+            with self.assertRaises(asyncio.TimeoutError):
+                await converter.convert_article("https://medium.com/a-test-article", timeout=0.05)
+        await client.aclose()
+
+        self.assertTrue(cancelled.is_set())
+
+    def test_unknown_fetch_mode(self):
+        with self.assertRaises(ValueError):
+            AsyncConverter("telepathy")
+
+
+if __name__ == "__main__":
+    unittest.main()
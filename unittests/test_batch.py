@@ -0,0 +1,102 @@
+import io
+import os
+import sys
+import unittest
+from unittest.mock import patch, MagicMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.batch import read_urls, article_folder_name, run_batch, LazyBrowserContext
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_read_urls_skips_blank_and_comment_lines(self):
+        stream = io.StringIO("https://medium.com/a\n\n# comment\n  https://medium.com/b  \n")
+        self.assertEqual(list(read_urls(stream)), ["https://medium.com/a", "https://medium.com/b"])
+
+    def test_article_folder_name(self):
+        url = "https://siddharthksah.medium.com/synthetic-data-test-article-727e1f8ac2cb/"
+        self.assertEqual(article_folder_name(url), "synthetic-data-test-article-727e1f8ac2cb")
+        self.assertEqual(article_folder_name("https://medium.com/p/a b?x=1"), "a-b")
+
+    @patch('src.batch.convert_article')
+    @patch('playwright.sync_api.sync_playwright')
+    def test_run_batch_reuses_browser_per_worker(self, mock_sync_playwright, mock_convert_article):
+        def convert(url, output_folder, browser_context, **options):
+            if url.endswith("bad"):
+                raise RuntimeError("boom")
+
+        mock_convert_article.side_effect = convert
+        urls = [f"https://medium.com/post-{i}" for i in range(6)] + ["https://medium.com/bad"]
+        seen = []
+
+        results = run_batch(iter(urls), "/tmp/out", workers=2, on_result=seen.append)
+
+        self.assertEqual([result.url for result in results], urls)
+        self.assertEqual(len(seen), len(urls))
+        self.assertTrue(all(result.success for result in results[:-1]))
+        self.assertFalse(results[-1].success)
+        self.assertEqual(results[-1].error, "boom")
+        self.assertEqual(results[0].output_folder, os.path.join("/tmp/out", "post-0"))
+        # One browser launch per worker, not per article
+        launch = mock_sync_playwright.return_value.__enter__.return_value.chromium.launch
+        self.assertEqual(launch.call_count, 2)
+
+    @patch('src.batch.convert_article')
+    @patch('playwright.sync_api.sync_playwright')
+    def test_run_batch_reports_browser_startup_failure(self, mock_sync_playwright, mock_convert_article):
+        mock_sync_playwright.return_value.__enter__.side_effect = RuntimeError("no chromium")
+
+        results = run_batch(["https://medium.com/a", "https://medium.com/b"], "/tmp/out", workers=1)
+
+        self.assertEqual([result.success for result in results], [False, False])
+        self.assertEqual(results[0].error, "no chromium")
+        mock_convert_article.assert_not_called()
+
+    @patch('src.batch.convert_article')
+    @patch('playwright.sync_api.sync_playwright')
+    def test_run_batch_auto_mode_launches_browser_only_when_needed(self, mock_sync_playwright, mock_convert_article):
+        def convert(url, output_folder, browser_context, **options):
+            if url.endswith("needs-browser"):
+                browser_context.new_page()
+
+        mock_convert_article.side_effect = convert
+
+        run_batch(["https://medium.com/a", "https://medium.com/b"], "/tmp/out", workers=1, fetch_mode="auto")
+        mock_sync_playwright.assert_not_called()
+
+        run_batch(["https://medium.com/a", "https://medium.com/needs-browser", "https://medium.com/needs-browser"],
+                  "/tmp/out", workers=1, fetch_mode="auto")
+        launch = mock_sync_playwright.return_value.start.return_value.chromium.launch
+        self.assertEqual(launch.call_count, 1)
+        launch.return_value.close.assert_called_once()
+
+    @patch('playwright.sync_api.sync_playwright')
+    def test_lazy_context_stops_playwright_when_the_launch_fails(self, mock_sync_playwright):
+        playwright = mock_sync_playwright.return_value.start.return_value
+        playwright.chromium.launch.side_effect = [RuntimeError("no chromium"), MagicMock()]
+        context = LazyBrowserContext()
+
+        with self.assertRaises(RuntimeError):
+            context.new_page()
+        playwright.stop.assert_called_once()
+
+        context.new_page()
+        context.close()
+        self.assertEqual(mock_sync_playwright.return_value.start.call_count, 2)
+        self.assertEqual(playwright.stop.call_count, 2)
+
+    @patch('src.batch.run_pipeline')
+    def test_run_batch_passes_options_to_the_pipeline(self, mock_run_pipeline):
+        mock_run_pipeline.return_value = MagicMock(skipped=False)
+
+        results = run_batch(["https://medium.com/a"], "/tmp/out", workers=1, fetch_mode="static", engine="lxml")
+
+        self.assertTrue(results[0].success, results[0].error)
+        mock_run_pipeline.assert_called_once_with("https://medium.com/a", os.path.join("/tmp/out", "a"), "static",
+                                                  None, manifest=None, engine="lxml")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench import StandInServer, compare  # noqa: E402
+from fixtures import build_corpus  # noqa: E402
+
+
+class TestBench(unittest.TestCase):
+
+    def test_compare_flags_only_slowdowns_over_threshold(self):
+        baseline = {"timings": {"a": 1.0, "b": 1.0, "c": 0.001, "gone": 1.0}}
+        results = {"timings": {"a": 1.2, "b": 1.3, "c": 0.004, "new": 5.0}}
+
+        self.assertEqual(compare(results, baseline, threshold=0.25), [("b", 1.0, 1.3)])
+
+    def test_corpus_is_deterministic(self):
+        first, second = build_corpus("http://host/"), build_corpus("http://host/")
+        self.assertEqual(first, second)
+        self.assertTrue({"small", "long-form", "image-heavy", "code-heavy"} <= set(first))
+
+    def test_stand_in_server_serves_pages_and_images(self):
+        with StandInServer(build_corpus) as server:
+            page = requests.get(server.url("small"), timeout=5)
+            image = requests.get(server.base_url + "max/1400/1*abc.png", timeout=5)
+            missing = requests.get(server.url("nope"), timeout=5)
+
+        self.assertIn("<article>", page.text)
+        self.assertTrue(image.content.startswith(b"\x89PNG"))
+        self.assertEqual(missing.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,9 +3,13 @@ import sys, shutil
 # Add the parent directory of the 'src' directory to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import unittest
+from unittest.mock import patch
+
+from src import clean_md
 
 from src.clean_md import list_markdown_files, process_single_file, extract_first_heading_and_next_line, \
-    remove_section_after, remove_until, add_heading, find_last_line_containing, delete_lines_from
+    remove_section_after, remove_until, add_heading, find_last_line_containing, delete_lines_from, clean_markdown, \
+    cut_until, CleaningRule
 
 
 class TestCleanMd(unittest.TestCase):
@@ -117,6 +121,42 @@ class TestCleanMd(unittest.TestCase):
         # Assert that the lines are deleted
         self.assertEqual(modified_content.strip(), "This is the first line.\n\nThis is the second line.")
 
+    def test_clean_markdown(self):
+        markdown = ("# Title\nSubtitle\n\nNav Share\n\nBody line.\n\n"
+                    "## Written by Someone\n\nBio\n\n## More from Someone\n\nOther posts")
+
+        cleaned = clean_markdown(markdown)
+
+        self.assertEqual(cleaned, "# Title Subtitle\n\nBody line.\n\n")
+
+    def test_clean_markdown_custom_rules_treat_markers_literally(self):
+        rules = [CleaningRule("cut_after", "## Footer (1)"), CleaningRule("cut_after", "[ad]")]
+
+        cleaned = clean_markdown("Body\n## Footer (1)\nmore\n[ad] banner", rules)
+
+        self.assertEqual(cleaned, "Body\n")
+        with self.assertRaises(ValueError):
+            clean_markdown("Body", [CleaningRule("explode", None)])
+
+    def test_cut_until_ignores_keyword_on_unterminated_last_line(self):
+        self.assertEqual(cut_until("a\nShare it\nbody\nShare", "Share"), "body\nShare")
+        self.assertEqual(cut_until("no newline Share", "Share"), "no newline Share")
+
+    def test_process_single_file_reads_and_writes_once(self):
+        md_file_path = os.path.join(self.output_folder, "sample.md")
+        with open(md_file_path, 'w') as f:
+            f.write("# Title\nSubtitle\n\nNav Share\n\nBody line.\n\n## More from Someone\n")
+
+        with patch('src.clean_md.read_text', wraps=clean_md.read_text) as mock_read, \
+                patch('src.clean_md.write_text_atomic', wraps=clean_md.write_text_atomic) as mock_write:
+            process_single_file(md_file_path)
+
+        self.assertEqual(mock_read.call_count, 1)
+        self.assertEqual(mock_write.call_count, 1)
+        with open(md_file_path, 'r') as f:
+            self.assertEqual(f.read(), "# Title Subtitle\n\nBody line.\n\n")
+        self.assertEqual(os.listdir(self.output_folder), ["sample.md"])
+
 
 if __name__ == "__main__":
     unittest.main()
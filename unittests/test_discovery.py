@@ -0,0 +1,180 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from src.discovery import Source, parse_source, canonical_article_url, listings, discover
+from src.download_with_media import ArticleDocument
+from src.page_cache import build_response
+from src.main import run_batch_mode
+from src.media_fetcher import configure_shared_fetcher
+from fakes import FakeSession
+
+ARTICLE_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "quotes-and-mixtape.html")
+
+RSS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Stories</title>
+<item><title>Second</title><link>https://medium.com/pub/second-post-bbbbbbbb0002?source=rss----1</link></item>
+<item><title>First</title><link>https://medium.com/pub/first-post-aaaaaaaa0001?source=rss----1</link></item>
+</channel></rss>"""
+
+SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+<sitemap><loc>https://blog.example.com/sitemap/posts/2024.xml</loc></sitemap>
+<sitemap><loc>https://blog.example.com/sitemap/tags.xml</loc></sitemap>
+<sitemap><loc>https://blog.example.com/sitemap/posts/2023.xml</loc></sitemap>
+</sitemapindex>"""
+
+
+def urlset(*urls):
+    locations = "".join(f"<url><loc>{url}</loc></url>" for url in urls)
+    return f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locations}</urlset>'.encode()
+
+
+def page(*hrefs):
+    return ("<html><body>" + "".join(f'<a href="{href}">link</a>' for href in hrefs) + "</body></html>").encode()
+
+
+class FakeWeb:
+    """Serves listing pages from a dict and records what was fetched."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.fetched = []
+
+    def __call__(self, url):
+        self.fetched.append(url)
+        if url not in self.pages:
+            return build_response(url, 404, {}, b"Not found", from_cache=False)
+        return build_response(url, 200, {"Content-Type": "text/xml"}, self.pages[url], from_cache=False)
+
+
+class TestDiscovery(unittest.TestCase):
+
+    def test_parse_source(self):
+        self.assertEqual(parse_source("@ada"), Source("author", "@ada", "https://medium.com/@ada"))
+        self.assertEqual(parse_source("https://medium.com/@ada/"), Source("author", "@ada", "https://medium.com/@ada"))
+        self.assertEqual(parse_source("tag:python"), Source("tag", "python", "https://medium.com/tag/python"))
+        self.assertEqual(parse_source("medium.com/tag/python"), Source("tag", "python", "https://medium.com/tag/python"))
+        self.assertEqual(parse_source("https://medium.com/pub"), Source("publication", "pub", "https://medium.com/pub"))
+        self.assertEqual(parse_source("https://Blog.Example.com/about"),
+                         Source("site", "blog.example.com", "https://blog.example.com"))
+        self.assertEqual(parse_source("https://medium.com/feed/@ada").kind, "feed")
+        self.assertEqual(parse_source("https://blog.example.com/sitemap/sitemap.xml").kind, "sitemap")
+        for spec in ("medium.com", "python", "@"):
+            with self.assertRaises(ValueError):
+                parse_source(spec)
+
+    def test_canonical_article_url(self):
+        self.assertEqual(canonical_article_url("http://Medium.com/@ada/a-post-1a2b3c4d5e6f/?source=home#top"),
+                         "https://medium.com/@ada/a-post-1a2b3c4d5e6f")
+        self.assertEqual(canonical_article_url("https://medium.com/p/1a2b3c4d5e6f"), "https://medium.com/p/1a2b3c4d5e6f")
+        # Ids are hex, and some happen to be all digits
+        self.assertEqual(canonical_article_url("https://medium.com/@ada/a-post-123456789012"),
+                         "https://medium.com/@ada/a-post-123456789012")
+        for url in ("https://medium.com/tag/python/archive/2020", "https://medium.com/@ada/followers",
+                    "https://medium.com/m/signin", "mailto:ada@example.com"):
+            self.assertIsNone(canonical_article_url(url))
+
+    def test_listings(self):
+        self.assertEqual([listing.url for listing in listings(parse_source("@ada"), since=2020)],
+                         ["https://medium.com/feed/@ada"])
+        self.assertEqual([listing.url for listing in listings(parse_source("tag:go"), since=2023, until=2024)],
+                         ["https://medium.com/feed/tag/go", "https://medium.com/tag/go/archive/2024",
+                          "https://medium.com/tag/go/archive/2023"])
+        self.assertEqual([listing.kind for listing in listings(parse_source("blog.example.com"))], ["feed", "sitemap"])
+
+    def test_feed_and_sitemap_are_deduplicated(self):
+        web = FakeWeb({
+            "https://blog.example.com/feed": RSS.replace(b"https://medium.com/pub/", b"https://blog.example.com/"),
+            "https://blog.example.com/sitemap/sitemap.xml": SITEMAP_INDEX,
+            "https://blog.example.com/sitemap/posts/2024.xml": urlset("https://blog.example.com/second-post-bbbbbbbb0002",
+                                                                      "https://blog.example.com/third-post-cccccccc0003"),
+            "https://blog.example.com/sitemap/posts/2023.xml": urlset("https://blog.example.com/about",
+                                                                      "https://blog.example.com/p/aaaaaaaa0001"),
+        })
+
+        urls = list(discover(["https://blog.example.com"], fetch=web))
+
+        self.assertEqual(urls, ["https://blog.example.com/second-post-bbbbbbbb0002",
+                                "https://blog.example.com/first-post-aaaaaaaa0001",
+                                "https://blog.example.com/third-post-cccccccc0003"])
+        self.assertNotIn("https://blog.example.com/sitemap/tags.xml", web.fetched)
+
+    def test_archive_pages_follow_months_and_stay_in_scope(self):
+        web = FakeWeb({
+            "https://medium.com/feed/pub": RSS,
+            "https://medium.com/pub/archive/2024": page("/pub/archive/2024/01", "/pub/archive/2024/02",
+                                                        "/pub/archive/2023"),
+            "https://medium.com/pub/archive/2024/01": page("/pub/january-post-dddddddd0004?source=archive",
+                                                           "https://medium.com/other/elsewhere-eeeeeeee0005"),
+            "https://medium.com/pub/archive/2024/02": page("https://medium.com/pub/first-post-aaaaaaaa0001"),
+        })
+
+        urls = list(discover(["https://medium.com/pub"], since=2024, fetch=web))
+
+        self.assertEqual(urls, ["https://medium.com/pub/second-post-bbbbbbbb0002",
+                                "https://medium.com/pub/first-post-aaaaaaaa0001",
+                                "https://medium.com/pub/january-post-dddddddd0004"])
+        # The link to 2023 is no month of 2024, and 2023 is before `since`
+        self.assertNotIn("https://medium.com/pub/archive/2023", web.fetched)
+
+    def test_urls_are_yielded_while_paging(self):
+        web = FakeWeb({"https://medium.com/feed/pub": RSS,
+                       "https://medium.com/pub/archive/2024": page("/pub/later-post-ffffffff0006")})
+        urls = discover(["https://medium.com/pub"], since=2024, fetch=web)
+
+        self.assertEqual(next(urls), "https://medium.com/pub/second-post-bbbbbbbb0002")
+        self.assertEqual(web.fetched, ["https://medium.com/feed/pub"])
+        self.assertEqual(list(urls)[-1], "https://medium.com/pub/later-post-ffffffff0006")
+
+    def test_failing_listings_are_reported_and_skipped(self):
+        def fetch(url):
+            if "feed/@broken" in url:
+                raise requests.ConnectionError("connection refused")
+            return FakeWeb({"https://medium.com/feed/@ada": RSS, "https://medium.com/feed/@junk": b"\x00"})(url)
+
+        errors = []
+        urls = list(discover(["@broken", "@missing", "@junk", "@ada"], fetch=fetch,
+                             on_error=lambda url, error: errors.append(url)))
+
+        self.assertEqual(len(urls), 2)
+        self.assertEqual(errors, ["https://medium.com/feed/@broken", "https://medium.com/feed/@missing",
+                                  "https://medium.com/feed/@junk"])
+
+
+class TestDiscoveryBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.output_root = tempfile.mkdtemp()
+        # No media cache in the user's cache folder, and no network
+        configure_shared_fetcher(use_cache=False, session=FakeSession())
+        self.addCleanup(configure_shared_fetcher)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_root)
+
+    @patch('src.pipeline.fetch_article_document')
+    @patch('src.discovery.http_get')
+    def test_discovered_urls_are_converted(self, mock_get, mock_fetch):
+        mock_get.side_effect = lambda url, **kwargs: FakeWeb({"https://medium.com/feed/pub": RSS})(url)
+        with open(ARTICLE_PAGE, 'r', encoding='utf-8') as f:
+            page_content = f.read()
+        mock_fetch.side_effect = lambda url, *args: ArticleDocument(page_content, url)
+
+        exit_code = run_batch_mode(None, self.output_root, 1, "static", engine="lxml",
+                                   sources=[parse_source("https://medium.com/pub")])
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual([call.args[0] for call in mock_fetch.call_args_list],
+                         ["https://medium.com/pub/second-post-bbbbbbbb0002",
+                          "https://medium.com/pub/first-post-aaaaaaaa0001"])
+        for folder in ("second-post-bbbbbbbb0002", "first-post-aaaaaaaa0001"):
+            self.assertTrue(os.path.isfile(os.path.join(self.output_root, folder, "Notes on Writing Well.md")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,20 @@
 import os
+import sys
+import shutil
 import unittest
+import subprocess
+import requests
 from unittest.mock import patch, Mock
-from src.download_with_media import download_medium_article
+from src.download_with_media import (download_medium_article, fetch_article_html, has_article_content,
+                                     is_blocked, render_page, DEFAULT_RENDER_OPTIONS, ArticleDocument)
+from src.media_fetcher import DEFAULT_TIMEOUT, configure_shared_fetcher
+from src.html_to_md import convert_html_to_markdown
+from src.url_to_local import url_to_local
+from readability.htmls import build_doc
+from fakes import FakeSession, fake_fetcher
+
+ARTICLE_PAGE = "<html><body><article><h1>Title</h1><p>" + "Server-side article text. " * 40 + "</p></article></body></html>"
+SHELL_PAGE = "<html><body><div id='root'></div><script src='app.js'></script></body></html>"
 
 
 class TestDownloadWithMedia(unittest.TestCase):
@@ -9,22 +22,21 @@ class TestDownloadWithMedia(unittest.TestCase):
     def setUp(self):
         self.output_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
         os.makedirs(self.output_folder, exist_ok=True)
+        # No media cache in the user's cache folder, and no network
+        configure_shared_fetcher(use_cache=False, session=FakeSession())
+        self.addCleanup(configure_shared_fetcher)
 
     def tearDown(self):
-        shutil.rmtree(self.output_folder)
+        shutil.rmtree(self.output_folder, ignore_errors=True)
 
-    @patch('download_with_media.sync_playwright')
-    @patch('download_with_media.requests.get')
-    @patch('download_with_media.open')
+    @patch('playwright.sync_api.sync_playwright')
+    @patch('src.download_with_media.requests.get')
+    @patch('src.download_with_media.open')
     def test_download_medium_article_success(self, mock_open, mock_requests_get, mock_sync_playwright):
         # Prepare mock data
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = "<html><body><p>Article Content</p></body></html>"
-        mock_requests_get.return_value = mock_response
-
         mock_page = Mock()
-        mock_page.content.return_value = "<html><body><p>Page Content</p></body></html>"
+        mock_page.content.return_value = ("<html><head><title>Article Title</title></head>"
+                                          "<body><p>Page Content</p><article><p>Article Content</p></article></body></html>")
         mock_sync_playwright.return_value.__enter__.return_value.chromium.launch.return_value.new_page.return_value = mock_page
 
         # Invoke the download_medium_article function
@@ -34,13 +46,14 @@ class TestDownloadWithMedia(unittest.TestCase):
         # Assert that the download was successful
         self.assertTrue(download_successful)
 
-        # Verify that the expected requests.get and sync_playwright calls were made
-        mock_requests_get.assert_called_once_with(article_url)
+        # The rendered page is the only fetch of the article
+        mock_requests_get.assert_not_called()
         mock_sync_playwright.assert_called_once()
 
         # Verify that the mock page was used to get the page content
-        mock_page.goto.assert_called_once_with(article_url)
-        mock_page.wait_for_load_state.assert_called_once()
+        mock_page.goto.assert_called_once_with(article_url, wait_until="domcontentloaded", timeout=30000)
+        mock_page.wait_for_selector.assert_called_once()
+        self.assertEqual(mock_page.wait_for_selector.call_args[0], ("article",))
         mock_page.content.assert_called_once()
 
         # Verify that the correct content was written to the markdown file
@@ -50,25 +63,162 @@ class TestDownloadWithMedia(unittest.TestCase):
         self.assertIn("# Article Title", str(file_write_calls))
         self.assertIn("Article Content", str(file_write_calls))
 
-    @patch('download_with_media.sync_playwright')
-    @patch('download_with_media.requests.get')
+    @patch('playwright.sync_api.sync_playwright')
+    @patch('src.download_with_media.requests.get')
     def test_download_medium_article_failure(self, mock_requests_get, mock_sync_playwright):
         # Prepare mock data for failed download
         mock_response = Mock()
         mock_response.status_code = 404
+        mock_response.raise_for_status.side_effect = requests.HTTPError("404 Client Error")
         mock_requests_get.return_value = mock_response
 
         # Invoke the download_medium_article function
         article_url = "https://test-article-url.com"
-        download_successful = download_medium_article(article_url, self.output_folder)
+        download_successful = download_medium_article(article_url, self.output_folder, fetch_mode="static")
 
         # Assert that the download was unsuccessful
         self.assertFalse(download_successful)
 
         # Verify that the expected requests.get call was made
-        mock_requests_get.assert_called_once_with(article_url)
+        mock_requests_get.assert_called_once_with(article_url, timeout=DEFAULT_TIMEOUT)
         mock_sync_playwright.assert_not_called()
 
+    @patch('playwright.sync_api.sync_playwright')
+    @patch('src.download_with_media.requests.get')
+    def test_fetch_article_html_static_skips_browser(self, mock_requests_get, mock_sync_playwright):
+        mock_requests_get.return_value.text = "<html></html>"
+
+        self.assertEqual(fetch_article_html("https://test-article-url.com", "static"), "<html></html>")
+        mock_sync_playwright.assert_not_called()
+
+        with self.assertRaises(ValueError):
+            fetch_article_html("https://test-article-url.com", "carrier-pigeon")
+
+    @patch('src.download_with_media.fetch_rendered_html', return_value="<html>rendered</html>")
+    @patch('src.download_with_media.fetch_static_html', return_value=ARTICLE_PAGE)
+    def test_fetch_article_html_auto_uses_static_article(self, mock_static, mock_rendered):
+        self.assertEqual(fetch_article_html("https://test-article-url.com", "auto"), ARTICLE_PAGE)
+        mock_rendered.assert_not_called()
+
+    @patch('src.download_with_media.fetch_rendered_html', return_value="<html>rendered</html>")
+    @patch('src.download_with_media.fetch_static_html')
+    def test_fetch_article_html_auto_falls_back_to_browser(self, mock_static, mock_rendered):
+        for static_result in (SHELL_PAGE, "", requests.ConnectionError("offline"), "\x00"):
+            mock_static.side_effect = [static_result] if isinstance(static_result, str) else static_result
+            context = Mock()
+            self.assertEqual(fetch_article_html("https://test-article-url.com", "auto", context),
+                             "<html>rendered</html>")
+            mock_rendered.assert_called_with("https://test-article-url.com", context)
+
+    def test_has_article_content(self):
+        self.assertTrue(has_article_content(ARTICLE_PAGE))
+        self.assertFalse(has_article_content(SHELL_PAGE))
+        self.assertFalse(has_article_content(None))
+        self.assertFalse(has_article_content("<article><p>Member-only teaser.</p></article>"))
+
+    def test_static_path_does_not_import_browser_or_ui(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ("import sys; sys.path.insert(0, sys.argv[1]); import src.pipeline, src.batch, src.async_pipeline; "
+                "print(sorted(m for m in ('playwright', 'PyInquirer', 'pyfiglet', 'tqdm', 'termcolor') "
+                "if m in sys.modules))")
+        output = subprocess.run([sys.executable, "-c", code, root], capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "[]")
+
+    def test_package_does_not_expose_its_modules_as_top_level_names(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ("import sys; sys.path.insert(0, sys.argv[1]); import src.main; "
+                "print(sorted(m for m in ('main', 'batch', 'pipeline', 'manifest', 'instrumentation') "
+                "if m in sys.modules), sys.argv[1] + '/src' in sys.path)")
+        output = subprocess.run([sys.executable, "-c", code, root], capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "[] False")
+
+    def test_is_blocked(self):
+        self.assertTrue(is_blocked("https://miro.medium.com/1*abc.png", "image"))
+        self.assertTrue(is_blocked("https://www.google-analytics.com/analytics.js", "script"))
+        self.assertTrue(is_blocked("https://cdn.branch.io/branch.js", "script"))
+        self.assertFalse(is_blocked("https://medium.com/post", "document"))
+        self.assertFalse(is_blocked("https://cdn-client.medium.com/app.js", "script"))
+        self.assertFalse(is_blocked("https://notbranch.io/x.js", "script"))
+
+    def test_render_page_aborts_blocked_requests(self):
+        page = Mock()
+        page.content.return_value = "<html></html>"
+
+        self.assertEqual(render_page(page, "https://medium.com/post"), "<html></html>")
+
+        handler = page.route.call_args[0][1]
+        for url, resource_type, blocked in (("https://medium.com/post", "document", False),
+                                            ("https://fonts.gstatic.com/a.woff2", "font", True)):
+            route, request = Mock(), Mock(url=url, resource_type=resource_type)
+            handler(route, request)
+            self.assertEqual(route.abort.called, blocked)
+            self.assertEqual(route.continue_.called, not blocked)
+
+    def test_render_page_tolerates_missing_selector(self):
+        from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+        page = Mock()
+        page.content.return_value = "<html>no article</html>"
+        page.wait_for_selector.side_effect = PlaywrightTimeoutError("timeout")
+        options = DEFAULT_RENDER_OPTIONS._replace(blocked_resource_types=frozenset(), blocked_hosts=(), budget=5)
+
+        self.assertEqual(render_page(page, "https://medium.com/post", options), "<html>no article</html>")
+        page.route.assert_not_called()
+        page.goto.assert_called_once_with("https://medium.com/post", wait_until="domcontentloaded", timeout=5000)
+        self.assertLessEqual(page.wait_for_selector.call_args[1]["timeout"], 5000)
+
+    def test_article_document_rewrites_media_before_extraction(self):
+        document = ArticleDocument(ARTICLE_PAGE.replace("<h1>Title</h1>", '<h1>Title</h1><img src="/a.png">'),
+                                   "https://medium.com/post")
+        self.assertEqual(document.media_urls(), ["https://medium.com/a.png"])
+
+        self.assertEqual(document.rewrite_media({"https://medium.com/a.png": "./media/media_1.png"}), 1)
+        title, content = document.extract()
+
+        self.assertIn('src="./media/media_1.png"', content)
+        self.assertIn('src="./media/media_1.png"', document.html())
+        # Extraction works on a copy, the document keeps its tree
+        self.assertTrue(document.has_article_content())
+
+    @patch('src.download_with_media.build_doc', wraps=build_doc)
+    @patch('src.download_with_media.fetch_static_html')
+    def test_download_medium_article_parses_once_and_keeps_local_links(self, mock_static, mock_build_doc):
+        mock_static.return_value = ARTICLE_PAGE.replace("<h1>Title</h1>", '<h1>Title</h1><img src="/a.png">')
+        self.assertTrue(download_medium_article("https://medium.com/post", self.output_folder, fetch_mode="static",
+                                                fetcher=fake_fetcher()))
+
+        mock_build_doc.assert_called_once()
+        markdown_files = [name for name in os.listdir(self.output_folder) if name.endswith(".md")]
+        with open(os.path.join(self.output_folder, markdown_files[0]), 'r', encoding='utf-8') as f:
+            written = f.read()
+        self.assertIn(f'src="{os.path.join("local", "a.png")}"', written)
+        self.assertNotIn("https://medium.com/a.png", written)
+
+    @patch('src.url_to_local.shared_fetcher')
+    @patch('src.download_with_media.fetch_static_html')
+    def test_images_are_downloaded_once_across_stages(self, mock_static, mock_shared_fetcher):
+        mock_static.return_value = ARTICLE_PAGE.replace("<h1>Title</h1>",
+                                                        '<h1>Title</h1><img src="https://miro.medium.com/1*a.png">')
+        fetcher = fake_fetcher()
+        mock_shared_fetcher.return_value = fetcher
+
+        self.assertTrue(download_medium_article("https://medium.com/post", self.output_folder, fetch_mode="static",
+                                                fetcher=fetcher))
+        convert_html_to_markdown(self.output_folder)
+        url_to_local(self.output_folder)
+
+        downloaded = [job for call in fetcher.fetch_all.call_args_list for job in call[0][0]]
+        self.assertEqual(downloaded, [("https://miro.medium.com/1*a.png",
+                                       os.path.join(self.output_folder, "local", "1*a.png"))])
+        markdown_file, = [name for name in os.listdir(self.output_folder) if name.endswith(".md")]
+        self.assertEqual(sorted(os.listdir(self.output_folder)), sorted([markdown_file, "local"]))
+        with open(os.path.join(self.output_folder, markdown_file), 'r', encoding='utf-8') as f:
+            self.assertIn(f"]({os.path.join('local', '1*a.png')})", f.read())
+
+    def test_media_urls(self):
+        html = '<img src="/a.png"><img alt="no source"><img src="https://cdn.example.com/b.jpg">'
+        self.assertEqual(ArticleDocument(html, "https://medium.com/post").media_urls(),
+                         ["https://medium.com/a.png", "https://cdn.example.com/b.jpg"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,135 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.embedded_state import find_state, find_post, apply_markups, post_markdown
+from src.download_with_media import ArticleDocument, fetch_article_document
+from src.pipeline import run_pipeline
+
+STATE = {
+    "ROOT_QUERY": {"postResult({\"id\":\"abc123\"})": {"__ref": "Post:abc123"}},
+    "Post:abc123": {
+        "__typename": "Post",
+        "id": "abc123",
+        "title": "Embedded Post",
+        "content({\"postMeteringOptions\":{}})": {
+            "bodyModel": {"paragraphs": [{"__ref": f"Paragraph:p{i}"} for i in range(11)]},
+        },
+    },
+    "Paragraph:p0": {"type": "H3", "text": "Embedded Post", "markups": []},
+    "Paragraph:p1": {"type": "P", "text": "Some bold and a link.",
+                     "markups": [{"type": "STRONG", "start": 5, "end": 9},
+                                 {"type": "A", "start": 16, "end": 20, "href": "https://example.com"}]},
+    "Paragraph:p2": {"type": "H3", "text": "A section", "markups": []},
+    "Paragraph:p3": {"type": "IMG", "text": "A caption", "markups": [],
+                     "metadata": {"__ref": "ImageMetadata:1*img.png"}},
+    "Paragraph:p4": {"type": "PRE", "text": "print('hi')", "markups": [{"type": "STRONG", "start": 0, "end": 5}],
+                     "codeBlockMetadata": {"lang": "python"}},
+    "Paragraph:p5": {"type": "OLI", "text": "first", "markups": []},
+    "Paragraph:p6": {"type": "OLI", "text": "second", "markups": []},
+    "Paragraph:p7": {"type": "ULI", "text": "bullet", "markups": []},
+    "Paragraph:p8": {"type": "PQ", "text": "Pulled quote", "markups": []},
+    "Paragraph:p9": {"type": "MIXTAPE_EMBED", "text": "Another post",
+                     "mixtapeMetadata": {"href": "https://medium.com/another-post"}},
+    "Paragraph:p10": {"type": "IFRAME", "text": "",
+                      "iframe": {"mediaResource": {"__ref": "MediaResource:m1"}}},
+    "ImageMetadata:1*img.png": {"id": "1*img.png", "originalWidth": 800},
+    "MediaResource:m1": {"href": "https://gist.github.com/a/1", "title": "a gist"},
+}
+
+EXPECTED_MARKDOWN = """# Embedded Post
+
+Some **bold** and a [link](https://example.com).
+
+## A section
+
+![](https://miro.medium.com/v2/resize:fit:1400/1*img.png)
+
+*A caption*
+
+```python
+print('hi')
+```
+
+1. first
+2. second
+
+- bullet
+
+> Pulled quote
+
+[Another post](https://medium.com/another-post)
+
+[a gist](https://gist.github.com/a/1)
+"""
+
+
+def medium_page(state):
+    return ("<html><head><title>Embedded Post | Medium</title></head><body><div id='root'></div>"
+            f"<script>window.__APOLLO_STATE__ = {json.dumps(state)}</script></body></html>")
+
+
+class TestEmbeddedState(unittest.TestCase):
+
+    def test_find_state(self):
+        self.assertEqual(find_state(["var a = 1;", f"window.__APOLLO_STATE__ = {json.dumps(STATE)};"]), STATE)
+        self.assertIsNone(find_state(["var a = 1;", None]))
+        self.assertIsNone(find_state(["window.__APOLLO_STATE__ = {broken"]))
+
+    def test_find_post(self):
+        post = find_post(STATE)
+        self.assertEqual((post.id, post.title, len(post.paragraphs)), ("abc123", "Embedded Post", 11))
+        self.assertIsNone(find_post({"Post:x": {"title": "Paywalled", "content({})": {"bodyModel": None}}}))
+
+    def test_apply_markups_nests_and_skips_unknown_types(self):
+        markups = [{"type": "EM", "start": 0, "end": 9}, {"type": "STRONG", "start": 0, "end": 4},
+                   {"type": "HIGHLIGHT", "start": 2, "end": 6}]
+        self.assertEqual(apply_markups("very good", markups), "***very** good*")
+
+    def test_apply_markups_counts_utf16_code_units(self):
+        # "🚀" is two UTF-16 code units, so "fast" starts at offset 11
+        markups = [{"type": "STRONG", "start": 11, "end": 15}, {"type": "A", "start": 16, "end": 20,
+                                                                "href": "https://e.com"}]
+        self.assertEqual(apply_markups("Ship it 🚀 fast café", markups), "Ship it 🚀 **fast** [café](https://e.com)")
+
+    def test_post_markdown(self):
+        self.assertEqual(post_markdown(STATE, find_post(STATE)), EXPECTED_MARKDOWN)
+
+    def test_document_uses_embedded_post(self):
+        document = ArticleDocument(medium_page(STATE), "https://medium.com/p/abc123")
+        self.assertTrue(document.has_article_content())
+        self.assertEqual(document.embedded_markdown(), ("Embedded Post", EXPECTED_MARKDOWN))
+        self.assertIsNone(ArticleDocument("<html><body><p>No state</p></body></html>").embedded_markdown())
+
+    @patch('src.download_with_media.fetch_rendered_html')
+    @patch('src.download_with_media.fetch_static_html')
+    def test_auto_mode_skips_the_browser(self, mock_static, mock_rendered):
+        mock_static.return_value = medium_page(STATE)
+        document = fetch_article_document("https://medium.com/p/abc123", "auto")
+        self.assertEqual(document.embedded_markdown()[0], "Embedded Post")
+        mock_rendered.assert_not_called()
+
+    @patch('src.download_with_media._TreeDocument')
+    @patch('src.pipeline.fetch_article_document')
+    def test_pipeline_fast_path_skips_readability(self, mock_fetch, mock_readability):
+        mock_fetch.side_effect = lambda url, *args: ArticleDocument(medium_page(STATE), url)
+        fetcher = unittest.mock.MagicMock()
+        fetcher.fetch_all.return_value = []
+        output_root = tempfile.mkdtemp()
+        try:
+            article = run_pipeline("https://medium.com/p/abc123", os.path.join(output_root, "abc123"), "static",
+                                   fetcher=fetcher)
+            with open(article.markdown_path, 'r', encoding='utf-8') as f:
+                self.assertEqual(f.read(), EXPECTED_MARKDOWN)
+        finally:
+            shutil.rmtree(output_root)
+        self.assertTrue(article.embedded)
+        self.assertEqual(os.path.basename(article.markdown_path), "Embedded Post.md")
+        mock_readability.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
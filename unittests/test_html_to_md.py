@@ -1,7 +1,13 @@
 import os
+import shutil
+import tempfile
 import unittest
 from unittest.mock import patch
-from src.html_to_md import convert_html_to_markdown
+from src.html_to_md import convert_html_to_markdown, configure_conversion_pool, convert_html, html_to_markdown
+
+# Unclosed tags leak html2text parser state into the next document if a converter is reused
+SAMPLE_PAGES = ["<b>bold <ul><li>a", "<pre>code", "<blockquote>quote", "<table><tr><td>x",
+                "<h1>Title</h1><p>plain</p><ol><li>x</li></ol>", "<p>Text with <a href='x'>a link</a></p>"] * 3
 
 class TestHtmlToMd(unittest.TestCase):
 
@@ -66,5 +72,43 @@ class TestHtmlToMd(unittest.TestCase):
         self.assertEqual(updated_content1, mock_markdown_content)
         self.assertEqual(updated_content2, mock_markdown_content)
 
+    @patch('html2text.HTML2Text.handle')
+    def test_convert_html_to_markdown_reports_progress(self, mock_html2text_handle):
+        mock_html2text_handle.return_value = "Mock Markdown Content"
+        for i in range(2):
+            with open(os.path.join(self.output_folder, f"test{i}.md"), 'w') as f:
+                f.write(f"<p>Test HTML Content {i}</p>")
+        progress = []
+
+        convert_html_to_markdown(self.output_folder, on_progress=lambda done, total: progress.append((done, total)))
+
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+
+    def test_convert_html_to_markdown_process_pool_matches_serial(self):
+        serial_folder, parallel_folder = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, serial_folder)
+        self.addCleanup(shutil.rmtree, parallel_folder)
+        for folder in (serial_folder, parallel_folder):
+            for i, page in enumerate(SAMPLE_PAGES):
+                with open(os.path.join(folder, f"page{i:02}.md"), 'w') as f:
+                    f.write(page)
+        progress = []
+
+        convert_html_to_markdown(serial_folder)
+        convert_html_to_markdown(parallel_folder, on_progress=lambda done, total: progress.append(done), jobs=2)
+
+        self.assertEqual(progress, list(range(1, len(SAMPLE_PAGES) + 1)))
+        for name in sorted(os.listdir(serial_folder)):
+            with open(os.path.join(serial_folder, name)) as f1, open(os.path.join(parallel_folder, name)) as f2:
+                self.assertEqual(f1.read(), f2.read(), name)
+        with open(os.path.join(serial_folder, "page01.md")) as f:
+            self.assertEqual(f.read(), html_to_markdown("<pre>code"))
+
+    def test_convert_html_uses_configured_pool(self):
+        configure_conversion_pool(2)
+        self.addCleanup(configure_conversion_pool, 1)
+
+        self.assertEqual(convert_html("<p>Hello</p>"), html_to_markdown("<p>Hello</p>"))
+
 if __name__ == "__main__":
     unittest.main()
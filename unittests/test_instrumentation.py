@@ -0,0 +1,157 @@
+import os
+import json
+import shutil
+import socket
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.instrumentation import (JsonLinesSink, MetricsRegistry, PrometheusFileSink, StatsdSink,
+                                 add_sink, remove_sink, emit, stage, configure_instrumentation,
+                                 parse_statsd_address)
+from src.pipeline import run_pipeline
+from src.media_fetcher import MediaFetcher
+from src.download_with_media import ArticleDocument
+from fakes import FakeSession, fake_fetcher
+
+PAGE = """<html><head><title>A Test Article</title></head><body><article>
+<h1>A Test Article</h1>
+<p>The first paragraph of the article is long enough for readability to keep it around.</p>
+<img src="https://miro.medium.com/1*abc.png">
+<p>The second paragraph of the article is also long enough for readability to keep it.</p>
+</article></body></html>"""
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.events = []
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_emit_without_sinks_does_nothing(self):
+        emit("stage", stage="fetch", duration=0.1)
+
+    def test_stage_reports_duration_fields_and_errors(self):
+        sink = add_sink(self.events.append)
+        try:
+            with stage("convert", url="u") as extra:
+                extra["bytes"] = 42
+            with self.assertRaises(ValueError):
+                with stage("save", url="u"):
+                    raise ValueError("disk full")
+        finally:
+            remove_sink(sink)
+
+        converted, saved = self.events
+        self.assertEqual(converted["event"], "stage")
+        self.assertEqual((converted["stage"], converted["url"], converted["bytes"]), ("convert", "u", 42))
+        self.assertTrue(converted["ok"])
+        self.assertGreaterEqual(converted["duration"], 0)
+        self.assertFalse(saved["ok"])
+        self.assertEqual(saved["error"], "ValueError: disk full")
+
+    def test_json_lines_sink(self):
+        path = os.path.join(self.folder, "events.jsonl")
+        sink = add_sink(JsonLinesSink(path))
+        emit("media_fetch", url="https://miro.medium.com/1*a.png", bytes=10, cache="hit")
+        emit("stage", stage="fetch", duration=0.5)
+        remove_sink(sink)
+
+        with open(path, 'r') as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual([event["event"] for event in events], ["media_fetch", "stage"])
+        self.assertEqual(events[0]["cache"], "hit")
+
+    def test_prometheus_text(self):
+        registry = MetricsRegistry()
+        registry({"event": "stage", "stage": "fetch", "duration": 0.5, "ok": True})
+        registry({"event": "stage", "stage": "fetch", "duration": 1.5, "ok": False})
+        registry({"event": "media_fetch", "duration": 0.1, "bytes": 100, "retries": 2, "cache": "miss"})
+        registry({"event": "article", "duration": 2.0, "ok": True, "skipped": True})
+
+        text = registry.prometheus_text()
+        self.assertIn("# TYPE medium2md_stage_seconds summary", text)
+        self.assertIn('medium2md_stage_seconds_count{stage="fetch"} 2', text)
+        self.assertIn('medium2md_stage_seconds_sum{stage="fetch"} 2.000000', text)
+        self.assertIn('medium2md_stage_errors_total{stage="fetch"} 1', text)
+        self.assertIn('medium2md_fetched_bytes_total{kind="media"} 100', text)
+        self.assertIn('medium2md_fetch_retries_total{kind="media"} 2', text)
+        self.assertIn('medium2md_media_cache_total{result="miss"} 1', text)
+        self.assertIn('medium2md_articles_total{result="skipped"} 1', text)
+
+    def test_prometheus_file_written_on_close(self):
+        path = os.path.join(self.folder, "medium2md.prom")
+        sink = PrometheusFileSink(path, interval=3600)
+        sink({"event": "stage", "stage": "save", "duration": 0.25, "ok": True})
+        sink({"event": "stage", "stage": "save", "duration": 0.25, "ok": True})
+        sink.close()
+
+        with open(path, 'r') as f:
+            self.assertIn('medium2md_stage_seconds_count{stage="save"} 2', f.read())
+
+    def test_statsd_sink_sends_datagrams(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(5)
+        sink = StatsdSink("127.0.0.1", server.getsockname()[1])
+        try:
+            sink({"event": "stage", "stage": "fetch", "duration": 0.5, "ok": False})
+            payload = server.recv(4096).decode()
+        finally:
+            sink.close()
+            server.close()
+        self.assertEqual(payload.splitlines(), ["medium2md.stage.fetch.duration:500.000|ms",
+                                                "medium2md.stage.fetch.errors:1|c"])
+
+    def test_parse_statsd_address(self):
+        self.assertEqual(parse_statsd_address("metrics.local:9125"), ("metrics.local", 9125))
+        self.assertEqual(parse_statsd_address(":8125"), ("127.0.0.1", 8125))
+        self.assertEqual(parse_statsd_address("8125"), ("127.0.0.1", 8125))
+        for address in ("host:abc", "host:", "host:0", "host:70000"):
+            with self.assertRaises(ValueError):
+                parse_statsd_address(address)
+
+    def test_configure_instrumentation(self):
+        path = os.path.join(self.folder, "events.jsonl")
+        sinks = configure_instrumentation(jsonl_path=path, statsd_address="127.0.0.1:8125")
+        for sink in sinks:
+            remove_sink(sink)
+        self.assertEqual([type(sink) for sink in sinks], [JsonLinesSink, StatsdSink])
+
+    @patch('src.pipeline.fetch_article_document', side_effect=lambda url, *args: ArticleDocument(PAGE, url))
+    def test_pipeline_emits_stage_and_article_events(self, mock_fetch):
+        sink = add_sink(self.events.append)
+        try:
+            run_pipeline("https://medium.com/a-test-article", os.path.join(self.folder, "article"), "static",
+                         fetcher=fake_fetcher())
+        finally:
+            remove_sink(sink)
+
+        stages = [event["stage"] for event in self.events if event["event"] == "stage"]
+        self.assertEqual(stages, ["fetch", "extract", "convert", "clean", "localize_images", "save", "publish"])
+        localized = next(event for event in self.events if event.get("stage") == "localize_images")
+        self.assertEqual(localized["images"], 1)
+        article = self.events[-1]
+        self.assertEqual((article["event"], article["ok"], article["images"]), ("article", True, 1))
+
+    def test_media_fetcher_emits_fetch_events(self):
+        sink = add_sink(self.events.append)
+        try:
+            with MediaFetcher(session=FakeSession(fail_urls=["https://a.com/2.png"])) as fetcher:
+                fetcher.fetch_all([("https://a.com/1.png", os.path.join(self.folder, "1.png")),
+                                   ("https://a.com/2.png", os.path.join(self.folder, "2.png"))])
+        finally:
+            remove_sink(sink)
+
+        events = sorted(self.events, key=lambda event: event["url"])
+        self.assertEqual([event["event"] for event in events], ["media_fetch", "media_fetch"])
+        self.assertEqual((events[0]["bytes"], events[0]["cache"]), (len(b"https://a.com/1.png"), "miss"))
+        self.assertEqual((events[0]["ok"], events[1]["ok"]), (True, False))
+        self.assertIn("HTTPError", events[1]["error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
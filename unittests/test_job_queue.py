@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.job_queue import JobQueue, PENDING, FETCHING, CONVERTED, FAILED
+from src.batch import run_batch
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "jobs.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_add_keeps_order_and_ignores_known_urls(self):
+        with JobQueue(self.path) as job_queue:
+            self.assertEqual(job_queue.add(["https://medium.com/a", "https://medium.com/b"]), 2)
+            self.assertEqual(job_queue.add(["https://medium.com/b", "https://medium.com/c"]), 1)
+            self.assertEqual(job_queue.claim(), "https://medium.com/a")
+            self.assertEqual(job_queue.claim(), "https://medium.com/b")
+            self.assertEqual(job_queue.counts(), {PENDING: 1, FETCHING: 2})
+
+    def test_interrupted_jobs_are_pending_again_on_reopen(self):
+        with JobQueue(self.path) as job_queue:
+            job_queue.add(["https://medium.com/a", "https://medium.com/b"])
+            job_queue.complete(job_queue.claim(), "out/a")
+            job_queue.claim()
+
+        with JobQueue(self.path) as job_queue:
+            self.assertEqual(job_queue.jobs(), [("https://medium.com/a", CONVERTED, 1, None),
+                                                ("https://medium.com/b", PENDING, 1, None)])
+            self.assertEqual(job_queue.claim(), "https://medium.com/b")
+
+    def test_failures_back_off_then_give_up(self):
+        with JobQueue(self.path, max_attempts=2, backoff=60) as job_queue:
+            job_queue.add(["https://medium.com/a"])
+            url = job_queue.claim()
+
+            self.assertTrue(job_queue.fail(url, "timeout"))
+            self.assertIsNone(job_queue.claim())  # in backoff
+
+            with patch('src.job_queue.time.time', return_value=10 ** 10):
+                self.assertEqual(job_queue.claim(), url)
+            self.assertFalse(job_queue.fail(url, "timeout again"))
+            self.assertEqual(job_queue.jobs(FAILED), [(url, FAILED, 2, "timeout again")])
+
+            self.assertEqual(job_queue.retry_failed(), 1)
+            self.assertEqual(job_queue.claim(), url)
+
+    def test_claim_all_adds_urls_lazily(self):
+        def urls():
+            for i in range(3):
+                yield f"https://medium.com/{i}"
+                consumed.append(i)
+
+        consumed = []
+        with JobQueue(self.path) as job_queue:
+            claimed = []
+            for url in job_queue.claim_all(urls()):
+                claimed.append((url, list(consumed)))
+                job_queue.complete(url)
+        self.assertEqual(claimed, [("https://medium.com/0", []), ("https://medium.com/1", [0]),
+                                   ("https://medium.com/2", [0, 1])])
+
+    @patch('src.batch.convert_article')
+    def test_run_batch_retries_and_resumes(self, mock_convert_article):
+        attempts = {}
+
+        def convert(url, output_folder, browser_context, **options):
+            attempts[url] = attempts.get(url, 0) + 1
+            if url.endswith("flaky") and attempts[url] == 1:
+                raise RuntimeError("503")
+            if url.endswith("bad"):
+                raise RuntimeError("404")
+
+        mock_convert_article.side_effect = convert
+        urls = ["https://medium.com/ok", "https://medium.com/flaky", "https://medium.com/bad"]
+
+        with JobQueue(self.path, max_attempts=2, backoff=0) as job_queue:
+            results = run_batch(urls, self.folder, workers=2, fetch_mode="static", job_queue=job_queue)
+            self.assertEqual(sorted((result.url, result.success) for result in results),
+                             [("https://medium.com/bad", False), ("https://medium.com/flaky", True),
+                              ("https://medium.com/ok", True)])
+            self.assertEqual(attempts, {"https://medium.com/ok": 1, "https://medium.com/flaky": 2,
+                                        "https://medium.com/bad": 2})
+            self.assertEqual(job_queue.counts(), {CONVERTED: 2, FAILED: 1})
+
+        # A second run of the same list converts nothing again
+        with JobQueue(self.path) as job_queue:
+            self.assertEqual(run_batch(urls, self.folder, workers=2, fetch_mode="static", job_queue=job_queue), [])
+        self.assertEqual(sum(attempts.values()), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,6 +25,34 @@ class TestMain(unittest.TestCase):
         self.assertTrue(result)
         mock_input.assert_called_once_with("Would you like to open the markdown file in your default editor?")
 
+    def test_execute_stage_records_timing_without_sleeping(self):
+        timings = []
+        progress = []
+
+        def stage(value, on_progress=None):
+            on_progress(1, 2)
+            on_progress(2, 2)
+            progress.append(value)
+            return value * 2
+
+        result = main.execute_stage(stage, [21], "Doubling", timings, unit='file')
+
+        self.assertEqual(result, 42)
+        self.assertEqual(progress, [21])
+        self.assertEqual(len(timings), 1)
+        description, wall, cpu = timings[0]
+        self.assertEqual(description, "Doubling")
+        self.assertLess(wall, 1)
+        self.assertGreaterEqual(cpu, 0)
+
+    def test_execute_stage_records_timing_of_failed_stage(self):
+        timings = []
+
+        with self.assertRaises(ValueError):
+            main.execute_stage(lambda: int("x"), [], "Failing", timings)
+
+        self.assertEqual([t[0] for t in timings], ["Failing"])
+
     # Add more test cases for other functions in main.py as needed
 
 if __name__ == "__main__":
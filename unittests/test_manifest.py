@@ -0,0 +1,56 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from src.manifest import Manifest, content_hash
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "manifest.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_content_hash_is_stable_and_separates_parts(self):
+        self.assertEqual(content_hash("a", "b"), content_hash("a", "b"))
+        self.assertNotEqual(content_hash("ab", ""), content_hash("a", "b"))
+
+    def test_save_and_reload(self):
+        manifest = Manifest(self.path)
+        manifest.update("https://medium.com/a", etag='"v1"', content_hash="abc")
+        manifest.save()
+
+        entry = Manifest(self.path).get("https://medium.com/a")
+        self.assertEqual(entry["etag"], '"v1"')
+        self.assertEqual(entry["content_hash"], "abc")
+        self.assertIn("fetched_at", entry)
+
+    def test_saves_in_batches(self):
+        manifest = Manifest(self.path, save_every=2)
+        manifest.update("https://medium.com/a")
+        self.assertFalse(os.path.exists(self.path))
+
+        manifest.update("https://medium.com/b")
+        with open(self.path, 'r') as f:
+            self.assertEqual(sorted(json.load(f)), ["https://medium.com/a", "https://medium.com/b"])
+
+    def test_is_current_requires_same_hash_and_existing_output(self):
+        output_path = os.path.join(self.folder, "Article.md")
+        manifest = Manifest(self.path)
+        manifest.update("https://medium.com/a", content_hash="abc", output_path=output_path)
+
+        self.assertFalse(manifest.is_current("https://medium.com/a", "abc"))
+        with open(output_path, 'w') as f:
+            f.write("# Article")
+        self.assertTrue(manifest.is_current("https://medium.com/a", "abc"))
+        self.assertFalse(manifest.is_current("https://medium.com/a", "def"))
+        self.assertFalse(manifest.is_current("https://medium.com/b", "abc"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from src.media_cache import MediaCache
+from src.media_fetcher import MediaFetcher
+
+
+def fake_response(status_code=200, body=b"", headers=None):
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.iter_content.return_value = [body]
+    return response
+
+
+class TestMediaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = MediaCache(os.path.join(self.folder, "cache"))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.folder)
+
+    def write(self, name, content):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_store_dedupes_identical_bytes_with_hardlinks(self):
+        first = self.write("a.png", b"same bytes")
+        second = self.write("b.png", b"same bytes")
+
+        digest_a = self.cache.store("https://miro.medium.com/a.png", first, etag='"abc"')
+        digest_b = self.cache.store("https://miro.medium.com/b.png", second)
+
+        self.assertEqual(digest_a, digest_b)
+        self.assertTrue(os.path.samefile(first, second))
+        self.assertEqual(self.cache.size(), len(b"same bytes"))
+        self.assertEqual(self.cache.lookup("https://miro.medium.com/a.png").etag, '"abc"')
+
+    def test_materialize(self):
+        self.cache.store("https://miro.medium.com/a.png", self.write("a.png", b"image"))
+        destination = os.path.join(self.folder, "copy.png")
+
+        self.cache.materialize(self.cache.lookup("https://miro.medium.com/a.png"), destination)
+
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), b"image")
+
+    def test_evicts_least_recently_used(self):
+        self.cache.max_bytes = 10
+        self.cache.store("https://miro.medium.com/old.png", self.write("old.png", b"123456"))
+        time.sleep(0.01)
+        self.cache.store("https://miro.medium.com/new.png", self.write("new.png", b"abcdef"))
+
+        self.assertIsNone(self.cache.lookup("https://miro.medium.com/old.png"))
+        self.assertIsNotNone(self.cache.lookup("https://miro.medium.com/new.png"))
+        self.assertEqual(self.cache.size(), 6)
+
+    def test_fetcher_serves_fresh_entries_without_network(self):
+        session = MagicMock()
+        session.get.return_value = fake_response(body=b"image", headers={"ETag": '"v1"'})
+        with MediaFetcher(session=session, cache=self.cache) as fetcher:
+            fetcher.fetch("https://miro.medium.com/a.png", os.path.join(self.folder, "1.png"))
+            fetcher.fetch("https://miro.medium.com/a.png", os.path.join(self.folder, "2.png"))
+
+        self.assertEqual(session.get.call_count, 1)
+        self.assertTrue(os.path.samefile(os.path.join(self.folder, "1.png"), os.path.join(self.folder, "2.png")))
+
+    def test_fetcher_revalidates_stale_entries(self):
+        self.cache.max_age = 0
+        self.cache.store("https://miro.medium.com/a.png", self.write("a.png", b"image"), etag='"v1"')
+        session = MagicMock()
+        session.get.return_value = fake_response(status_code=304)
+        destination = os.path.join(self.folder, "out.png")
+
+        with MediaFetcher(session=session, cache=self.cache) as fetcher:
+            fetcher.fetch("https://miro.medium.com/a.png", destination)
+
+        self.assertEqual(session.get.call_args[1]["headers"], {"If-None-Match": '"v1"'})
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), b"image")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import requests
+
+from src.media_fetcher import MediaFetcher, MediaTooLarge, create_session, stream_to_file
+from fakes import FakeSession
+
+
+class TestMediaFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.output_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_folder)
+
+    def test_fetch_all_keeps_job_order_and_reports_errors(self):
+        urls = [f"https://miro.medium.com/{i}.png" for i in range(5)]
+        session = FakeSession(fail_urls=[urls[2]])
+        jobs = [(url, os.path.join(self.output_folder, f"{i}.png")) for i, url in enumerate(urls)]
+
+        with MediaFetcher(max_workers=4, session=session) as fetcher:
+            results = fetcher.fetch_all(jobs)
+
+        self.assertEqual([result.url for result in results], urls)
+        self.assertIsNone(results[2].path)
+        self.assertIsInstance(results[2].error, requests.HTTPError)
+        with open(results[0].path, 'rb') as f:
+            self.assertEqual(f.read(), urls[0].encode())
+
+    def test_fetch_all_reports_progress(self):
+        jobs = [(f"https://miro.medium.com/{i}.png", os.path.join(self.output_folder, f"{i}.png")) for i in range(3)]
+        progress = []
+
+        with MediaFetcher(session=FakeSession()) as fetcher:
+            fetcher.fetch_all(jobs, on_progress=lambda done, total: progress.append((done, total)))
+
+        self.assertEqual(progress, [(0, 3), (1, 3), (2, 3), (3, 3)])
+
+    def test_per_host_limit(self):
+        session = FakeSession()
+        jobs = [(f"https://miro.medium.com/{i}.png", os.path.join(self.output_folder, f"a{i}.png")) for i in range(12)]
+        jobs += [(f"https://cdn.example.com/{i}.png", os.path.join(self.output_folder, f"b{i}.png")) for i in range(12)]
+
+        with MediaFetcher(max_workers=8, per_host=2, session=session) as fetcher:
+            fetcher.fetch_all(jobs)
+
+        self.assertLessEqual(session.peak["miro.medium.com"], 2)
+        self.assertLessEqual(session.peak["cdn.example.com"], 2)
+
+    def test_stream_to_file_writes_chunks_and_renames(self):
+        response = MagicMock(headers={})
+        response.iter_content.return_value = iter([b"ab", b"cd"])
+        destination = os.path.join(self.output_folder, "image.gif")
+
+        self.assertEqual(stream_to_file(response, destination, max_bytes=4), destination)
+
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), b"abcd")
+        self.assertEqual(os.listdir(self.output_folder), ["image.gif"])
+
+    def test_stream_to_file_enforces_max_size(self):
+        destination = os.path.join(self.output_folder, "image.gif")
+        streamed = MagicMock(headers={})
+        streamed.iter_content.return_value = iter([b"ab", b"cd", b"ef"])
+        declared = MagicMock(headers={"Content-Length": "1000"})
+
+        for response in (streamed, declared):
+            with self.assertRaises(MediaTooLarge):
+                stream_to_file(response, destination, max_bytes=4)
+        declared.iter_content.assert_not_called()
+        self.assertEqual(os.listdir(self.output_folder), [])
+
+    def test_create_session_mounts_retrying_pool(self):
+        session = create_session(pool_size=3, retries=5)
+        adapter = session.get_adapter("https://miro.medium.com/")
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertEqual(adapter._pool_maxsize, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
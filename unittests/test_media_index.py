@@ -0,0 +1,55 @@
+import unittest
+
+from src.media_index import MediaIndex, canonical_image_url, rewrite_links, unique_image_urls
+
+
+class TestMediaIndex(unittest.TestCase):
+
+    def test_medium_variants_share_one_key(self):
+        variants = [
+            "https://miro.medium.com/1*abc.png",
+            "https://miro.medium.com/max/1400/1*abc.png",
+            "https://miro.medium.com/v2/resize:fit:720/format:webp/1*abc.png",
+            "https://cdn-images-1.medium.com/max/800/1*abc.png",
+        ]
+        self.assertEqual(len({canonical_image_url(url) for url in variants}), 1)
+        self.assertNotEqual(canonical_image_url("https://miro.medium.com/max/1400/1*abc.png"),
+                            canonical_image_url("https://miro.medium.com/max/1400/1*def.png"))
+
+    def test_other_hosts_keep_their_path(self):
+        self.assertEqual(canonical_image_url("https://Example.com/a/b.png#x"), "https://example.com/a/b.png")
+        self.assertNotEqual(canonical_image_url("https://example.com/a/b.png"),
+                            canonical_image_url("https://example.com/c/b.png"))
+
+    def test_unique_image_urls_keeps_first_variant(self):
+        urls = ["https://miro.medium.com/max/1400/1*abc.png", "https://example.com/b.jpg",
+                "https://miro.medium.com/v2/resize:fit:720/1*abc.png"]
+        self.assertEqual(unique_image_urls(urls), urls[:2])
+
+    def test_rewrite_links_in_one_pass(self):
+        index = MediaIndex()
+        index.add("https://miro.medium.com/max/1400/1*abc.png", "local/1*abc.png")
+        text = ("![](https://miro.medium.com/max/1400/1*abc.png)\n"
+                "![](https://miro.medium.com/v2/resize:fit:720/1*abc.png)\n"
+                "![](https://example.com/other.png) <https://medium.com/post>")
+
+        self.assertEqual(rewrite_links(text, index),
+                         "![](local/1*abc.png)\n![](local/1*abc.png)\n"
+                         "![](https://example.com/other.png) <https://medium.com/post>")
+        self.assertIn("https://cdn-images-1.medium.com/max/800/1*abc.png", index)
+        self.assertEqual(rewrite_links(text, MediaIndex()), text)
+
+    def test_rewrite_links_is_linear(self):
+        index = MediaIndex()
+        for i in range(2000):
+            index.add(f"https://miro.medium.com/max/1400/1*{i}.png", f"local/1*{i}.png")
+        text = "".join(f"![](https://miro.medium.com/v2/resize:fit:720/1*{i}.png)\n" for i in range(2000))
+
+        rewritten = rewrite_links(text, index)
+
+        self.assertNotIn("https://", rewritten)
+        self.assertEqual(rewritten.count("\n"), 2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import re
+import glob
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import lxml.html
+
+from src.medium_markdown import find_article_node, heading_title, article_markdown
+from src.download_with_media import ArticleDocument, compose_article_html
+from src.html_to_md import html_to_markdown
+from src.clean_md import clean_markdown
+from src.pipeline import run_pipeline
+from fakes import fake_fetcher
+
+CORPUS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+CORPUS = sorted(glob.glob(os.path.join(CORPUS_FOLDER, "*.html")))
+BASE_URL = "https://medium.com/@author/post-1a2b3c"
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def words(text):
+    # Link targets are dropped by html2text (`ignore_links`), so compare the text only
+    return re.findall(r"[^\W_]+", re.sub(r"\]\([^)]*\)", "]", text))
+
+
+def contains_in_order(haystack, needles):
+    position = 0
+    for needle in needles:
+        while position + len(needle) <= len(haystack) and haystack[position:position + len(needle)] != needle:
+            position += 1
+        if position + len(needle) > len(haystack):
+            return False
+        position += len(needle)
+    return True
+
+
+def emit(html, title="Title"):
+    return article_markdown(lxml.html.fromstring(html), title)
+
+
+class TestMediumMarkdown(unittest.TestCase):
+
+    def test_corpus_matches_expected_markdown(self):
+        self.assertTrue(CORPUS)
+        for path in CORPUS:
+            with self.subTest(page=os.path.basename(path)):
+                document = ArticleDocument(read(path), BASE_URL)
+                title, content = document.extract_article_node()
+                self.assertEqual(document.article_markdown(title, content), read(path[:-len(".html")] + ".md"))
+
+    def test_corpus_parity_with_html2text(self):
+        # Both engines keep the text of every body paragraph, in order
+        for path in CORPUS:
+            with self.subTest(page=os.path.basename(path)):
+                document = ArticleDocument(read(path), BASE_URL)
+                paragraphs = [words(element.text_content())
+                              for element in document.tree.xpath('//*[@data-selectable-paragraph]')]
+                title, content = document.extract()
+                html2text_markdown = clean_markdown(html_to_markdown(compose_article_html(document.html(),
+                                                                                          title, content)))
+                lxml_markdown = document.article_markdown(*document.extract_article_node())
+
+                self.assertTrue(contains_in_order(words(html2text_markdown), paragraphs))
+                self.assertTrue(contains_in_order(words(lxml_markdown), paragraphs))
+
+    def test_only_the_article_is_converted(self):
+        for path in CORPUS:
+            with self.subTest(page=os.path.basename(path)):
+                markdown = ArticleDocument(read(path), BASE_URL).article_markdown("Title")
+                for boilerplate in ("Sign in", "Written by", "More from", "Recommended from", "min read", "Clap"):
+                    self.assertNotIn(boilerplate, markdown)
+
+    def test_find_article_node_and_title(self):
+        tree = lxml.html.fromstring("<html><body><article></article><article><h1> The  Title </h1><p>Body</p>"
+                                    "</article></body></html>")
+        node = find_article_node(tree)
+        self.assertEqual(heading_title(node), "The Title")
+        self.assertIsNone(find_article_node(lxml.html.fromstring("<html><body><p>No article</p></body></html>")))
+
+    def test_title_heading_is_skipped_once(self):
+        self.assertEqual(emit("<article><h1>Title</h1><p>Text</p><h1>Title</h1></article>"),
+                         "# Title\n\nText\n\n## Title\n")
+
+    def test_emphasis_keeps_spaces_outside(self):
+        self.assertEqual(emit("<article><p>A<strong> bold </strong>word and <em>x</em><a href='https://e.com'>"
+                              " link</a>.</p></article>"),
+                         "# Title\n\nA **bold** word and *x* [link](https://e.com).\n")
+
+    def test_nested_lists(self):
+        self.assertEqual(emit("<article><ol start='3'><li>three<ul><li>inner</li></ul></li><li>four</li></ol>"
+                              "</article>"),
+                         "# Title\n\n3. three\n   - inner\n4. four\n")
+
+    def test_image_without_src_uses_widest_candidate(self):
+        self.assertEqual(emit("<article><figure><picture><source srcset='https://e.com/a.webp 640w, "
+                              "https://e.com/b.webp 1400w'><img alt='x'></picture></figure></article>"),
+                         "# Title\n\n![x](https://e.com/b.webp)\n")
+
+    def test_image_without_src_prefers_the_original_format(self):
+        self.assertEqual(emit("<article><figure><picture><source type='image/webp' srcset='https://e.com/a.webp "
+                              "640w'><source srcset='https://e.com/a.png 640w, https://e.com/b.png 1400w'>"
+                              "<img alt='x'></picture></figure></article>"),
+                         "# Title\n\n![x](https://e.com/b.png)\n")
+
+    def test_code_language_from_class(self):
+        self.assertEqual(emit("<article><pre><code class='language-js'>let a = 1;\nlet b = 2;</code></pre></article>"),
+                         "# Title\n\n```js\nlet a = 1;\nlet b = 2;\n```\n")
+
+    def test_page_without_article_falls_back_to_content(self):
+        document = ArticleDocument("<html><head><title>Page</title></head><body><p>Text</p></body></html>")
+        self.assertIsNone(document.extract_article_node())
+        self.assertEqual(document.article_markdown("Page", "<div><p>Extracted <b>text</b></p></div>"),
+                         "# Page\n\nExtracted **text**\n")
+
+
+class TestLxmlEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.output_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_root)
+
+    @patch('src.pipeline.clean_markdown')
+    @patch('src.download_with_media._TreeDocument')
+    @patch('src.pipeline.fetch_article_document')
+    def test_pipeline_skips_readability_and_cleaning(self, mock_fetch, mock_readability, mock_clean):
+        path = os.path.join(CORPUS_FOLDER, "quotes-and-mixtape.html")
+        mock_fetch.side_effect = lambda url, *args: ArticleDocument(read(path), url)
+        fetcher = MagicMock()
+        fetcher.fetch_all.return_value = []
+
+        article = run_pipeline(BASE_URL, os.path.join(self.output_root, "post"), "static", fetcher=fetcher,
+                               engine="lxml")
+
+        self.assertEqual(os.path.basename(article.markdown_path), "Notes on Writing Well.md")
+        self.assertEqual(read(article.markdown_path), read(path[:-len(".html")] + ".md"))
+        mock_readability.assert_not_called()
+        mock_clean.assert_not_called()
+
+    @patch('src.pipeline.fetch_article_document')
+    def test_images_with_alt_text_are_localized(self, mock_fetch):
+        path = os.path.join(CORPUS_FOLDER, "figures-and-code.html")
+        mock_fetch.side_effect = lambda url, *args: ArticleDocument(read(path), url)
+        fetcher = fake_fetcher()
+
+        article = run_pipeline(BASE_URL, os.path.join(self.output_root, "post"), "static", fetcher=fetcher,
+                               engine="lxml")
+
+        markdown = read(article.markdown_path)
+        self.assertEqual([url for url, path in fetcher.fetch_all.call_args.args[0]],
+                         ["https://miro.medium.com/v2/resize:fit:1400/1*flame.png",
+                          "https://miro.medium.com/v2/resize:fit:1400/1*table.png"])
+        self.assertIn("![pstats output](local/", markdown)
+        self.assertNotIn("miro.medium.com", markdown)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            run_pipeline(BASE_URL, os.path.join(self.output_root, "post"), "static", engine="pandoc")
+
+
+if __name__ == '__main__':
+    unittest.main()
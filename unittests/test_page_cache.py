@@ -0,0 +1,213 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from src import download_with_media
+from src.page_cache import (PageCache, ReplayMiss, normalize_url, freshness_lifetime, configure_page_cache,
+                            shared_page_cache, http_get)
+from src.media_fetcher import MediaFetcher, DEFAULT_TIMEOUT
+
+
+class PageServer:
+    """Local HTTP server whose pages send the cache headers named by their path."""
+
+    HEADERS = {
+        "/fresh": {"Cache-Control": "max-age=3600", "ETag": '"v1"'},
+        "/no-cache": {"Cache-Control": "no-cache", "ETag": '"v1"'},
+        "/no-store": {"Cache-Control": "no-store"},
+    }
+
+    def __init__(self):
+        server = self
+        self.requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, self.headers.get("If-None-Match")))
+                path = self.path.split("?")[0]
+                if path not in server.HEADERS:
+                    self.send_error(404)
+                    return
+                headers = server.HEADERS[path]
+                if headers.get("ETag") and self.headers.get("If-None-Match") == headers["ETag"]:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = f"<html>{path}</html>".encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestPageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.server = PageServer()
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.folder)
+
+    def url(self, path):
+        return self.server.base_url + path
+
+    def test_normalize_url(self):
+        self.assertEqual(normalize_url("HTTPS://Medium.com/@a/post-1/?source=home&b=2&utm_medium=x&a=1#top"),
+                         "https://medium.com/@a/post-1?a=1&b=2")
+
+    def test_freshness_lifetime(self):
+        self.assertEqual(freshness_lifetime({"Cache-Control": "public, max-age=300"}), 300)
+        self.assertEqual(freshness_lifetime({"Cache-Control": "no-cache"}), 0)
+        self.assertIsNone(freshness_lifetime({"Cache-Control": "private, no-store"}))
+        self.assertEqual(freshness_lifetime({"Date": "Mon, 01 Jan 2024 00:00:00 GMT",
+                                             "Expires": "Mon, 01 Jan 2024 00:10:00 GMT"}), 600)
+        self.assertEqual(freshness_lifetime({}, default_ttl=42), 42)
+
+    def test_fresh_response_is_served_from_disk(self):
+        first = PageCache(self.folder, reuse_window=0).get(self.url("/fresh"))
+        second = PageCache(self.folder, reuse_window=0).get(self.url("/fresh?source=feed"))
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertFalse(first.from_cache)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(second.text, "<html>/fresh</html>")
+        self.assertEqual(second.headers["etag"], '"v1"')
+
+    def test_stale_response_is_revalidated(self):
+        cache = PageCache(self.folder, reuse_window=0)
+        cache.get(self.url("/no-cache"))
+        response = cache.get(self.url("/no-cache"))
+
+        self.assertEqual(self.server.requests, [("/no-cache", None), ("/no-cache", '"v1"')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, "<html>/no-cache</html>")
+
+    def test_callers_validators_are_answered_from_the_cache(self):
+        cache = PageCache(self.folder)
+        cache.get(self.url("/fresh"))
+
+        self.assertEqual(cache.get(self.url("/fresh"), {"If-None-Match": '"v1"'}).status_code, 304)
+        self.assertEqual(cache.get(self.url("/fresh"), {"If-None-Match": '"v0"'}).status_code, 200)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_callers_validators_reach_the_server_without_a_cached_response(self):
+        response = PageCache(self.folder).get(self.url("/fresh"), {"If-None-Match": '"v1"'})
+
+        self.assertEqual(self.server.requests, [("/fresh", '"v1"')])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.from_cache)
+
+    def test_reuse_window_covers_uncacheable_responses(self):
+        cache = PageCache(self.folder)
+        cache.get(self.url("/no-store"))
+        cache.get(self.url("/no-store"))
+        PageCache(self.folder).get(self.url("/no-store"))
+
+        # Reused within the process, never written to disk
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_recent_responses_are_capped_by_bytes(self):
+        # Each body is 22 bytes, so only the last one stays in memory
+        cache = PageCache(self.folder, recent_max_bytes=30)
+        for path in ("/no-store", "/no-store?page=2", "/no-store?page=2", "/no-store"):
+            cache.get(self.url(path))
+
+        self.assertEqual([path for path, _ in self.server.requests], ["/no-store", "/no-store?page=2", "/no-store"])
+
+    def test_eviction_walks_the_cache_only_when_it_is_full(self):
+        cache = PageCache(self.folder, max_bytes=1000, reuse_window=0)
+        with patch.object(cache, "_entries", wraps=cache._entries) as entries:
+            for page in range(1, 6):
+                cache.get(self.url(f"/fresh?page={page}"))
+
+        # Once to count the cache, once when it went past max_bytes
+        self.assertEqual(entries.call_count, 2)
+        self.assertLessEqual(cache.size(), 1000)
+
+    def test_errors_are_not_cached(self):
+        cache = PageCache(self.folder, reuse_window=0)
+        self.assertEqual(cache.get(self.url("/missing")).status_code, 404)
+        self.assertEqual(cache.get(self.url("/missing")).status_code, 404)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_record_then_replay_offline(self):
+        recorder = PageCache(self.folder, mode="record")
+        recorder.get(self.url("/no-store"))
+        recorder.get(self.url("/missing"))
+        recorder.record_rendered(self.url("/rendered"), "<html>rendered</html>")
+        self.server.close()
+
+        player = PageCache(self.folder, mode="replay")
+        self.assertEqual(player.get(self.url("/no-store")).text, "<html>/no-store</html>")
+        with self.assertRaises(requests.HTTPError):
+            player.get(self.url("/missing")).raise_for_status()
+        self.assertEqual(player.rendered(self.url("/rendered")), "<html>rendered</html>")
+        with self.assertRaises(ReplayMiss):
+            player.get(self.url("/fresh"))
+        self.server = PageServer()  # for tearDown
+
+    def test_media_are_recorded_and_replayed_offline(self):
+        with MediaFetcher(retries=0, recorder=PageCache(self.folder, mode="record")) as fetcher:
+            fetcher.fetch(self.url("/fresh"), os.path.join(self.folder, "recorded.png"))
+        self.server.close()
+
+        with MediaFetcher(retries=0, recorder=PageCache(self.folder, mode="replay")) as fetcher:
+            replayed, missing = fetcher.fetch_all([(self.url("/fresh"), os.path.join(self.folder, "replayed.png")),
+                                                   (self.url("/no-store"), os.path.join(self.folder, "missing.png"))])
+        with open(replayed.path, 'rb') as f:
+            self.assertEqual(f.read(), b"<html>/fresh</html>")
+        self.assertIsInstance(missing.error, ReplayMiss)
+        self.server = PageServer()  # for tearDown
+
+    def test_eviction_keeps_the_cache_under_max_bytes(self):
+        cache = PageCache(self.folder, max_bytes=600, reuse_window=0)
+        cache.get(self.url("/fresh"))
+        cache.get(self.url("/fresh?page=2"))
+        cache.get(self.url("/fresh?page=3"))
+
+        self.assertLessEqual(cache.size(), 600)
+        self.assertGreater(cache.size(), 0)
+
+    def test_http_get_forwards_request_options_through_the_cache(self):
+        configure_page_cache("cache", self.folder)
+        self.addCleanup(configure_page_cache, "off")
+        with patch('src.page_cache.requests.get', wraps=requests.get) as mock_get:
+            http_get(self.url("/fresh"), headers={"Accept": "text/html"}, allow_redirects=False)
+            http_get(self.url("/fresh?page=2"), timeout=5)
+
+        self.assertEqual(mock_get.call_args_list[0].kwargs,
+                         {"headers": {"Accept": "text/html"}, "allow_redirects": False, "timeout": DEFAULT_TIMEOUT})
+        self.assertEqual(mock_get.call_args_list[1].kwargs["timeout"], 5)
+
+    def test_configuring_src_page_cache_reaches_the_pipeline(self):
+        # `src.page_cache` is the module the pipeline imports, not a copy
+        configure_page_cache("replay", self.folder)
+        self.addCleanup(configure_page_cache, "off")
+        self.assertIs(download_with_media.shared_page_cache(), shared_page_cache())
+        self.assertEqual(shared_page_cache().mode, "replay")
+
+
+if __name__ == '__main__':
+    unittest.main()
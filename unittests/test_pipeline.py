@@ -0,0 +1,165 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from src import clean_md
+from src.pipeline import Article, run_pipeline, run_pipelines
+from src.download_with_media import ArticleDocument
+from src.manifest import Manifest
+from fakes import fake_fetcher
+
+PAGE = """<html><head><title>A Test Article</title></head><body>
+<article>
+<h1>A Test Article</h1>
+<p>Subtitle of the article</p>
+<p>Share</p>
+<p>The first paragraph of the article is long enough for readability to keep it around.</p>
+<img src="https://miro.medium.com/1*abc.png">
+<p>The second paragraph of the article is also long enough for readability to keep it.</p>
+</article>
+</body></html>"""
+
+
+def fetched_document(url, *args):
+    return ArticleDocument(PAGE, url)
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.output_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_root)
+
+    @patch('src.pipeline.write_text_atomic', wraps=clean_md.write_text_atomic)
+    @patch('src.pipeline.fetch_article_document', side_effect=fetched_document)
+    def test_run_pipeline_fetches_once_and_writes_once(self, mock_fetch, mock_write):
+        output_folder = os.path.join(self.output_root, "article")
+
+        article = run_pipeline("https://medium.com/a-test-article", output_folder, "static", fetcher=fake_fetcher())
+
+        mock_fetch.assert_called_once_with("https://medium.com/a-test-article", "static", None, None)
+        mock_write.assert_called_once()
+        self.assertIsInstance(article, Article)
+        self.assertIsNone(article.html)
+        self.assertIsNone(article.document)
+        self.assertEqual(article.markdown_path, os.path.join(output_folder, "A Test Article.md"))
+        with open(article.markdown_path, 'r') as f:
+            markdown = f.read()
+        self.assertEqual(markdown, article.markdown)
+        self.assertIn("The first paragraph of the article", markdown)
+        self.assertIn(f"]({os.path.join('local', '1*abc.png')})", markdown)
+        self.assertNotIn("https://miro.medium.com", markdown)
+        self.assertEqual(sorted(os.listdir(output_folder)), ["A Test Article.md", "local"])
+
+    @patch('src.pipeline.fetch_article_document', side_effect=RuntimeError("offline"))
+    def test_failed_fetch_keeps_previous_output(self, mock_fetch):
+        output_folder = os.path.join(self.output_root, "article")
+        os.makedirs(output_folder)
+        with open(os.path.join(output_folder, "previous.md"), 'w') as f:
+            f.write("previous run")
+
+        with self.assertRaises(RuntimeError):
+            run_pipeline("https://medium.com/a-test-article", output_folder)
+
+        self.assertEqual(os.listdir(output_folder), ["previous.md"])
+
+    @patch('src.pipeline.fetch_article_document', side_effect=fetched_document)
+    def test_failed_stage_keeps_previous_output_and_no_work_folder(self, mock_fetch):
+        output_folder = os.path.join(self.output_root, "article")
+        os.makedirs(output_folder)
+        with open(os.path.join(output_folder, "previous.md"), 'w') as f:
+            f.write("previous run")
+        fetcher = MagicMock()
+        fetcher.fetch_all.side_effect = IOError("disk full")
+
+        with self.assertRaises(IOError):
+            run_pipeline("https://medium.com/a-test-article", output_folder, fetcher=fetcher)
+
+        self.assertEqual(os.listdir(self.output_root), ["article"])
+        self.assertEqual(os.listdir(output_folder), ["previous.md"])
+
+    @patch('src.pipeline.fetch_article_document', side_effect=fetched_document)
+    def test_concurrent_runs_are_isolated(self, mock_fetch):
+        folders = [os.path.join(self.output_root, name) for name in ("first", "second", "first", "second")]
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            articles = list(executor.map(lambda folder: run_pipeline("https://medium.com/a-test-article", folder,
+                                                                     fetcher=fake_fetcher()), folders))
+
+        self.assertEqual(sorted(os.listdir(self.output_root)), ["first", "second"])
+        for article in articles:
+            self.assertIsNone(article.work_folder)
+            self.assertEqual(sorted(os.listdir(article.output_folder)), ["A Test Article.md", "local"])
+            self.assertTrue(os.path.exists(article.markdown_path))
+            self.assertEqual(article.images, [os.path.join(article.output_folder, "local", "1*abc.png")])
+
+    @patch('src.pipeline.fetch_article_document')
+    @patch('src.pipeline.fetch_static_if_changed', return_value=(PAGE, '"v1"', None))
+    def test_unchanged_article_is_skipped(self, mock_conditional, mock_fetch):
+        output_folder = os.path.join(self.output_root, "article")
+        manifest = Manifest(os.path.join(self.output_root, "manifest.json"))
+
+        first = run_pipeline("https://medium.com/a-test-article", output_folder, "static",
+                             fetcher=fake_fetcher(), manifest=manifest)
+        self.assertFalse(first.skipped)
+        mock_fetch.assert_not_called()
+        self.assertEqual(manifest.get("https://medium.com/a-test-article")["output_path"], first.markdown_path)
+
+        second = run_pipeline("https://medium.com/a-test-article", output_folder, "static",
+                              fetcher=fake_fetcher(), manifest=manifest)
+        self.assertTrue(second.skipped)
+        self.assertIsNone(second.markdown)
+        mock_conditional.assert_called_with("https://medium.com/a-test-article", '"v1"', None)
+
+    @patch('src.pipeline.fetch_article_document', side_effect=fetched_document)
+    @patch('src.pipeline.fetch_static_if_changed', return_value=(None, '"v1"', None))
+    def test_not_modified_article_is_skipped(self, mock_conditional, mock_fetch):
+        output_path = os.path.join(self.output_root, "article", "A Test Article.md")
+        os.makedirs(os.path.dirname(output_path))
+        with open(output_path, 'w') as f:
+            f.write("previous run")
+        manifest = Manifest(os.path.join(self.output_root, "manifest.json"))
+        manifest.update("https://medium.com/a-test-article", etag='"v1"', output_path=output_path)
+
+        article = run_pipeline("https://medium.com/a-test-article", os.path.dirname(output_path),
+                               manifest=manifest)
+
+        self.assertTrue(article.skipped)
+        mock_conditional.assert_called_once_with("https://medium.com/a-test-article", '"v1"', None)
+        mock_fetch.assert_not_called()
+
+    @patch('src.pipeline.fetch_article_document', side_effect=fetched_document)
+    @patch('src.pipeline.fetch_static_if_changed', side_effect=requests.HTTPError("403 Client Error"))
+    def test_failing_static_check_falls_back_to_the_fetch_mode(self, mock_conditional, mock_fetch):
+        manifest = Manifest(os.path.join(self.output_root, "manifest.json"))
+
+        article = run_pipeline("https://medium.com/a-test-article", os.path.join(self.output_root, "article"),
+                               "render", fetcher=fake_fetcher(), manifest=manifest)
+
+        self.assertFalse(article.skipped)
+        self.assertTrue(os.path.exists(article.markdown_path))
+        mock_fetch.assert_called_once_with("https://medium.com/a-test-article", "render", None, None)
+        self.assertEqual(manifest.get("https://medium.com/a-test-article")["output_path"], article.markdown_path)
+
+    @patch('src.pipeline.run_pipeline')
+    def test_run_pipelines_is_lazy(self, mock_run_pipeline):
+        urls = iter(["https://medium.com/first", "https://medium.com/second"])
+
+        articles = run_pipelines(urls, self.output_root, fetch_mode="static")
+        mock_run_pipeline.assert_not_called()
+
+        next(articles)
+        mock_run_pipeline.assert_called_once_with("https://medium.com/first",
+                                                  os.path.join(self.output_root, "first"), fetch_mode="static")
+        self.assertEqual(next(urls), "https://medium.com/second")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,19 @@
 import os
+import shutil
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
-from src.url_to_local import download_image, update_image_links_in_markdown
+from src.url_to_local import download_image, update_image_links_in_markdown, url_to_local
+from src.media_fetcher import FetchResult, configure_shared_fetcher
+from fakes import FakeSession
 
 class TestUrlToLocal(unittest.TestCase):
 
+    def setUp(self):
+        # No media cache in the user's cache folder, and no network
+        configure_shared_fetcher(use_cache=False, session=FakeSession())
+        self.addCleanup(configure_shared_fetcher)
+
     @patch('requests.get')
     def test_download_image_success(self, mock_requests_get):
         url = "https://example.com/image.jpg"
@@ -55,5 +64,38 @@ class TestUrlToLocal(unittest.TestCase):
         os.remove(image2_path)
         os.removedirs(local_folder)
 
+    def test_update_image_links_in_markdown_fetches_each_image_once(self):
+        markdown_content = ("![](https://example.com/a.png)\n![](https://example.com/b.jpg)\n"
+                            "![](https://example.com/a.png)")
+        output_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
+        fetcher = MagicMock()
+        fetcher.fetch_all.side_effect = lambda jobs, on_progress=None: [
+            FetchResult(url, path, None) if url.endswith("a.png") else FetchResult(url, None, IOError("failed"))
+            for url, path in jobs]
+
+        updated_content, local_image_paths = update_image_links_in_markdown(markdown_content, output_folder, fetcher)
+
+        jobs = fetcher.fetch_all.call_args[0][0]
+        self.assertEqual([url for url, _ in jobs], ["https://example.com/a.png", "https://example.com/b.jpg"])
+        local_a = os.path.join("local", "a.png")
+        self.assertEqual(updated_content, f"![]({local_a})\n![](https://example.com/b.jpg)\n![]({local_a})")
+        self.assertEqual(local_image_paths, [os.path.join(output_folder, "local", "a.png")])
+
+    @patch('src.url_to_local.shared_fetcher')
+    def test_url_to_local_updates_every_markdown_file(self, mock_shared_fetcher):
+        output_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_folder)
+        for name, image in (("first.md", "a.png"), ("second.md", "b.jpg")):
+            with open(os.path.join(output_folder, name), 'w') as f:
+                f.write(f"![](https://example.com/{image})")
+        mock_shared_fetcher.return_value.fetch_all.side_effect = lambda jobs, on_progress=None: [
+            FetchResult(url, path, None) for url, path in jobs]
+
+        updated = url_to_local(output_folder)
+
+        self.assertEqual([os.path.basename(path) for path in updated], ["first.md", "second.md"])
+        with open(os.path.join(output_folder, "second.md"), 'r') as f:
+            self.assertEqual(f.read(), f"![]({os.path.join('local', 'b.jpg')})")
+
 if __name__ == "__main__":
     unittest.main()